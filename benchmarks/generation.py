@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+"""
+Measures how Makefile generation scales with the size of a project, using synthetic C++ source trees.
+
+Usage:
+    python3 benchmarks/generation.py [--sources 1000 10000 50000] [--depth D] [--fan-out F] [--cycles C]
+                                     [--include-dirs I] [--targets T] [--output results.json] [--compare baseline.json]
+
+Each tree contains a generated MGen script, which is run in a fresh process twice: once with an empty build directory,
+and once more reusing the scan cache from the first run. For each run, the wall time of adding targets and of writing the
+Makefile, the peak memory, the number of stat, scandir and open calls, and the size of the Makefile are recorded.
+
+Results are printed, and written as JSON if --output is provided. When --compare is provided, results are compared
+against an earlier results file, and the exit status is non-zero if any metric regressed by more than --threshold.
+"""
+import subprocess
+import argparse
+import builtins
+import resource
+import tempfile
+import random
+import shutil
+import runpy
+import json
+import time
+import sys
+import os
+
+CURDIR = os.path.abspath(os.path.dirname(__file__))
+REPO_DIR = os.path.abspath(os.path.join(CURDIR, os.pardir))
+HEADERS_PER_DIR = 64
+# Metrics that are compared between runs. Larger is worse for all of them.
+METRICS = ["add_seconds", "write_seconds", "total_seconds", "peak_rss_kb", "stat_calls", "scandir_calls", "open_calls", "makefile_bytes"]
+CONFIG_KEYS = ["sources", "headers", "depth", "fan_out", "cycles", "include_dirs", "targets"]
+
+# The MGen script for a synthetic tree. It is run with runpy, so that MGen uses the tree as its root directory.
+BUILD_SCRIPT = """import msquared as m2
+import time
+import os
+
+root = os.path.abspath(os.path.dirname(__file__))
+start = time.perf_counter()
+mgen = m2.MGen(project_include_dirs={include_dirs}, logger_severity=m2.Logger.Severity.ERROR, jobs=JOBS)
+libraries = []
+for target in range({targets} - 1):
+    sources = [os.path.join("src", f"t{{target}}", name) for name in sorted(os.listdir(os.path.join(root, "src", f"t{{target}}")))]
+    mgen.add_library(f"lib{{target}}.so", sources=sources)
+    libraries.append(f"lib{{target}}.so")
+sources = [os.path.join("src", "main", name) for name in sorted(os.listdir(os.path.join(root, "src", "main")))]
+mgen.add_executable("main", sources=sources, libraries=libraries)
+added = time.perf_counter()
+mgen.write(os.path.join(root, "Makefile"))
+written = time.perf_counter()
+"""
+
+def config_name(config) -> str:
+    return "_".join(f"{key}{config[key]}" for key in CONFIG_KEYS)
+
+def header_path(header: int) -> str:
+    return os.path.join(f"m{header // HEADERS_PER_DIR}", f"h{header}.hpp")
+
+def generate_tree(config, tree_dir: str) -> None:
+    """
+    Writes a synthetic project. Headers are arranged in depth levels, and each header includes fan_out headers from the
+    next level, so that every source transitively includes a large part of the tree. cycles headers in the last level
+    include a header in the first level, creating include cycles guarded by #pragma once.
+    """
+    marker = os.path.join(tree_dir, "config.json")
+    if os.path.exists(marker):
+        with open(marker) as marker_file:
+            if json.load(marker_file) == config:
+                return
+    shutil.rmtree(tree_dir, ignore_errors=True)
+    rand = random.Random(0)
+    levels = [[header for header in range(config["headers"]) if header % config["depth"] == level] for level in range(config["depth"])]
+    levels = [level for level in levels if level]
+
+    def write(relpath, includes, body):
+        path = os.path.join(tree_dir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write("".join(f'#include "{include}"\n' for include in includes) + body)
+
+    def pick(level):
+        return sorted(set(rand.choice(level) for _ in range(config["fan_out"])))
+
+    cycle_headers = set(rand.sample(levels[-1], min(config["cycles"], len(levels[-1])))) if len(levels) > 1 else set()
+    for index, level in enumerate(levels):
+        for header in level:
+            includes = pick(levels[index + 1]) if index + 1 < len(levels) else []
+            if header in cycle_headers:
+                includes.append(rand.choice(levels[0]))
+            write(os.path.join(f"inc{header % config['include_dirs']}", header_path(header)), [header_path(include) for include in includes],
+                  f"#pragma once\ninline int h{header}() {{ return {header}; }}\n")
+    target_dirs = [f"t{target}" for target in range(config["targets"] - 1)] + ["main"]
+    for source in range(config["sources"]):
+        includes = [header_path(header) for header in pick(levels[0])]
+        write(os.path.join("src", target_dirs[source % len(target_dirs)], f"s{source}.cpp"), includes, f"int s{source}() {{ return {source}; }}\n")
+    include_dirs = [f"inc{index}" for index in range(config["include_dirs"])]
+    with open(os.path.join(tree_dir, "build.py"), "w") as script:
+        script.write(BUILD_SCRIPT.format(include_dirs=include_dirs, targets=config["targets"]))
+    with open(marker, "w") as marker_file:
+        json.dump(config, marker_file)
+
+# Runs the MGen script of a tree in this process, counting file system calls, and prints the results as JSON.
+def run_worker(tree_dir: str, jobs: int) -> None:
+    counts = {"stat_calls": 0, "scandir_calls": 0, "open_calls": 0}
+    def counted(function, name):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+    os.stat = counted(os.stat, "stat_calls")
+    os.lstat = counted(os.lstat, "stat_calls")
+    os.scandir = counted(os.scandir, "scandir_calls")
+    builtins.open = counted(builtins.open, "open_calls")
+
+    start = time.perf_counter()
+    script_globals = runpy.run_path(os.path.join(tree_dir, "build.py"), init_globals={"JOBS": jobs})
+    end = time.perf_counter()
+    mgen = script_globals["mgen"]
+    stats = mgen.stats()
+    results = dict(counts)
+    results.update({
+        "add_seconds": script_globals["added"] - script_globals["start"],
+        "write_seconds": script_globals["written"] - script_globals["added"],
+        "total_seconds": end - start,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "makefile_bytes": stats["counters"]["output_bytes"],
+        "files_scanned": stats["counters"]["files_scanned"],
+        "phases": stats["phases"],
+    })
+    print(json.dumps(results))
+
+def run(config, tree_dir: str, mode: str, jobs: int):
+    if mode == "cold":
+        shutil.rmtree(os.path.join(tree_dir, "build"), ignore_errors=True)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR] + [path for path in [os.environ.get("PYTHONPATH")] if path]))
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--worker", tree_dir, "--jobs", str(jobs)], env=env).decode()
+    results = dict(config, mode=mode, jobs=jobs)
+    results.update(json.loads(output.splitlines()[-1]))
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def result_key(result):
+    return tuple(result[key] for key in CONFIG_KEYS + ["mode", "jobs"])
+
+# Returns descriptions of every metric that is worse than the baseline by more than the threshold.
+def compare(results, baseline, threshold: float):
+    regressions = []
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    print(f"\nCompared to {baseline.get('commit') or 'baseline'}:")
+    for result in results:
+        base = baseline_results.get(result_key(result))
+        if not base:
+            continue
+        ratios = []
+        for metric in METRICS:
+            ratio = result[metric] / base[metric] if base[metric] else 1.0
+            ratios.append(f"{metric}={ratio:.2f}x")
+            if ratio > threshold:
+                regressions.append(f"{config_name(result)} ({result['mode']}): {metric} went from {base[metric]} to {result[metric]}")
+        print(f"\t{result['sources']:>7} sources ({result['mode']}): {' '.join(ratios)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks Makefile generation on synthetic projects.")
+    parser.add_argument("--sources", type=int, nargs="+", default=[1000], help="Numbers of source files. Each one is benchmarked separately.")
+    parser.add_argument("--headers", type=int, default=0, help="Number of headers. Defaults to half the number of sources.")
+    parser.add_argument("--depth", type=int, default=4, help="Number of levels of headers.")
+    parser.add_argument("--fan-out", type=int, default=3, help="Number of headers included by each source, and by each header from the next level.")
+    parser.add_argument("--cycles", type=int, default=8, help="Number of headers that include a header from the first level.")
+    parser.add_argument("--include-dirs", type=int, default=2, help="Number of project include directories to spread headers across.")
+    parser.add_argument("--targets", type=int, default=4, help="Number of targets. All but one are libraries, which the executable links.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of threads MGen scans with.")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "msquared_benchmarks"), help="Where synthetic trees are kept. Trees are reused when their parameters match.")
+    parser.add_argument("--output", default="", help="Path to write JSON results to.")
+    parser.add_argument("--compare", default="", help="Path of an earlier JSON results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Ratio to the baseline above which a metric is a regression.")
+    parser.add_argument("--worker", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.jobs)
+        return 0
+
+    results = []
+    print(f"{'sources':>8}{'headers':>9}{'mode':>6}{'add (s)':>10}{'write (s)':>11}{'peak (MB)':>11}{'stat':>9}{'scandir':>9}{'open':>9}{'Makefile (KB)':>15}")
+    for sources in args.sources:
+        config = {"sources": sources, "headers": args.headers if args.headers else max(sources // 2, args.depth), "depth": args.depth,
+                  "fan_out": args.fan_out, "cycles": args.cycles, "include_dirs": args.include_dirs, "targets": args.targets}
+        tree_dir = os.path.join(args.work_dir, config_name(config))
+        generate_tree(config, tree_dir)
+        for mode in ["cold", "warm"]:
+            result = run(config, tree_dir, mode, args.jobs)
+            results.append(result)
+            print(f"{sources:>8}{config['headers']:>9}{mode:>6}{result['add_seconds']:>10.3f}{result['write_seconds']:>11.3f}{result['peak_rss_kb'] / 1024:>11.1f}"
+                  f"{result['stat_calls']:>9}{result['scandir_calls']:>9}{result['open_calls']:>9}{result['makefile_bytes'] / 1024:>15.1f}")
+
+    report = {"commit": git_commit(), "python": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=4, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
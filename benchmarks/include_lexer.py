@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""
+Compares the speed and accuracy of msquared.IncludeLexer against the regular expression it replaced.
+
+Usage:
+    python3 benchmarks/include_lexer.py [--iterations N] [extra source directories...]
+
+Accuracy is measured on the fixture corpus in test/fixtures/includes. Speed is measured on the corpus,
+plus any C/C++ files found in the extra directories.
+"""
+from msquared.IncludeLexer import IncludeLexer
+import argparse
+import json
+import time
+import re
+import os
+
+CURDIR = os.path.abspath(os.path.dirname(__file__))
+CORPUS_DIR = os.path.join(CURDIR, os.pardir, "test", "fixtures", "includes")
+SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx", ".h", ".hh", ".hpp", ".hxx", ".inl")
+
+# The original HeaderManager.find_included_files implementation.
+def legacy_regex(filename):
+    with open(filename, 'r', errors="replace") as file:
+        return set(re.findall(r'(?:(?<!\/\/\s))#include [<"]([^>"]*)[>"]', file.read()))
+
+def find_sources(dirs):
+    sources = []
+    for dir in dirs:
+        for root, _, files in os.walk(dir):
+            sources.extend(os.path.join(root, name) for name in files if name.endswith(SOURCE_EXTENSIONS))
+    return sorted(sources)
+
+def measure_accuracy(scan, mode):
+    with open(os.path.join(CORPUS_DIR, "expected.json")) as expected_file:
+        expected = json.load(expected_file)
+    false_positives = 0
+    false_negatives = 0
+    for name, includes in sorted(expected.items()):
+        found = scan(os.path.join(CORPUS_DIR, name))
+        false_positives += len(found - set(includes[mode]))
+        false_negatives += len(set(includes[mode]) - found)
+    return false_positives, false_negatives
+
+def measure_speed(scan, sources, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for source in sources:
+            scan(source)
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks include scanning.")
+    parser.add_argument("dirs", nargs="*", help="Additional directories containing C/C++ sources to time.")
+    parser.add_argument("--iterations", type=int, default=20, help="Number of times to scan every file.")
+    args = parser.parse_args()
+
+    sources = find_sources([CORPUS_DIR] + args.dirs)
+    scanners = {
+        "regex": (legacy_regex, "full"),
+        "lexer": (lambda filename: IncludeLexer().scan_file(filename)[0], "full"),
+        "lexer-preamble": (lambda filename: IncludeLexer(stop_after_preamble=True).scan_file(filename)[0], "preamble"),
+    }
+    print(f"Scanning {len(sources)} files, {args.iterations} iterations")
+    print(f"{'scanner':<16}{'seconds/pass':>14}{'false +':>10}{'false -':>10}")
+    for name, (scan, mode) in scanners.items():
+        false_positives, false_negatives = measure_accuracy(scan, mode)
+        seconds = measure_speed(scan, sources, args.iterations)
+        print(f"{name:<16}{seconds:>14.5f}{false_positives:>10}{false_negatives:>10}")
+
+if __name__ == '__main__':
+    main()
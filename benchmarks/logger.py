@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+"""
+Measures the cost of disabled debug logging, and of raising errors through msquared.Logger.
+
+Usage:
+    python3 benchmarks/logger.py [--iterations N]
+
+Disabled debug calls are timed on their own, and inside PathResolver.locate_paths and HeaderManager.locate_headers,
+where they are compared against a logger whose debug method does nothing at all.
+"""
+from msquared.HeaderManager import HeaderManager
+from msquared.PathResolver import PathResolver
+from msquared.Logger import Logger
+import argparse
+import inspect
+import time
+import os
+
+CURDIR = os.path.abspath(os.path.dirname(__file__))
+TEST_DIR = os.path.join(CURDIR, os.pardir, "test")
+INCLUDE_DIRS = set([os.path.join(TEST_DIR, "include")])
+SOURCES = [os.path.join(TEST_DIR, "src", "factorial.cpp"), os.path.join(TEST_DIR, "src", "fibonacci.cpp"), os.path.join(TEST_DIR, "test", "test.cpp")]
+
+# The original Logger._message_prefix implementation.
+def legacy_message_prefix(stack_level=2):
+    frame = inspect.stack()[stack_level][0]
+    return f"[{frame.f_code.co_filename}:{frame.f_lineno}]"
+
+# The lower bound for any logger: debug calls that do nothing.
+class NullLogger(Logger):
+    def debug(self, message, *args):
+        pass
+
+def measure(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks msquared.Logger.")
+    parser.add_argument("--iterations", type=int, default=100000, help="Number of times to run each case.")
+    args = parser.parse_args()
+
+    logger = Logger(Logger.Severity.INFO)
+    null_logger = NullLogger(Logger.Severity.INFO)
+    headers = set(f"/path/to/project/include/header{index}.hpp" for index in range(200))
+    cases = {
+        "debug (no-op)": lambda: null_logger.debug("Using headers: %s", headers),
+        "debug (f-string)": lambda: logger.debug(f"Using headers: {headers}"),
+        "debug (lazy args)": lambda: logger.debug("Using headers: %s", headers),
+        "debug (callable)": lambda: logger.debug(lambda: f"Using headers: {headers}"),
+        "prefix (inspect)": lambda: legacy_message_prefix(1),
+        "prefix (_getframe)": lambda: logger._message_prefix(1),
+    }
+    print(f"{'case':<24}{'us/call':>10}")
+    for name, case in cases.items():
+        print(f"{name:<24}{measure(case, args.iterations) * 1e6:>10.3f}")
+
+    # Warm caches, so that only lookups and logging calls are timed.
+    iterations = max(args.iterations // 100, 1)
+    print(f"\n{'case':<24}{'logger':>10}{'no-op':>10}{'overhead':>10}")
+    for name in ["locate_paths", "locate_headers"]:
+        seconds = []
+        for case_logger in [logger, null_logger]:
+            resolver = PathResolver(case_logger)
+            manager = HeaderManager(INCLUDE_DIRS, case_logger, resolver=resolver)
+            includes = set(["utils.hpp", "factorial.hpp", "fibonacci.hpp"])
+            if name == "locate_paths":
+                case = lambda: resolver.locate_paths(includes, INCLUDE_DIRS)
+            else:
+                case = lambda: [manager.locate_headers(source) for source in SOURCES]
+            case()
+            seconds.append(measure(case, iterations))
+        print(f"{name:<24}{seconds[0] * 1e6:>10.2f}{seconds[1] * 1e6:>10.2f}{(seconds[0] / seconds[1] - 1) * 100:>9.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+from typing import Dict, List, Tuple
+import subprocess
+import argparse
+import fcntl
+import json
+import time
+import sys
+import os
+
+# NOTE: Build rules run this file directly, so it must only depend on the standard library.
+
+# Runs build commands and records how long they took, so that slow steps can be found after a build.
+# Each record is a line of JSON appended to a log file, which can be shared by concurrent build steps.
+class BuildTimer(object):
+    def __init__(self, log_path: str):
+        """
+        Records and reports build step timings.
+
+        Args:
+            log_path (str): The path of the log file. Its directory is created if it does not exist.
+        """
+        self.log_path = log_path
+
+    def run(self, command: List[str], output: str, kind: str, inputs: List[str]=[]) -> int:
+        """
+        Runs a build command, then records its start and end times, and the size of its output.
+
+        Args:
+            command (List[str]): The command to run.
+            output (str): The file produced by the command.
+            kind (str): The kind of build step, e.g. compile or link.
+
+        Optional Args:
+            inputs (List[str]): Outputs of other build steps that this step waited for. These are used to find the critical path.
+
+        Returns:
+            int: The exit code of the command.
+        """
+        start = time.time()
+        # File descriptors are kept open, since make's jobserver may use them.
+        status = subprocess.call(command, close_fds=False)
+        self.record(output, kind, start, time.time(), status, inputs)
+        return status
+
+    # Appends a record for a build step that has finished.
+    def record(self, output: str, kind: str, start: float, end: float, status: int, inputs: List[str]=[]) -> None:
+        size = os.path.getsize(output) if os.path.isfile(output) else 0
+        record = {"output": output, "kind": kind, "start": start, "end": end, "duration": end - start, "size": size, "status": status, "inputs": inputs}
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        with open(self.log_path, "a") as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            log.write(json.dumps(record, sort_keys=True) + "\n")
+
+    # Loads the most recent record for each output.
+    def records(self) -> Dict[str, Dict]:
+        records = {}
+        if not os.path.isfile(self.log_path):
+            return records
+        with open(self.log_path, "r") as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record["output"]] = record
+        return records
+
+    # The time during which at least one build step was running. Overlapping steps are only counted once,
+    # so this is the wall time of the build even if the log contains steps from several builds.
+    @staticmethod
+    def wall_time(records: List[Dict]) -> float:
+        total = 0.0
+        current_start, current_end = None, None
+        for record in sorted(records, key=lambda record: record["start"]):
+            if current_end is None or record["start"] > current_end:
+                if current_end is not None:
+                    total += current_end - current_start
+                current_start, current_end = record["start"], record["end"]
+            else:
+                current_end = max(current_end, record["end"])
+        if current_end is not None:
+            total += current_end - current_start
+        return total
+
+    # Finds the chain of dependent build steps with the longest total duration.
+    @staticmethod
+    def critical_path(records: Dict[str, Dict]) -> Tuple[float, List[Dict]]:
+        lengths: Dict[str, Tuple[float, str]] = {}
+        def length(output):
+            # Records are visited in order of end time, so inputs are always computed first.
+            return lengths[output][0] if output in lengths else 0.0
+        for record in sorted(records.values(), key=lambda record: record["end"]):
+            inputs = [inp for inp in record["inputs"] if inp in records]
+            slowest = max(inputs, key=length, default=None)
+            lengths[record["output"]] = (record["duration"] + (length(slowest) if slowest else 0.0), slowest)
+        if not lengths:
+            return 0.0, []
+        output = max(lengths, key=lambda output: lengths[output][0])
+        total = lengths[output][0]
+        path = []
+        while output:
+            path.append(records[output])
+            output = lengths[output][1]
+        return total, list(reversed(path))
+
+    # Converts records into Chrome trace events. Each step is placed on the first lane that is free, so lanes show the parallel schedule.
+    @staticmethod
+    def trace_events(records: List[Dict]) -> List[Dict]:
+        events = []
+        lanes: List[float] = []
+        origin = min([record["start"] for record in records], default=0.0)
+        for record in sorted(records, key=lambda record: record["start"]):
+            lane = next((index for index, end in enumerate(lanes) if end <= record["start"]), len(lanes))
+            if lane == len(lanes):
+                lanes.append(0.0)
+            lanes[lane] = record["end"]
+            events.append({"name": os.path.basename(record["output"]), "cat": record["kind"], "ph": "X", "pid": 1, "tid": lane,
+                           "ts": int((record["start"] - origin) * 1e6), "dur": int(record["duration"] * 1e6),
+                           "args": {"output": record["output"], "size": record["size"], "status": record["status"]}})
+        return events
+
+    def report(self, trace_path: str="", count: int=10) -> str:
+        """
+        Summarizes the most recent build of each output.
+
+        Optional Args:
+            trace_path (str): If provided, a Chrome trace-event file is written to this path. It can be viewed in chrome://tracing or Perfetto.
+            count (int): The number of slowest steps to list.
+
+        Returns:
+            str: The report.
+        """
+        records = self.records()
+        if not records:
+            return f"No build steps recorded in {self.log_path}."
+        kinds: Dict[str, int] = {}
+        for record in records.values():
+            kinds[record["kind"]] = kinds.get(record["kind"], 0) + 1
+        cpu_time = sum(record["duration"] for record in records.values())
+        wall_time = BuildTimer.wall_time(list(records.values()))
+        lines = [f"Build report: {len(records)} steps ({', '.join(f'{kind}: {num}' for kind, num in sorted(kinds.items()))})"]
+        lines.append(f"\tCPU time: {cpu_time:.2f}s")
+        lines.append(f"\tWall time: {wall_time:.2f}s")
+        lines.append(f"\tParallelism: {cpu_time / wall_time if wall_time else 0.0:.2f}x")
+        lines.append(f"Slowest steps:")
+        for record in sorted(records.values(), key=lambda record: (-record["duration"], record["output"]))[:count]:
+            lines.append(f"\t{record['duration']:8.2f}s  {record['kind']:<8} {record['output']} ({record['size']} bytes)")
+        total, path = BuildTimer.critical_path(records)
+        lines.append(f"Critical path: {total:.2f}s")
+        for record in path:
+            lines.append(f"\t{record['duration']:8.2f}s  {record['kind']:<8} {record['output']}")
+        if trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            with open(trace_path, "w") as trace:
+                json.dump({"traceEvents": BuildTimer.trace_events(list(records.values())), "displayTimeUnit": "ms"}, trace)
+            lines.append(f"Chrome trace written to: {trace_path}")
+        return "\n".join(lines)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Times build steps, and reports on them.")
+    # Subcommands are checked manually, since add_subparsers only accepts required from Python 3.7.
+    subparsers = parser.add_subparsers(dest="action")
+    run_parser = subparsers.add_parser("run", help="Runs and times a build command.")
+    run_parser.add_argument("--log", required=True, help="The log file to append a record to.")
+    run_parser.add_argument("--output", required=True, help="The file produced by the command.")
+    run_parser.add_argument("--kind", default="compile", help="The kind of build step.")
+    run_parser.add_argument("--inputs", nargs="*", default=[], help="Outputs of other build steps that this step depends on.")
+    run_parser.add_argument("command", nargs=argparse.REMAINDER, help="The command, after a '--'.")
+    report_parser = subparsers.add_parser("report", help="Summarizes recorded build steps.")
+    report_parser.add_argument("--log", required=True, help="The log file to read.")
+    report_parser.add_argument("--trace", default="", help="The path to write a Chrome trace-event file to.")
+    report_parser.add_argument("--count", type=int, default=10, help="The number of slowest steps to list.")
+    args = parser.parse_args(argv)
+    if not args.action:
+        parser.error("An action is required: run or report.")
+
+    timer = BuildTimer(args.log)
+    if args.action == "report":
+        print(timer.report(args.trace, args.count))
+        return 0
+    command = args.command[1:] if args.command and args.command[0] == "--" else args.command
+    if not command:
+        parser.error("No command provided.")
+    return timer.run(command, args.output, args.kind, args.inputs)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,91 @@
+import copy
+
+__all__ = ["BaseCompiler", "GCC", "CLANG"]
+
+# A toolchain profile. Profiles describe the flags a compiler understands, along with options like which linker to use.
+# Custom profiles can be created with the constructor, or by changing options of an existing profile with configure().
 class BaseCompiler(object):
-    def __init__(self, name, compile_only, shared, debug, default_flags=set()):
+    def __init__(self, name, compile_only, shared, debug, default_flags=set(), depfile="", depfile_phony="", precompiled_header="", force_include="", precompiled_header_ext=".gch", launcher="", lto="", lto_modes={}, lto_mode="", lto_partition="", linker_flag="", linkers=[], linker="", split_debug_flag="", gdb_index_flag="", split_debug=False):
+        """
+        Describes how to invoke a compiler.
+
+        Args:
+            name (str): The compiler executable.
+            compile_only (str): The flag that compiles without linking.
+            shared (str): The flag(s) that create a shared library.
+            debug (str): The flag that adds debug information.
+
+        Optional Args:
+            default_flags (Set[str]): Flags used when none are specified.
+            depfile (str): The flag(s) that make the compiler write a Makefile-style list of header dependencies, followed by the path of that file. Empty if the compiler cannot do this.
+            depfile_phony (str): The flag that adds an empty rule for each header to the dependency file, so that deleted headers do not break make.
+            precompiled_header (str): The flag(s) that compile a header into a precompiled header. Empty if the compiler cannot do this.
+            force_include (str): The flag that includes a header before the first line of a source file. If a precompiled header with the same name exists, the compiler uses that instead.
+            precompiled_header_ext (str): The extension the compiler expects precompiled headers to have.
+            launcher (str): A command that compiles are run through, like ccache.
+            lto (str): The flag that enables link time optimization. Empty if the compiler cannot do this.
+            lto_modes (Dict[str, str]): Maps parallel link time optimization modes to the flags that replace the lto flag when linking. Only the "jobserver" mode uses make's jobserver.
+            lto_mode (str): The mode to use by default. Empty to link with the lto flag unchanged, which works with every version of the compiler.
+            lto_partition (str): The flag that selects how link time optimization is partitioned, without its value. Empty if the compiler cannot do this.
+            linker_flag (str): The flag that selects a linker, without its value. Empty if the compiler cannot do this.
+            linkers (List[str]): Faster alternatives to the default linker, e.g. mold, lld and gold, in order of preference.
+            linker (str): The linker to select with linker_flag. Empty to use the compiler's default linker, or "auto" to use the first of linkers that works, which MGen probes for.
+            split_debug_flag (str): The flag that writes debug information for each object to a separate file, so that it is not copied by the linker.
+            gdb_index_flag (str): The linker flag that adds an index of debug information, which speeds up loading it in gdb. Only one of linkers can write this.
+            split_debug (bool): Whether to use split_debug_flag and gdb_index_flag in variants with debug information.
+        """
         self.name = name
         self.compile_only = compile_only
         self.shared = shared
         self.debug = debug
         self.default_flags = default_flags
+        self.depfile = depfile
+        self.depfile_phony = depfile_phony
+        self.precompiled_header = precompiled_header
+        self.force_include = force_include
+        self.precompiled_header_ext = precompiled_header_ext
+        self.launcher = launcher
+        self.lto = lto
+        self.lto_modes = lto_modes
+        self.lto_mode = lto_mode
+        self.lto_partition = lto_partition
+        self.linker_flag = linker_flag
+        self.linkers = linkers
+        self.linker = linker
+        self.split_debug_flag = split_debug_flag
+        self.gdb_index_flag = gdb_index_flag
+        self.split_debug = split_debug
+
+    def configure(self, **options) -> "BaseCompiler":
+        """
+        Creates a copy of this profile with some options changed, e.g. GCC.configure(linker="auto", split_debug=True).
+
+        Args:
+            options: Any of the arguments of BaseCompiler.
+
+        Returns:
+            BaseCompiler: The new profile.
+        """
+        profile = copy.copy(self)
+        for option, value in options.items():
+            if not hasattr(profile, option):
+                raise ValueError(f"Unknown toolchain option: {option}")
+            setattr(profile, option, value)
+        return profile
+
+    # Flags that variants with debug information add when compiling.
+    def debug_cflags(self):
+        return set([self.debug] + ([self.split_debug_flag] if self.split_debug and self.split_debug_flag else []))
+
+    # Flags that variants with debug information add when linking.
+    # The default linker cannot write a gdb index, so it is only added when one of the faster linkers is selected.
+    def debug_lflags(self):
+        return set([self.debug] + ([self.gdb_index_flag] if self.split_debug and self.gdb_index_flag and self.linker in self.linkers else []))
+
+    # Flags that select the linker, if a specific one was selected.
+    def linker_flags(self):
+        return set([f"{self.linker_flag}{self.linker}"]) if self.linker_flag and self.linker and self.linker != "auto" else set()
 
-GCC = BaseCompiler("g++", "-c", "-shared -fPIC", "-g", default_flags=set(["--std=c++17", "-O3", "-flto", "-march=native"]))
+GCC = BaseCompiler("g++", "-c", "-shared -fPIC", "-g", default_flags=set(["--std=c++17", "-O3", "-flto", "-march=native"]), depfile="-MMD -MF", depfile_phony="-MP", precompiled_header="-x c++-header", force_include="-include", lto="-flto", lto_modes={"jobserver": "-flto=jobserver", "auto": "-flto=auto"}, lto_partition="-flto-partition=", linker_flag="-fuse-ld=", linkers=["mold", "lld", "gold"], split_debug_flag="-gsplit-dwarf", gdb_index_flag="-Wl,--gdb-index")
+# Clang looks for precompiled headers with a .pch extension. ThinLTO is parallelized by the linker rather than make.
+CLANG = BaseCompiler("clang++", "-c", "-shared -fPIC", "-g", default_flags=set(["--std=c++17", "-O3", "-flto", "-march=native"]), depfile="-MMD -MF", depfile_phony="-MP", precompiled_header="-x c++-header", force_include="-include", precompiled_header_ext=".pch", lto="-flto", lto_modes={"thin": "-flto=thin"}, linker_flag="-fuse-ld=", linkers=["mold", "lld", "gold"], split_debug_flag="-gsplit-dwarf", gdb_index_flag="-Wl,--gdb-index")
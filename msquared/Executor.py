@@ -0,0 +1,204 @@
+from msquared.Logger import Logger
+from msquared.BuildTimer import BuildTimer
+from msquared import utils
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Set
+import subprocess
+import heapq
+import time
+import os
+
+# A single step of a build, i.e. the commands that produce one output from its inputs.
+# If depfile is provided and exists, the dependencies listed in it are also treated as inputs.
+class BuildStep(object):
+    def __init__(self, output: str, inputs=set(), commands=[], kind="", depfile=""):
+        self.output = output
+        self.inputs = utils.convert_to_set(inputs)
+        self.commands = utils.convert_to_list(commands)
+        self.kind = kind
+        self.depfile = depfile
+
+    def __repr__(self):
+        return f"BuildStep({self.output}, kind={self.kind})"
+
+# Runs build steps in parallel, without make. Steps whose outputs are up to date are skipped.
+# Whenever a worker is free, the ready step with the longest remaining path to the end of the build is started,
+# so that long chains of steps, like a slow compile followed by several links, start as early as possible.
+# Links are usually memory intensive, so they are limited separately from other steps.
+class Executor(object):
+    def __init__(self, steps: List[BuildStep], jobs=1, link_jobs=1, logger=Logger(), timing_log="", record=True):
+        """
+        Schedules and runs build steps.
+
+        Args:
+            steps (List[BuildStep]): Every step that may be needed by the build. Inputs that are not produced by a step must already exist.
+
+        Optional Args:
+            jobs (int): The maximum number of steps to run at once.
+            link_jobs (int): The maximum number of link steps to run at once.
+            logger (Logger): The logger to use.
+            timing_log (str): The path of a timing log written by BuildTimer. Recorded durations are used to prioritize steps.
+            record (bool): Whether to append the duration of each step that runs to the timing log. This should be False if the commands already record themselves.
+        """
+        self.steps: Dict[str, BuildStep] = {step.output: step for step in steps}
+        self.jobs = max(jobs, 1)
+        self.link_jobs = max(link_jobs, 1)
+        self.logger = logger
+        self.timer = BuildTimer(timing_log) if timing_log else None
+        self.record = record
+        # Maps outputs to the outputs of steps that use them.
+        self.dependents: Dict[str, Set[str]] = {output: set() for output in self.steps}
+        for step in self.steps.values():
+            for input in step.inputs:
+                if input in self.steps:
+                    self.dependents[input].add(step.output)
+
+    # Returns the steps needed to build the requested outputs, in an order where every step follows its inputs.
+    def _plan(self, outputs: List[str]) -> List[str]:
+        order = []
+        # Maps outputs to whether they are still being visited, which means a cycle was found if they are reached again.
+        visiting: Dict[str, bool] = {}
+        for output in outputs:
+            if output not in self.steps:
+                self.logger.error(f"No step produces {output}", ValueError)
+            stack = [(output, iter(sorted(self.steps[output].inputs)))]
+            visiting[output] = True
+            while stack:
+                current, inputs = stack[-1]
+                input = next(inputs, None)
+                if input is None:
+                    stack.pop()
+                    visiting[current] = False
+                    order.append(current)
+                elif input in self.steps:
+                    if visiting.get(input):
+                        self.logger.error(f"Dependency cycle: {' -> '.join([entry[0] for entry in stack] + [input])}", RuntimeError)
+                    if input not in visiting:
+                        visiting[input] = True
+                        stack.append((input, iter(sorted(self.steps[input].inputs))))
+                elif not os.path.exists(input):
+                    self.logger.error(f"{input}, needed by {current}, does not exist and no step produces it", FileNotFoundError)
+        return order
+
+    # The expected duration of each step: the duration recorded the last time it ran, or else the average for steps of the same kind.
+    def _weights(self, order: List[str]) -> Dict[str, float]:
+        records = self.timer.records() if self.timer else {}
+        kind_durations: Dict[str, List[float]] = {}
+        for record in records.values():
+            kind_durations.setdefault(record.get("kind", ""), []).append(record["duration"])
+        weights = {}
+        for output in order:
+            if output in records:
+                weights[output] = records[output]["duration"]
+            else:
+                durations = kind_durations.get(self.steps[output].kind)
+                weights[output] = sum(durations) / len(durations) if durations else 1.0
+        return weights
+
+    # The priority of a step is the expected duration of the longest path from its start to the end of the build.
+    def priorities(self, outputs: List[str]) -> Dict[str, float]:
+        """
+        Computes the priority of every step needed to build outputs.
+
+        Args:
+            outputs (List[str]): The outputs to build.
+
+        Returns:
+            Dict[str, float]: Maps each needed output to the expected duration, in seconds, of the longest path from the start of its step to the end of the build.
+        """
+        order = self._plan(outputs)
+        weights = self._weights(order)
+        needed = set(order)
+        priorities = {}
+        for output in reversed(order):
+            dependents = [priorities[dependent] for dependent in self.dependents[output] if dependent in needed]
+            priorities[output] = weights[output] + max(dependents, default=0.0)
+        return priorities
+
+    # Whether a step needs to run: its output is missing, older than any of its inputs, or one of its inputs was just rebuilt.
+    def _out_of_date(self, step: BuildStep, rebuilt: Set[str]) -> bool:
+        if not os.path.exists(step.output):
+            return True
+        inputs = set(step.inputs)
+        if step.depfile:
+            inputs |= utils.read_depfile(step.depfile) or set()
+        if inputs & rebuilt:
+            return True
+        output_time = os.path.getmtime(step.output)
+        for input in inputs:
+            # Headers that were deleted since the dependency file was written are treated as changed.
+            if not os.path.exists(input) or os.path.getmtime(input) > output_time:
+                return True
+        return False
+
+    def _run_step(self, step: BuildStep) -> int:
+        start = time.time()
+        # The commands are the same ones make would run, so they are run by the same shell.
+        status = subprocess.call(" && ".join(step.commands), shell=True) if step.commands else 0
+        if self.timer and self.record:
+            self.timer.record(step.output, step.kind, start, time.time(), status, sorted(step.inputs & self.steps.keys()))
+        return status
+
+    def run(self, outputs: List[str]) -> Dict[str, List[str]]:
+        """
+        Builds outputs, and any out of date steps they depend on.
+        If a step fails, no more steps are started, but steps that are already running are allowed to finish.
+
+        Args:
+            outputs (List[str]): The outputs to build.
+
+        Returns:
+            Dict[str, List[str]]: Maps "built", "up_to_date", "failed" and "skipped" to the outputs of steps in each state.
+            Steps are skipped if they were not reached because of a failure.
+        """
+        priorities = self.priorities(outputs)
+        # The number of inputs of each needed step that have not finished yet.
+        remaining = {output: sum(1 for input in self.steps[output].inputs if input in priorities) for output in priorities}
+        ready = [(-priority, output) for output, priority in priorities.items() if not remaining[output]]
+        heapq.heapify(ready)
+        results = {"built": [], "up_to_date": [], "failed": [], "skipped": []}
+        rebuilt: Set[str] = set()
+        running = {}
+        running_links = 0
+
+        def finish(output: str) -> None:
+            for dependent in self.dependents[output]:
+                if dependent in remaining:
+                    remaining[dependent] -= 1
+                    if not remaining[dependent]:
+                        heapq.heappush(ready, (-priorities[dependent], dependent))
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while running or (ready and not results["failed"]):
+                # Start the highest priority steps that fit, postponing links while the link limit is reached.
+                postponed = []
+                while ready and not results["failed"] and len(running) < self.jobs:
+                    entry = heapq.heappop(ready)
+                    step = self.steps[entry[1]]
+                    if not self._out_of_date(step, rebuilt):
+                        self.logger.debug("%s is up to date", step.output)
+                        results["up_to_date"].append(step.output)
+                        finish(step.output)
+                    elif step.kind == "link" and running_links >= self.link_jobs:
+                        postponed.append(entry)
+                    else:
+                        running_links += step.kind == "link"
+                        running[pool.submit(self._run_step, step)] = step
+                for entry in postponed:
+                    heapq.heappush(ready, entry)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    running_links -= step.kind == "link"
+                    if future.result() != 0:
+                        self.logger.warning(f"Failed to build {step.output}")
+                        results["failed"].append(step.output)
+                    else:
+                        results["built"].append(step.output)
+                        rebuilt.add(step.output)
+                        finish(step.output)
+        finished = set(results["built"]) | set(results["up_to_date"]) | set(results["failed"])
+        results["skipped"] = sorted(output for output in priorities if output not in finished)
+        return results
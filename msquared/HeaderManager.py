@@ -1,36 +1,78 @@
-import re
-from msquared import utils
-from typing import Dict, Set
+import concurrent.futures
+from msquared.IncludeGraph import IncludeGraph
+from msquared.IncludeLexer import IncludeLexer
+from msquared.Logger import Logger
+from msquared.PathResolver import PathResolver
+from msquared.Profiler import Profiler
+from msquared.ScanCache import ScanCache
+from typing import Dict, FrozenSet, Iterable, Set, Tuple
 
 class HeaderManager(object):
-    def __init__(self, header_dirs, logger):
+    def __init__(self, header_dirs, logger, scan_cache: ScanCache=None, lexer: IncludeLexer=None, resolver: PathResolver=None, profiler: Profiler=None):
         self.header_dirs: Set[str] = header_dirs
         self.logger: Logger = logger
-        self.header_cache: Dict[str, Set[str]] = {}
+        self.resolver: PathResolver = resolver if resolver else PathResolver(logger)
+        self.lexer: IncludeLexer = lexer if lexer else IncludeLexer()
+        # The include graph of every file located so far. This can be queried for direct and transitive dependencies.
+        self.graph: IncludeGraph = IncludeGraph()
+        # Maps files to their direct headers and unresolved includes for this run.
+        self.direct_cache: Dict[str, Tuple[Set[str], Set[str]]] = {}
+        # Direct includes are persisted across runs, so files are only re-read when they change.
+        self.scan_cache: ScanCache = scan_cache if scan_cache else ScanCache("", logger, enabled=False)
+        self.profiler: Profiler = profiler if profiler else Profiler()
 
-    # Given a file, recursively locates all headers in that file.
-    def locate_headers(self, filename):
-        # First check the cache, so we don't recurse unnecessarily.
-        if filename in self.header_cache:
-            self.logger.debug(f"Found {filename} in header cache. Using headers: {self.header_cache[filename]}")
-            return self.header_cache[filename]
-        # Find the headers in this file.
-        headers = self.find_included_files(filename)
-        headers, notfound = utils.locate_paths(headers, self.header_dirs, self.logger)
-        if notfound:
-            self.logger.warning(f"For {filename}, assuming {notfound} are external headers. If this is incorrect, please set project_include_dirs correctly (currently set to {self.header_dirs}).")
-        # Next find the headers contained within those headers.
-        all_headers = set() | headers
-        for header in headers:
-            self.logger.debug(f"For {filename}, recursing through {header}")
-            all_headers |= self.locate_headers(header)
-        # Cache
-        self.logger.debug(f"Adding entry to header cache: {filename}: {all_headers}")
-        self.header_cache[filename] = all_headers
+    # Given a file, locates all headers in that file, as well as the headers in those headers, and so on.
+    def locate_headers(self, filename) -> FrozenSet[str]:
+        # First check the graph, so we don't scan unnecessarily.
+        if filename not in self.graph:
+            # Scan every file reachable from this one that has not been scanned yet.
+            pending = [filename]
+            while pending:
+                current = pending.pop()
+                if current in self.graph:
+                    continue
+                headers, notfound = self.scan_file(current)
+                if notfound:
+                    self.logger.warning(f"For {current}, assuming {notfound} are external headers. If this is incorrect, please set project_include_dirs correctly (currently set to {self.header_dirs}).")
+                self.graph.add_file(current, headers)
+                pending.extend(header for header in headers if header not in self.graph)
+        all_headers = self.graph.transitive(filename)
+        self.logger.debug("For %s, using headers: %s", filename, all_headers)
         return all_headers
 
-    # Finds all #include's in a file.
+    # Finds the headers directly included by a file, along with any includes that could not be found
+    # in the project include directories. Files that have not changed since the last scan are not re-read,
+    # but their includes are always resolved again, since headers may have been added, moved or removed.
+    def scan_file(self, filename: str) -> Tuple[Set[str], Set[str]]:
+        if filename in self.direct_cache:
+            return self.direct_cache[filename]
+        includes = self.scan_cache.lookup(filename)
+        if includes is not None:
+            self.logger.debug("Found %s in scan cache. Using includes: %s", filename, includes)
+        else:
+            with self.profiler.phase("scan.lex"):
+                includes, digest, hashed_size = self.lexer.scan_file(filename)
+            self.profiler.count("files_scanned")
+            self.profiler.count("bytes_scanned", hashed_size)
+            self.scan_cache.store(filename, digest, hashed_size, includes)
+        with self.profiler.phase("scan.resolve"):
+            headers, notfound = self.resolver.locate_paths(includes, self.header_dirs)
+        self.direct_cache[filename] = (headers, notfound)
+        return headers, notfound
+
+    # Scans a batch of files and every header they include using a pool of worker threads.
+    # Afterwards, locate_headers can build the include graph for these files without any further I/O.
+    def scan_files(self, filenames: Iterable[str], jobs: int) -> None:
+        frontier = set(filenames) - set(self.direct_cache)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            while frontier:
+                self.logger.debug("Scanning %d files with %d jobs", len(frontier), jobs)
+                results = executor.map(self.scan_file, sorted(frontier))
+                discovered = set()
+                for headers, _ in results:
+                    discovered |= headers
+                frontier = discovered - set(self.direct_cache)
+
+    # Finds all #include's in a file, ignoring those in comments, string literals and #if 0 blocks.
     def find_included_files(self, filename: str) -> Set[str]:
-        with open(filename, 'r') as file:
-            # Match includes of the form #include <.*> and #include ".*" excluding commented out lines.
-            return set(re.findall('(?:(?<!\/\/\s))#include [<"]([^>"]*)[>"]', file.read()))
+        return self.lexer.scan_file(filename)[0]
@@ -0,0 +1,104 @@
+from typing import Dict, FrozenSet, Iterable, List, Set
+
+# A directed graph of files and the project headers they include directly.
+# Transitive dependencies are computed iteratively, by collapsing strongly connected components
+# (i.e. headers that include each other), so cycles and very deep include chains are safe.
+# Closures are immutable and shared: every file in a cycle uses the same object, as do files with identical closures.
+class IncludeGraph(object):
+    def __init__(self):
+        self.edges: Dict[str, FrozenSet[str]] = {}
+        self.closures: Dict[str, FrozenSet[str]] = {}
+        self.interned: Dict[FrozenSet[str], FrozenSet[str]] = {}
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self.edges
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def files(self) -> List[str]:
+        return list(self.edges.keys())
+
+    def add_file(self, filename: str, includes: Iterable[str]) -> None:
+        """
+        Adds a file and its direct includes to the graph.
+
+        Args:
+            filename (str): The absolute path of the file.
+            includes (Iterable[str]): The absolute paths of project headers directly included by this file.
+        """
+        if filename in self.closures:
+            raise ValueError(f"{filename} is already part of a computed closure, and cannot be modified.")
+        self.edges[filename] = frozenset(includes)
+
+    def direct(self, filename: str) -> FrozenSet[str]:
+        """
+        Returns the headers directly included by a file.
+        """
+        return self.edges.get(filename, frozenset())
+
+    def transitive(self, filename: str) -> FrozenSet[str]:
+        """
+        Returns every header a file depends on, directly or indirectly. A file is only part of its
+        own dependencies if it is part of an include cycle.
+        """
+        if filename not in self.closures:
+            self._compute_closures(filename)
+        return self.closures[filename]
+
+    def _intern(self, closure: Set[str]) -> FrozenSet[str]:
+        closure = frozenset(closure)
+        return self.interned.setdefault(closure, closure)
+
+    # Tarjan's algorithm, implemented with an explicit stack. Files whose closures were computed
+    # previously are treated as finished, so each file is only visited once over the lifetime of the graph.
+    def _compute_closures(self, root: str) -> None:
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        scc_stack: List[str] = []
+        on_stack: Set[str] = set()
+        work = []
+
+        def visit(node):
+            index[node] = lowlink[node] = len(index)
+            scc_stack.append(node)
+            on_stack.add(node)
+            work.append((node, iter(self.edges.get(node, ()))))
+
+        visit(root)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child in self.closures:
+                    continue
+                if child not in index:
+                    visit(child)
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] != index[node]:
+                    continue
+                # Node is the root of a strongly connected component.
+                component = set()
+                while True:
+                    member = scc_stack.pop()
+                    on_stack.discard(member)
+                    component.add(member)
+                    if member == node:
+                        break
+                closure = set()
+                for member in component:
+                    for child in self.edges.get(member, ()):
+                        if child not in component:
+                            closure.add(child)
+                            closure |= self.closures[child]
+                if len(component) > 1 or node in self.edges.get(node, ()):
+                    closure |= component
+                closure = self._intern(closure)
+                for member in component:
+                    self.closures[member] = closure
@@ -0,0 +1,197 @@
+from typing import Iterable, List, Set, Tuple
+import hashlib
+import codecs
+import re
+
+# Matches the target of an include directive, once comments have been removed and the leading '#' stripped.
+INCLUDE_DIRECTIVE = re.compile(r'include\s*([<"])([^>"]*)[>"]')
+# Matches the start of a raw string literal, e.g. R"delim(
+RAW_STRING_START = re.compile(r'(?:u8|u|U|L)?R"([^ ()\\\t\v\f\n]{0,16})\(')
+DIRECTIVE_NAME = re.compile(r"\w*")
+# Matches anything that can start a comment or literal.
+SPECIAL = re.compile(r'//|/\*|(?:u8|u|U|L)?R"|["\']')
+
+# A line-based lexer that finds #include directives in C/C++ files.
+# Unlike a plain regular expression, it ignores includes inside comments, string literals and
+# #if 0 regions, and accepts whitespace between the '#' and the directive name.
+# Only conditions that are literally 0 or 1 are evaluated. Any other condition is treated as possibly true, so includes
+# in those regions are always reported. This may add dependencies, but never misses one.
+class IncludeLexer(object):
+    BLOCK_SIZE = 16384
+
+    def __init__(self, stop_after_preamble=False):
+        """
+        Finds includes in source files.
+
+        Optional Args:
+            stop_after_preamble (bool): Whether to stop scanning a file at the first line of code that is not a preprocessor directive. This is faster, but misses includes that appear after code.
+        """
+        self.stop_after_preamble = stop_after_preamble
+
+    # Identifies the behavior of this lexer, so cached results from a different configuration are not reused.
+    @property
+    def name(self) -> str:
+        return "lexer-v1" + ("-preamble" if self.stop_after_preamble else "")
+
+    # Removes comments from a line, leaving string and character literals intact.
+    # Returns the code and the state (None, "/*" or a raw string terminator) that carries into the next line.
+    @staticmethod
+    def _strip_comments(line: str, state) -> Tuple[str, object]:
+        if state is None and not SPECIAL.search(line):
+            return line, state
+        code = []
+        index = 0
+        length = len(line)
+        while index < length:
+            if state == "/*":
+                end = line.find("*/", index)
+                if end == -1:
+                    return "".join(code), state
+                index = end + 2
+                state = None
+                # Comments are replaced by a single space.
+                code.append(" ")
+                continue
+            if state is not None:
+                end = line.find(state, index)
+                if end == -1:
+                    return "".join(code), state
+                index = end + len(state)
+                state = None
+                continue
+            special = SPECIAL.search(line, index)
+            if not special:
+                code.append(line[index:])
+                break
+            start = special.start()
+            code.append(line[index:start])
+            token = special.group(0)
+            if token == "//":
+                break
+            if token == "/*":
+                state = "/*"
+                index = start + 2
+                continue
+            if token.endswith('R"'):
+                raw = RAW_STRING_START.match(line, start)
+                # Identifiers ending in R, like FOOR"", are not raw string prefixes.
+                if raw and (start == 0 or not (line[start - 1].isalnum() or line[start - 1] == "_")):
+                    code.append('""')
+                    state = f'){raw.group(1)}"'
+                    index = raw.end()
+                    continue
+                code.append(token[:-1])
+                start += len(token) - 1
+            # Skip to the matching quote, honoring escapes.
+            quote = line[start]
+            end = start + 1
+            while end < length and line[end] != quote:
+                end += 2 if line[end] == "\\" else 1
+            code.append(line[start:end + 1])
+            index = end + 1
+        return "".join(code), state
+
+    @staticmethod
+    def _evaluate_condition(condition: str):
+        condition = condition.strip()
+        if condition == "0":
+            return False
+        if condition == "1":
+            return True
+        return None
+
+    def scan(self, lines: Iterable[str]) -> Set[str]:
+        """
+        Finds all includes in the provided lines.
+
+        Args:
+            lines (Iterable[str]): The lines of a file, without trailing newlines. These may be consumed lazily.
+
+        Returns:
+            Set[str]: The paths of all included files, as written in the include directives.
+        """
+        includes = set()
+        state = None
+        # Each entry is [parent_active, active, taken], where taken indicates a branch known to be true was already seen.
+        conditions: List[List[bool]] = []
+        logical_line = ""
+        for line in lines:
+            line = line.rstrip("\r")
+            # Handle line continuations outside of comments.
+            if line.endswith("\\") and state != "/*":
+                logical_line += line[:-1]
+                continue
+            line = logical_line + line
+            logical_line = ""
+
+            active = conditions[-1][1] if conditions else True
+            # Fast path for lines that are not directives and cannot start a multi-line comment or string.
+            if state is None and "/*" not in line and 'R"' not in line:
+                stripped = line.lstrip()
+                if not stripped.startswith("#"):
+                    if active and self.stop_after_preamble and stripped and not stripped.startswith("//"):
+                        break
+                    continue
+
+            code, state = IncludeLexer._strip_comments(line, state)
+            code = code.strip()
+            if not code:
+                continue
+            if not code.startswith("#"):
+                if active and self.stop_after_preamble:
+                    break
+                continue
+
+            directive = code[1:].lstrip()
+            keyword = DIRECTIVE_NAME.match(directive).group(0)
+            argument = directive[len(keyword):]
+            if keyword in ("if", "ifdef", "ifndef"):
+                value = IncludeLexer._evaluate_condition(argument) if keyword == "if" else None
+                conditions.append([active, active and value is not False, value is True])
+            elif keyword == "elif" and conditions:
+                parent_active, _, taken = conditions[-1]
+                value = IncludeLexer._evaluate_condition(argument)
+                conditions[-1] = [parent_active, parent_active and not taken and value is not False, taken or value is True]
+            elif keyword == "else" and conditions:
+                parent_active, _, taken = conditions[-1]
+                conditions[-1] = [parent_active, parent_active and not taken, True]
+            elif keyword == "endif" and conditions:
+                conditions.pop()
+            elif keyword == "include" and active:
+                match = INCLUDE_DIRECTIVE.match(directive)
+                if match:
+                    includes.add(match.group(2))
+        return includes
+
+    def scan_file(self, filename: str) -> Tuple[Set[str], str, int]:
+        """
+        Finds all includes in a file, reading it one line at a time.
+
+        Args:
+            filename (str): The path of the file to scan.
+
+        Returns:
+            Tuple[Set[str], str, int]: The includes, a digest of the bytes that were read, and the number of bytes that were read.
+            The includes only depend on the bytes that were read.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        consumed = [0]
+        # Files are read in blocks so that the whole file does not need to be in memory,
+        # and so reading can stop early if the lexer does.
+        def read_lines(file):
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            remainder = ""
+            block = file.read(IncludeLexer.BLOCK_SIZE)
+            while block:
+                digest.update(block)
+                consumed[0] += len(block)
+                lines = (remainder + decoder.decode(block)).split("\n")
+                remainder = lines.pop()
+                yield from lines
+                block = file.read(IncludeLexer.BLOCK_SIZE)
+            if remainder:
+                yield remainder
+
+        with open(filename, "rb") as file:
+            includes = self.scan(read_lines(file))
+        return includes, digest.hexdigest(), consumed[0]
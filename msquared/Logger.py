@@ -1,6 +1,10 @@
-import inspect
+import logging
 import enum
+import sys
 
+# Messages may be formatted lazily, either by passing arguments for %-style formatting, as with the standard logging module,
+# or by passing a callable that returns the message. Neither is evaluated unless the message will actually be logged,
+# so debug messages that describe large sets are free when debug logging is disabled.
 class Logger(object):
     class Severity(enum.IntEnum):
         DEBUG = 10
@@ -8,43 +12,86 @@ class Logger(object):
         WARNING = 30
         ERROR = 40
 
-    def __init__(self, severity = Severity.INFO):
+    def __init__(self, severity = Severity.INFO, use_logging=False, name="msquared"):
         """
         Logs to stdout.
 
         Args:
             severity (Logger.Severity): Only messages with severities greater than or equal to this will be logged.
+
+        Optional Args:
+            use_logging (bool): Whether to send messages to the standard logging module instead of printing them. The logging module's own levels and handlers then apply as well.
+            name (str): The name of the standard logger to use.
         """
         self.severity = severity
+        self.logging_logger = logging.getLogger(name) if use_logging else None
+
+    def enabled_for(self, severity) -> bool:
+        if severity < self.severity:
+            return False
+        return self.logging_logger.isEnabledFor(severity) if self.logging_logger else True
 
+    # Frames are looked up directly, rather than through inspect.stack(), which reads source context for every frame on the stack.
     def _message_prefix(self, stack_level = 2):
-        frame = inspect.stack()[stack_level][0]
+        frame = sys._getframe(stack_level)
         filename = frame.f_code.co_filename
         line = frame.f_lineno
         return f"[{filename}:{line}]"
 
-    def log(self, message, severity, stack_level = 2):
-        if severity >= self.severity:
+    @staticmethod
+    def _format(message, args) -> str:
+        if callable(message):
+            message = message()
+        return message % args if args else message
+
+    def log(self, message, severity, stack_level = 2, args = ()):
+        if not self.enabled_for(severity):
+            return
+        message = Logger._format(message, args)
+        if self.logging_logger:
+            # The record is created here so that it has the location of the caller rather than the logger. The stacklevel
+            # argument of the standard logger would also do this, but it requires Python 3.8 and counts frames differently from 3.11.
+            # stack_level counts frames from _message_prefix, which is one frame deeper than this method.
+            frame = sys._getframe(stack_level - 1)
+            record = self.logging_logger.makeRecord(self.logging_logger.name, int(severity), frame.f_code.co_filename, frame.f_lineno, message, (), None, frame.f_code.co_name)
+            self.logging_logger.handle(record)
+        else:
             print(f"{self._message_prefix(stack_level)} {severity.name}: {message}")
 
-    def debug(self, message):
-        self.log(message, severity=Logger.Severity.DEBUG, stack_level=3)
+    def debug(self, message, *args):
+        # Checked here as well as in log, since disabled debug calls are by far the most common.
+        if self.severity > _DEBUG:
+            return
+        self.log(message, severity=Logger.Severity.DEBUG, stack_level=3, args=args)
 
-    def info(self, message):
-        self.log(message, severity=Logger.Severity.INFO, stack_level=3)
+    def info(self, message, *args):
+        self.log(message, severity=Logger.Severity.INFO, stack_level=3, args=args)
 
-    def warning(self, message, ErrorType: type=None):
-        self.log(message, severity=Logger.Severity.WARNING, stack_level=3)
+    def warning(self, message, ErrorType: type=None, *args):
+        """
+        Logs a warning level message, or raises an error if ErrorType is provided.
+
+        Args:
+            message (str): The message to log. This may also be a callable that returns the message.
+            ErrorType (type): The type of error to raise. If set to None, no error is raised.
+            *args: Arguments for %-style formatting of the message, which is only formatted if it will be logged.
+        """
+        if ErrorType:
+            raise ErrorType(f"{self._message_prefix(2)} {Logger._format(message, args)}")
+        self.log(message, severity=Logger.Severity.WARNING, stack_level=3, args=args)
 
     def error(self, message, ErrorType: type=None):
         """
         Logs an error level message, or raises an error if ErrorType is provided.
 
         Args:
-            message (str): The message to log.
+            message (str): The message to log. This may also be a callable that returns the message.
             ErrorType (type): The type of error to raise. If set to None, no error is raised.
         """
         if ErrorType:
-            raise ErrorType(f"{self._message_prefix(2)} {message}")
+            raise ErrorType(f"{self._message_prefix(2)} {Logger._format(message, ())}")
         else:
-            self.log(message, severity=Logger.Severity.ERROR, stack_level = 3)
+            self.log(message, severity=Logger.Severity.ERROR, stack_level=3)
+
+# Looking up enum members is relatively slow, so the debug check uses a plain integer.
+_DEBUG = int(Logger.Severity.DEBUG)
@@ -1,12 +1,27 @@
 from msquared import utils
 from msquared.Logger import Logger
 from msquared.Target import Target, MakefileTarget
+from msquared.Ninja import NinjaWriter
+from msquared import Ninja
 from msquared.Compilers import *
+from msquared.Variant import Variant, RELEASE, DEBUG
 from msquared.HeaderManager import HeaderManager
-from typing import Dict, List, Set
-from datetime import datetime
-import inspect
+from msquared.IncludeLexer import IncludeLexer
+from msquared.PathResolver import PathResolver
+from msquared.Profiler import Profiler
+from msquared.ScanCache import ScanCache
+from msquared.ToolchainProbe import ToolchainProbe
+from msquared import ObjectCache
+from msquared import BuildTimer
+from msquared.RebuildImpact import RebuildImpact
+from msquared.Executor import Executor, BuildStep
+from typing import Dict, FrozenSet, Iterator, List, Set, Tuple
+import itertools
+import runpy
+import hashlib
+import json
 import enum
+import sys
 import os
 import copy
 
@@ -54,77 +69,276 @@ def wrap(prefix, objs, suffix):
     return [prefix + obj + suffix for obj in objs]
 
 class MGen(object):
+    # The projects that are currently loading subproject scripts. See include_subproject.
+    _including: List["MGen"] = []
+
     """
     Internal Functions
     """
+    # The header does not include a timestamp, so that regenerating an unchanged project produces an identical Makefile.
     def _get_makefile_header() -> str:
-        return "# Automatically generated by msquared.MGen on " + str(datetime.today()) + ".\n# DO NOT MODIFY."
+        return "# Automatically generated by msquared.MGen.\n# DO NOT MODIFY."
 
     # The key difference between project_include_dirs and include_dirs is that include_dirs headers are still treated as
     # being external to the project i.e. they are not scanned recursively for dependencies.
-    def __init__(self, project_source_dirs=set(["."]), project_include_dirs=set(), build_dir="build", compiler=GCC, cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), logger_severity=Logger.Severity.INFO):
+    # Include scan results are persisted in the build directory unless scan_cache is False.
+    # When jobs is greater than 1, sources are not scanned as targets are added. Instead, all sources are
+    # scanned in a single batch with that many threads when the Makefile is generated.
+    # If scan_preamble_only is True, files are only scanned for includes up to the first line of code.
+    # If compiler_dependencies is True, headers are not scanned for targets whose compiler can write dependency files.
+    # Instead, the compiler writes them while compiling, and the Makefile includes them.
+    # If unity is True, each target's sources are combined into unity sources of up to unity_batch_size sources each,
+    # which are compiled instead. This can be overridden per target.
+    # If object_cache is set, compiles first check an object cache in that directory, which can be shared by multiple
+    # build directories and checkouts. Compilers can also be wrapped with external caches through BaseCompiler.launcher.
+    # Link time optimization is parallelized according to lto_mode (e.g. "jobserver" or "auto"), which defaults to the
+    # compiler's mode (none for GCC, since older versions do not support these modes), and partitioned according to lto_partition (e.g. "balanced" or "one").
+    # If instrument is True, the duration of every compile and link is recorded in the build directory, and can be
+    # summarized with the build-report target.
+    # If graph_analysis is True, a manifest of the include graph is written to the build directory along with the build file,
+    # and the rebuild-impact and affected targets are added to analyze it. See rebuild_impact and affected.
+    # Compiler profiles whose linker is "auto" are probed for the fastest working linker when they are first used. Probe results
+    # are persisted in the build directory unless scan_cache is False. See BaseCompiler.
+    # Targets are only generated for the selected variants. The all target builds default_variants, or every variant if that is not set.
+    # A Logger can be provided through logger, e.g. one that uses the standard logging module, in which case logger_severity is ignored.
+    # An MGen created by a script loaded through include_subproject is part of the including project. It shares the root
+    # project's logger, caches, variants and targets, and its build directory is inside the root project's build directory.
+    def __init__(self, project_source_dirs=set(["."]), project_include_dirs=set(), build_dir="build", compiler=GCC, cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), logger_severity=Logger.Severity.INFO, scan_cache=True, jobs=1, scan_preamble_only=False, compiler_dependencies=False, unity=False, unity_batch_size=8, object_cache="", object_cache_size=ObjectCache.DEFAULT_MAX_SIZE, variants=[RELEASE, DEBUG], default_variants=None, lto_mode=None, lto_partition="", instrument=False, logger=None, graph_analysis=False):
+        # The project including this one, and the project at the top of the hierarchy, which may be this one.
+        self.parent: MGen = MGen._including[-1] if MGen._including else None
+        self.root_project: MGen = self.parent.root_project if self.parent else self
         # Logging
-        self.logger: Logger = Logger(logger_severity)
+        self.logger: Logger = logger if logger else (self.root_project.logger if self.parent else Logger(logger_severity))
+        # Times each phase of generation.
+        self.profiler = self.root_project.profiler if self.parent else Profiler()
 
         # The assumption is that the caller of the init function is the MGen file for the build.
-        self.root_dir = os.path.abspath(os.path.dirname(inspect.stack()[1][0].f_code.co_filename))
+        self.script_path = os.path.abspath(sys._getframe(1).f_code.co_filename)
+        self.root_dir = os.path.dirname(self.script_path)
         self.logger.info(f"Using root directory: {self.root_dir}")
+        # Used to locate sources and headers in project directories.
+        self.path_resolver = self.root_project.path_resolver if self.parent else PathResolver(self.logger)
 
         self.project_source_dirs: Set[str] = utils.locate_paths(project_source_dirs, self.root_dir, self.logger, ErrorType=FileNotFoundError)
-        self.logger.debug(f"Using project source directories: {self.project_source_dirs}")
+        self.logger.debug("Using project source directories: %s", self.project_source_dirs)
 
         # Only a single build directory should be found, and it should not be an existing directory
         # if provided as an absolute path. This way, '/' can't accidentally be a build directory.
-        self.set_build_dir(build_dir)
+        self.scan_cache: ScanCache = None
+        self.toolchain_probe: ToolchainProbe = None
+        if self.parent:
+            # Subprojects outside the root directory are placed next to the others, rather than outside the build directory.
+            subproject_dir = os.path.relpath(self.root_dir, self.root_project.root_dir).replace(os.pardir, "__")
+            self.build_dir = os.path.normpath(os.path.join(self.root_project.build_dir, "subprojects", subproject_dir))
+            self.logger.debug("Using subproject build directory: %s", self.build_dir)
+            self.scan_cache = self.root_project.scan_cache
+            self.toolchain_probe = self.root_project.toolchain_probe
+            self.configured_compilers = self.root_project.configured_compilers
+            self.lexer = self.root_project.lexer
+        else:
+            self.set_build_dir(build_dir)
+            self.lexer = IncludeLexer(stop_after_preamble=scan_preamble_only)
+            self.scan_cache = ScanCache(self._scan_cache_path(), self.logger, enabled=scan_cache, scanner=self.lexer.name)
+            self.toolchain_probe = ToolchainProbe(self._toolchain_cache_path(), self.logger, enabled=scan_cache)
+            # Maps the ids of compiler profiles to the profiles along with their configured copies, so each profile is only configured once.
+            self.configured_compilers: Dict[int, Tuple[BaseCompiler, BaseCompiler]] = {}
 
         # Global compiler options
         self.compiler: BaseCompiler = compiler
         self.cflags: Set[str] = utils.convert_to_set(cflags) if cflags else compiler.default_flags
         project_include_dirs: Set[str] = utils.locate_paths(project_include_dirs, self.root_dir, self.logger, ErrorType=FileNotFoundError)
-        self.logger.debug(f"Using project include directories: {project_include_dirs}")
+        self.logger.debug("Using project include directories: %s", project_include_dirs)
         self.include_dirs: Set[str] = utils.convert_to_set(include_dirs) | project_include_dirs
         self.lflags: Set[str] = utils.convert_to_set(lflags) if lflags else compiler.default_flags
         self.link_dirs: Set[str] = utils.convert_to_set(link_dirs)
 
-        # Keep track of user-defined targets.
-        self.release_targets: List[Target] = []
-        self.debug_targets: List[Target] = []
-        self.install_targets: List[Target] = []
-        # Use a header manager.
-        self.header_manager = HeaderManager(project_include_dirs, self.logger)
-        # Map library names to the exact name used for linking them. When a library is added, or any target
-        # with a library dependency is added, this is updated.
-        self.library_registry: Dict[str, str] = {}
-
-    def _generate_target(self, name: str, sources: Set[str], libraries: Set[str], cflags: Set[str], include_dirs: Set[str], lflags: Set[str], link_dirs: Set[str], compiler: BaseCompiler, output_directory: str, install_dir: str) -> Target:
+        # Keep track of user-defined targets, for each variant. Subprojects add theirs to the root project's.
+        if self.parent:
+            self.variants: List[Variant] = self.root_project.variants
+            self.default_variants: List[str] = self.root_project.default_variants
+            self.variant_targets: Dict[str, List[Target]] = self.root_project.variant_targets
+            self.install_targets: List[Target] = self.root_project.install_targets
+            self.library_names: Set[str] = self.root_project.library_names
+            self.library_registry: Dict[str, str] = self.root_project.library_registry
+            self.header_managers: Dict[FrozenSet[str], HeaderManager] = self.root_project.header_managers
+            self.target_header_managers: Dict[str, HeaderManager] = self.root_project.target_header_managers
+            self.pending_source_maps: List[Tuple[HeaderManager, Dict[str, Set[str]]]] = self.root_project.pending_source_maps
+            self.subprojects: List[Tuple[str, MGen]] = self.root_project.subprojects
+        else:
+            self.variants: List[Variant] = utils.convert_to_list(variants)
+            variant_names = [variant.name for variant in self.variants]
+            if not self.variants or len(set(variant_names)) != len(variant_names):
+                self.logger.error(f"Variants must be non-empty and have unique names, but got: {variant_names}", ValueError)
+            self.default_variants: List[str] = utils.convert_to_list(default_variants) if default_variants else variant_names
+            for variant_name in self.default_variants:
+                if variant_name not in variant_names:
+                    self.logger.error(f"Default variant {variant_name} is not one of the selected variants: {variant_names}", ValueError)
+            self.variant_targets: Dict[str, List[Target]] = {variant.name: [] for variant in self.variants}
+            self.install_targets: List[Target] = []
+            # The names of libraries added by add_library, before variant suffixes are applied.
+            self.library_names: Set[str] = set()
+            # Map library names to the exact name used for linking them. When a library is added, or any target
+            # with a library dependency is added, this is updated.
+            self.library_registry: Dict[str, str] = {}
+            # Header managers for each set of project include directories in the project hierarchy.
+            self.header_managers: Dict[FrozenSet[str], HeaderManager] = {}
+            # Maps the paths of targets to the header manager of the project that added them.
+            self.target_header_managers: Dict[str, HeaderManager] = {}
+            # Source maps whose header dependencies have not been located yet, along with the header manager that locates them.
+            self.pending_source_maps: List[Tuple[HeaderManager, Dict[str, Set[str]]]] = []
+            # The scripts of subprojects along with the projects that included them, in the order they were included.
+            # Scripts after the first loaded_subprojects have not been loaded yet.
+            self.subprojects: List[Tuple[str, MGen]] = []
+            self.loaded_subprojects = 0
+        # Use a header manager. Projects with the same include directories share one, along with the include graph it builds.
+        project_include_dirs = frozenset(project_include_dirs)
+        if project_include_dirs not in self.header_managers:
+            self.header_managers[project_include_dirs] = HeaderManager(set(project_include_dirs), self.logger, self.scan_cache, self.lexer, self.path_resolver, self.profiler)
+        self.header_manager = self.header_managers[project_include_dirs]
+        self.compiler_dependencies = compiler_dependencies
+        self.jobs = jobs
+        self.unity = unity
+        self.unity_batch_size = unity_batch_size
+        self.object_cache = os.path.join(self.root_dir, os.path.expanduser(object_cache)) if object_cache else ""
+        self.object_cache_size = object_cache_size
+        self.lto_mode = lto_mode
+        self.lto_partition = lto_partition
+        self.instrument = instrument
+        self.graph_analysis = graph_analysis
+
+    # Targets in the release and debug variants, if those variants are selected.
+    @property
+    def release_targets(self) -> List[Target]:
+        return self.variant_targets.get(RELEASE.name, [])
+
+    @property
+    def debug_targets(self) -> List[Target]:
+        return self.variant_targets.get(DEBUG.name, [])
+
+    # Every target of every variant, in variant order.
+    def _variant_targets(self) -> List[Target]:
+        return [target for variant in self.variants for target in self.variant_targets[variant.name]]
+
+    # Caches and logs are shared by every project in the hierarchy, so they are kept in the root project's build directory.
+    def _scan_cache_path(self) -> str:
+        return os.path.join(self.root_project.build_dir, ".msquared", "scan_cache.json")
+
+    def _timing_log_path(self) -> str:
+        return os.path.join(self.root_project.build_dir, ".msquared", "build_times.jsonl")
+
+    def _toolchain_cache_path(self) -> str:
+        return os.path.join(self.root_project.build_dir, ".msquared", "toolchain.json")
+
+    # Returns the compiler profile with its linker selected, probing for linkers if necessary.
+    def _configure_compiler(self, compiler: BaseCompiler) -> BaseCompiler:
+        if id(compiler) not in self.configured_compilers:
+            self.configured_compilers[id(compiler)] = (compiler, self.toolchain_probe.configure(compiler))
+        return self.configured_compilers[id(compiler)][1]
+
+    def _graph_manifest_path(self) -> str:
+        return os.path.join(self.root_project.build_dir, ".msquared", "graph.json")
+
+    # Runs the scripts of subprojects that have not been loaded yet, including any subprojects that they include in turn.
+    # While a script runs, MGens it creates become part of the project that included it.
+    def _load_subprojects(self) -> None:
+        root = self.root_project
+        while root.loaded_subprojects < len(root.subprojects):
+            script, parent = root.subprojects[root.loaded_subprojects]
+            root.loaded_subprojects += 1
+            self.logger.info(f"Loading subproject: {script}")
+            MGen._including.append(parent)
+            try:
+                with self.profiler.phase("subprojects"):
+                    # Scripts that only write their build file when run directly do not do so here.
+                    runpy.run_path(script, run_name="__msquared_subproject__")
+            finally:
+                MGen._including.pop()
+
+    # Every file in the include graphs of the project hierarchy.
+    def _include_graph_files(self) -> Set[str]:
+        files = set()
+        for header_manager in self.header_managers.values():
+            files |= set(header_manager.graph.files())
+        return files
+
+    # Skips writing or building from a subproject, since the root project does that for the entire hierarchy.
+    def _skip_subproject(self, action: str) -> bool:
+        if self.parent:
+            self.logger.info(f"{self.script_path} is included by {self.root_project.script_path}. Not {action}.")
+        return bool(self.parent)
+
+    def _generate_target(self, name: str, sources: Set[str], libraries: Set[str], cflags: Set[str], include_dirs: Set[str], lflags: Set[str], link_dirs: Set[str], compiler: BaseCompiler, output_directory: str, install_dir: str, unity: bool, unity_batch_size: int, unity_exclude: Set[str]) -> Tuple[Target, ...]:
         # Add global options to each executable. This makes the Targets returned to the user complete.
         # Sources and header dependencies.
-        sources = utils.locate_paths(sources, self.project_source_dirs, self.logger, FileNotFoundError)
+        with self.profiler.phase("resolve_sources"):
+            # Project source directories default to the root directory, which is too large to index.
+            sources = self.path_resolver.locate_paths(sources, self.project_source_dirs, FileNotFoundError, indexed=False)
+        compiler = self._configure_compiler(compiler if compiler else self.compiler)
+        depfiles = bool(self.compiler_dependencies and compiler.depfile)
+        if self.compiler_dependencies and not depfiles:
+            self.logger.debug("%s cannot write dependency files. Scanning headers for %s instead.", compiler.name, name)
         source_map = {}
-        for source in sources:
-            source_map[source] = self.header_manager.locate_headers(source)
+        if depfiles:
+            # Header dependencies come from the compiler.
+            source_map = {source: frozenset() for source in sources}
+        elif self.jobs > 1:
+            # Header dependencies are filled in by _scan_pending_sources.
+            source_map = {source: set() for source in sources}
+            self.pending_source_maps.append((self.header_manager, source_map))
+        else:
+            with self.profiler.phase("scan"):
+                for source in sources:
+                    source_map[source] = self.header_manager.locate_headers(source)
         # Compiler settings.
         libraries = utils.convert_to_set(libraries)
         cflags = utils.convert_to_set(cflags) | self.cflags
         include_dirs = utils.convert_to_set(include_dirs) | self.include_dirs
         lflags = utils.convert_to_set(lflags) | self.lflags
         link_dirs = utils.convert_to_set(link_dirs) | self.link_dirs
-        compiler = compiler if compiler else self.compiler
         output_directory = output_directory if output_directory else self.build_dir
         install_dir = os.path.join(self.root_dir, install_dir) if install_dir and not os.path.isabs(install_dir) else install_dir
-        # Add release target.
-        path = os.path.abspath(os.path.join(output_directory, name))
-        target = Target(name, path, source_map, libraries, cflags, include_dirs, lflags, link_dirs, compiler, logger=self.logger, obj_out_dir=os.path.join(self.build_dir, "objs"), install_dir=install_dir)
-
-        debug_cflags = cflags | set([compiler.debug])
-        debug_lflags = lflags | set([compiler.debug])
-        name, ext = os.path.splitext(name)
-        debug_name = f"{name}_debug{ext}"
-        debug_path = os.path.join(os.path.dirname(path), debug_name)
-        debug_target = Target(debug_name, debug_path, source_map, libraries, debug_cflags, include_dirs, debug_lflags, link_dirs, compiler, logger=self.logger, obj_out_dir=os.path.join(self.build_dir, "dobjs"), install_dir=install_dir)
-        self.release_targets.append(target)
-        self.debug_targets.append(debug_target)
-        return target, debug_target
+        # Unity sources are shared by all variants.
+        unity = self.unity if unity is None else unity
+        unity_batch_size = (self.unity_batch_size if unity_batch_size is None else unity_batch_size) if unity else 0
+        unity_exclude = self.path_resolver.locate_paths(unity_exclude, self.project_source_dirs, FileNotFoundError, indexed=False) if unity_exclude else set()
+        unity_dir = os.path.join(self.build_dir, "unity", os.path.splitext(name)[0])
+        # Cache keys are computed from scanned headers, which are not available when the compiler writes dependency files.
+        object_cache = self.object_cache
+        if object_cache and depfiles:
+            self.logger.warning(f"Object cache requires scanned header dependencies. Will not use {object_cache} for {name}.")
+            object_cache = ""
+        # Add a target for each variant. Each one gets its own copy of the flags, since they may be modified later.
+        targets = []
+        for variant in self.variants:
+            variant_name = variant.target_name(name)
+            path = os.path.abspath(os.path.join(output_directory, variant_name))
+            variant_cflags = variant.apply_cflags(cflags, compiler)
+            # Split debug information is written next to objects, and would be missing when they come from the cache.
+            variant_cache = "" if compiler.split_debug_flag and compiler.split_debug_flag in variant_cflags else object_cache
+            if variant_cache != object_cache:
+                self.logger.debug("Object cache does not store split debug information. Will not use it for %s.", variant_name)
+            target = Target(variant_name, path, source_map, set(libraries), variant_cflags, include_dirs, variant.apply_lflags(lflags, compiler), link_dirs, compiler, logger=self.logger, obj_out_dir=os.path.join(self.build_dir, variant.obj_dir), install_dir=install_dir, root_dir=self.root_dir, depfiles=depfiles, unity_dir=unity_dir, unity_batch_size=unity_batch_size, unity_exclude=unity_exclude, object_cache=variant_cache, object_cache_size=self.object_cache_size, lto_mode=self.lto_mode, lto_partition=self.lto_partition, timing_log=self._timing_log_path() if self.instrument else "")
+            self.variant_targets[variant.name].append(target)
+            self.target_header_managers[target.path] = self.header_manager
+            targets.append(target)
+        return tuple(targets)
+
+    # Scans all deferred sources in parallel, then fills in their header dependencies.
+    # The source maps are shared between variants, so they are updated in place.
+    def _scan_pending_sources(self) -> None:
+        if not self.pending_source_maps:
+            return
+        sources: Dict[HeaderManager, Set[str]] = {}
+        for header_manager, source_map in self.pending_source_maps:
+            sources.setdefault(header_manager, set()).update(source_map.keys())
+        with self.profiler.phase("scan"):
+            for header_manager, manager_sources in sources.items():
+                header_manager.scan_files(manager_sources, self.jobs)
+            for header_manager, source_map in self.pending_source_maps:
+                for source in source_map:
+                    source_map[source] = header_manager.locate_headers(source)
+        # The list is shared with subprojects, so it is cleared in place.
+        self.pending_source_maps.clear()
 
     """
     API Functions
@@ -137,9 +351,14 @@ class MGen(object):
             self.build_dir = build_dir
         else:
             self.build_dir = os.path.join(self.root_dir, build_dir)
-        self.logger.debug(f"Using project build directory: {self.build_dir}")
-
-    def add_executable(self, name: str, sources=set(), libraries=set(), cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), compiler=None, output_directory=None, install_directory=None) -> Target:
+        self.logger.debug("Using project build directory: %s", self.build_dir)
+        self.path_resolver.excluded_dirs = set([self.build_dir])
+        if self.scan_cache:
+            self.scan_cache.set_path(self._scan_cache_path())
+        if self.toolchain_probe:
+            self.toolchain_probe.set_path(self._toolchain_cache_path())
+
+    def add_executable(self, name: str, sources=set(), libraries=set(), cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), compiler=None, output_directory=None, install_directory=None, unity=None, unity_batch_size=None, unity_exclude=set()) -> Tuple[Target, ...]:
         """
         Adds an executable to be generated based on the specified source files.
 
@@ -152,13 +371,16 @@ class MGen(object):
             lflags (Set[str]): Flags to use while linking constituent object files.
             link_dirs (Set[str]): Link directories for libraries.
             compiler (BaseCompiler): The compiler to use.
+            unity (bool): Whether to combine sources into unity sources. Defaults to the value provided to MGen.
+            unity_batch_size (int): The maximum number of sources in each unity source. Defaults to the value provided to MGen.
+            unity_exclude (Set[str]): Sources that should not be combined with others, e.g. because they define conflicting internal symbols.
 
         Returns:
-            Target: A new target representing the executable.
+            Tuple[Target]: A new target representing the executable, for each variant.
         """
-        return self._generate_target(name, sources, libraries, cflags, include_dirs, lflags, link_dirs, compiler, output_directory, install_directory)
+        return self._generate_target(name, sources, libraries, cflags, include_dirs, lflags, link_dirs, compiler, output_directory, install_directory, unity, unity_batch_size, unity_exclude)
 
-    def add_library(self, name: str, sources=set(), libraries=set(), cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), compiler=None, output_directory=None, install_directory=None) -> Target:
+    def add_library(self, name: str, sources=set(), libraries=set(), cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), compiler=None, output_directory=None, install_directory=None, unity=None, unity_batch_size=None, unity_exclude=set()) -> Tuple[Target, ...]:
         """
         Adds a library to be generated based on the specified source files.
 
@@ -171,18 +393,20 @@ class MGen(object):
             lflags (Set[str]): Flags to use while linking constituent object files.
             link_dirs (Set[str]): Link directories for libraries.
             compiler (BaseCompiler): The compiler to use.
+            unity (bool): Whether to combine sources into unity sources. Defaults to the value provided to MGen.
+            unity_batch_size (int): The maximum number of sources in each unity source. Defaults to the value provided to MGen.
+            unity_exclude (Set[str]): Sources that should not be combined with others, e.g. because they define conflicting internal symbols.
 
         Returns:
-            Target: A new target representing the library.
+            Tuple[Target]: A new target representing the library, for each variant.
         """
-        target, debug_target = self._generate_target(name, sources, libraries, cflags, include_dirs, lflags, link_dirs, compiler, output_directory, install_directory)
-        # Add the shared flag and register this library.
-        target.lflags.add(target.compiler.shared)
-        self.library_registry[target.name] = target.path
-        # And for debug
-        debug_target.lflags.add(debug_target.compiler.shared)
-        self.library_registry[debug_target.name] = debug_target.path
-        return target, debug_target
+        targets = self._generate_target(name, sources, libraries, cflags, include_dirs, lflags, link_dirs, compiler, output_directory, install_directory, unity, unity_batch_size, unity_exclude)
+        # Add the shared flag and register this library in every variant.
+        self.library_names.add(name)
+        for target in targets:
+            target.lflags.add(target.compiler.shared)
+            self.library_registry[target.name] = target.path
+        return targets
 
     def add_install(self, path: str, install_directory: str) -> Target:
         # FIXME: This may cause name collisions for files with the same name but different paths.
@@ -194,46 +418,286 @@ class MGen(object):
         self.install_targets.append(target)
         return target
 
-    def generate(self, human_readable_object_names=False):
+    def include_subproject(self, path: str) -> None:
         """
-        Generates a Makefile.
+        Includes the targets of another MGen script, e.g. one for a component of a larger repository, so that the entire
+        hierarchy is written to a single Makefile. The script is loaded when targets are first needed, e.g. when the Makefile is generated.
+        MGens created by the script share this project's caches, variants and libraries, so targets in any project can link
+        libraries from any other project by name. Their calls to write() and write_ninja() do nothing.
+        Each script is only loaded once, even if it is included by multiple projects.
+
+        Args:
+            path (str): The path of the script. Relative paths are relative to the root directory of this project.
         """
-        # Walk over all the targets. For each one, we add an intermediate target for each source file.
-        build_targets = set()
+        path = os.path.realpath(os.path.join(self.root_dir, path))
+        if not os.path.isfile(path):
+            self.logger.error(f"Could not find subproject script {path}", FileNotFoundError)
+        if path == os.path.realpath(self.root_project.script_path) or path in [script for script, _ in self.subprojects]:
+            self.logger.debug("Subproject %s is already included", path)
+            return
+        self.subprojects.append((path, self))
+
+    # Flattens targets passed to API functions. add_executable and add_library return the targets for every variant together.
+    def _flatten_targets(self, targets) -> List[Target]:
+        self._load_subprojects()
+        if targets is None:
+            return self._variant_targets()
+        flattened = []
+        for target in utils.convert_to_list(targets):
+            flattened.extend(target if isinstance(target, (list, tuple)) else [target])
+        return flattened
+
+    def suggest_precompiled_headers(self, count=5, min_fan_in=2, targets=None) -> List[Tuple[str, int, int]]:
+        """
+        Finds the project headers that would benefit most from being precompiled, and logs them.
+        Headers are ranked by fan-in (the number of source files that include them, directly or indirectly)
+        multiplied by size (the number of bytes in the header and every project header it includes).
+
+        Optional Args:
+            count (int): The maximum number of headers to suggest.
+            min_fan_in (int): Headers included by fewer source files than this are not suggested.
+            targets (List[Target]): Only consider source files of these targets. Defaults to all targets.
+
+        Returns:
+            List[Tuple[str, int, int]]: The suggested headers, along with their fan-in and size, best first.
+        """
+        targets = self._flatten_targets(targets)
+        self._scan_pending_sources()
+        # Headers come from the projects that own each target, since projects may have different include directories.
+        source_headers: Dict[str, Set[str]] = {}
+        header_managers: Dict[str, HeaderManager] = {}
+        for target in targets:
+            header_manager = self.target_header_managers.get(target.path, self.header_manager)
+            for source, headers in target.source_map.items():
+                # Sources are scanned even when the compiler writes dependency files, since the include graph is needed here.
+                headers = header_manager.locate_headers(source) if target.depfiles else headers
+                source_headers.setdefault(source, set()).update(headers)
+                for header in headers:
+                    header_managers.setdefault(header, header_manager)
+        fan_in: Dict[str, int] = {}
+        for headers in source_headers.values():
+            for header in headers:
+                fan_in[header] = fan_in.get(header, 0) + 1
+
+        sizes: Dict[str, int] = {}
+        def size(header):
+            if header not in sizes:
+                sizes[header] = os.path.getsize(header) if os.path.isfile(header) else 0
+            return sizes[header]
+
+        candidates = []
+        for header, header_fan_in in fan_in.items():
+            if header_fan_in < min_fan_in:
+                continue
+            total_size = size(header) + sum(size(dep) for dep in header_managers[header].graph.transitive(header) if dep != header)
+            candidates.append((header, header_fan_in, total_size))
+        # Ties are broken by path, so that suggestions are deterministic.
+        candidates.sort(key=lambda candidate: (-candidate[1] * candidate[2], candidate[0]))
+        candidates = candidates[:count]
+        for header, header_fan_in, total_size in candidates:
+            self.logger.info(f"Precompiled header candidate: {header} (included by {header_fan_in} sources, {total_size} bytes)")
+        return candidates
+
+    def add_precompiled_header(self, header: str=None, targets=None) -> str:
+        """
+        Precompiles a header for the specified targets, and includes it in all of their source files.
+        Since precompiled headers must be built with the same flags as the objects that use them,
+        each target gets its own precompiled header.
+
+        Optional Args:
+            header (str): The header to precompile. Relative paths are searched for in the project include directories, then the root directory. If this is omitted, the best candidate from suggest_precompiled_headers is used.
+            targets (List[Target]): The targets that should use the precompiled header. These can include the tuples returned by add_executable and add_library. Defaults to all targets added so far.
+
+        Returns:
+            str: The absolute path of the header, or None if there were no candidates.
+        """
+        targets = self._flatten_targets(targets)
+        header_managers = {target.path: self.target_header_managers.get(target.path, self.header_manager) for target in targets}
+        if header is None:
+            candidates = self.suggest_precompiled_headers(count=1, targets=targets)
+            if not candidates:
+                self.logger.warning(f"Could not find any headers worth precompiling.")
+                return None
+            header = candidates[0][0]
+        else:
+            header_dirs = set()
+            for header_manager in header_managers.values():
+                header_dirs |= header_manager.header_dirs
+            header = self.path_resolver.locate_paths(header, sorted(header_dirs) + [self.root_dir], FileNotFoundError, indexed=False).pop()
+        self.logger.debug(lambda: f"Precompiling {header} for: {[target.name for target in targets]}")
+        for target in targets:
+            # The header's own includes are resolved with the include directories of the project that owns each target.
+            dependencies = header_managers[target.path].locate_headers(header)
+            target.add_precompiled_header(header, dependencies - set([header]))
+        return header
+
+    # Finishes any deferred work on targets before they are converted into build rules.
+    def _prepare_targets(self) -> None:
+        self._load_subprojects()
+        self._scan_pending_sources()
+        with self.profiler.phase("prepare"):
+            # Unity sources are only rewritten when their batches change, so that unchanged batches are not rebuilt.
+            for target in self._variant_targets():
+                for unity_source, batch in target.unity_batches().items():
+                    os.makedirs(os.path.dirname(unity_source), exist_ok=True)
+                    utils.write_if_changed(unity_source, "\n".join(Target.unity_source_lines(batch)) + "\n")
+            # Walk over the targets of each variant and map any internal libraries to the same variant of that library.
+            for variant in self.variants:
+                for target in self.variant_targets[variant.name]:
+                    target.libraries = set([variant.target_name(lib) if lib in self.library_names else lib for lib in target.libraries])
+
+    # All sources of all targets, every header scanned for them, and the scripts of subprojects.
+    def _scanned_files(self) -> List[str]:
+        files = self._include_graph_files() | set(script for script, _ in self.subprojects)
+        for target in self._variant_targets():
+            files |= set(target.source_map.keys())
+        return sorted(files)
+
+    # Targets that report on the object cache and build timings, if they are used.
+    def _generate_report_targets(self) -> List[MakefileTarget]:
+        report_targets = []
+        if self.object_cache:
+            command = f"{sys.executable} {os.path.abspath(ObjectCache.__file__)} stats --dir {self.object_cache}"
+            report_targets.append(MakefileTarget(name="cache-stats", commands=command, phony=True, help=f"Displays statistics for the object cache in {self.object_cache}."))
+        if self.instrument:
+            trace_path = os.path.join(self.build_dir, ".msquared", "build_trace.json")
+            command = f"{sys.executable} {os.path.abspath(BuildTimer.__file__)} report --log {self._timing_log_path()} --trace {trace_path}"
+            report_targets.append(MakefileTarget(name="build-report", commands=command, phony=True, help=f"Summarizes the slowest build steps and the critical path, and writes a Chrome trace to {trace_path}."))
+        if self.graph_analysis:
+            # The command does not depend on where msquared is, so the build file can be shared. python3 must be able to import msquared.
+            command = f"python3 -m msquared impact --manifest {self._graph_manifest_path()}"
+            report_targets.append(MakefileTarget(name="rebuild-impact", commands=command, phony=True, help=f"Lists the headers that cause the most expensive incremental rebuilds."))
+        return report_targets
+
+    # Generates the all target, followed by a target for each variant that builds every target in that variant.
+    def _generate_variant_phony_targets(self, noun: str) -> List[MakefileTarget]:
+        variant_names = [variant.name for variant in self.variants]
+        built = "all" if self.default_variants == variant_names else ", ".join(self.default_variants)
+        phony_targets = [MakefileTarget(name="all", dependencies=self.default_variants, phony=True, help=f"Builds {built} targets specified in this {noun}.")]
+        for variant in self.variants:
+            phony_targets.append(MakefileTarget(name=variant.name, dependencies=[tgt.path for tgt in self.variant_targets[variant.name] if tgt.source_map], phony=True, help=f"Builds {variant.name} targets specified in this {noun}."))
+        return phony_targets
+
+    # Converts a phony or install MakefileTarget into the equivalent ninja build statement.
+    def _add_ninja_target(self, writer: NinjaWriter, makefile_target: MakefileTarget) -> None:
+        if makefile_target.commands:
+            command = " && ".join(makefile_target.commands)
+            writer.build(makefile_target.name, "run", implicit=sorted(makefile_target.dependencies), variables={"cmd": Ninja.escape(command), "desc": makefile_target.name})
+        else:
+            writer.build(makefile_target.name, "phony", inputs=sorted(makefile_target.dependencies))
+
+    def _generate_ninja(self, human_readable_object_names=False, regenerate=False, filename="build.ninja", link_jobs=1) -> str:
+        self._prepare_targets()
+        writer = NinjaWriter(MGen._get_makefile_header())
+        writer.variable("ninja_required_version", "1.3")
+        # Ninja keeps its logs here.
+        writer.variable("builddir", os.path.join(self.build_dir, ".msquared"))
+        writer.newline()
+        # Linking is memory intensive, so it is limited separately.
+        writer.pool("link_pool", link_jobs)
+        writer.rule("run", "$cmd", description="$desc", pool="console")
+
+        emitted = set()
+        with self.profiler.phase("render"):
+            for target in self._variant_targets():
+                target.generate_ninja_builds(writer, self.library_registry, emitted, human_readable_object_names)
+        writer.newline()
+
         phony_targets = []
         install_targets = []
         uninstall_targets = []
-        # Walk over debug targets and map any internal libraries
-        for target in self.debug_targets:
-            new_libs = set()
-            for lib in target.libraries:
-                if lib in self.library_registry:
-                    name, ext = os.path.splitext(lib)
-                    debug_lib = f"{name}_debug{ext}"
-                    new_libs.add(debug_lib)
-                else:
-                    new_libs.add(lib)
-            target.libraries = new_libs
-
-        for target in self.release_targets + self.debug_targets + self.install_targets:
-            build_targets |= utils.convert_to_set(target.generate_build_targets(self.library_registry, human_readable_object_names))
+        for target in self._variant_targets() + self.install_targets:
             phony_targets.extend(target.generate_phony_target())
             install_targets.extend(target.generate_install_target())
             uninstall_targets.extend(target.generate_uninstall_target())
+        install_targets.append(MakefileTarget(name="install", dependencies=[tgt.name for tgt in install_targets], phony=True, help=f"Runs all other install targets."))
+        uninstall_targets.append(MakefileTarget(name="uninstall", dependencies=[tgt.name for tgt in uninstall_targets], phony=True, help=f"Runs all other uninstall targets."))
+        phony_targets = self._generate_variant_phony_targets("file") + phony_targets
+        phony_targets.append(MakefileTarget(name="clean", commands=f"rm -rf {self.build_dir}", phony=True, help=f"Removes the entire build directory."))
+        phony_targets.extend(self._generate_report_targets())
+        all_targets = phony_targets + install_targets + uninstall_targets
+        all_targets.append(MakefileTarget(name="help", phony=True, commands=[f'echo "\t{tgt.name}: {tgt.help}"' for tgt in all_targets if tgt.help]))
+        for makefile_target in all_targets:
+            self._add_ninja_target(writer, makefile_target)
+
+        if regenerate and os.path.isfile(self.script_path):
+            scanned_files = self._scanned_files()
+            writer.newline()
+            # The MGen script only rewrites the file if it changed, so update the timestamp to avoid regenerating again.
+            writer.rule("regenerate", f"cd {self.root_dir} && {sys.executable} {self.script_path} && touch $out", description="Regenerating $out", generator="1")
+            writer.build(filename, "regenerate", implicit=[self.script_path] + scanned_files)
+            # Files that have been deleted should cause regeneration rather than errors.
+            for scanned_file in scanned_files:
+                writer.build(scanned_file, "phony")
+        elif regenerate:
+            self.logger.warning(f"MGen was not created from a script ({self.script_path}), so {filename} cannot regenerate itself.")
+        writer.newline()
+        writer.default("all")
+        with self.profiler.phase("format"):
+            build_ninja = str(writer)
+        self.profiler.set("targets_emitted", sum(1 for line in writer.lines if line.startswith("build ")))
+        self.profiler.set("output_bytes", len(build_ninja))
+        return build_ninja
+
+    # Generates a rule that re-runs the MGen script when it, or any of the scanned files, is newer than the Makefile.
+    # Make remakes a Makefile that is a target before doing anything else, and then restarts with the new one.
+    def _generate_regenerate_target(self) -> MakefileTarget:
+        if not os.path.isfile(self.script_path):
+            self.logger.warning(f"MGen was not created from a script ({self.script_path}), so the Makefile cannot regenerate itself.")
+            return None
+        # Files that have been deleted should cause regeneration rather than errors, so they are filtered with wildcard.
+        scanned_files = " ".join(self._scanned_files())
+        commands = []
+        commands.append(f'echo -e "\\e[35mRegenerating $@\\e[0m"')
+        commands.append(f"cd {self.root_dir} && {sys.executable} {self.script_path}")
+        # The MGen script only rewrites the Makefile if it changed, so update the timestamp to avoid regenerating again.
+        commands.append("touch $@")
+        return MakefileTarget(name="$(MSQUARED_MAKEFILE)", dependencies=f"$(wildcard {self.script_path} {scanned_files})", commands=commands)
+
+    # Generates the Makefile in pieces, so that it can be written without building the entire string.
+    # Targets are only rendered as each piece is requested.
+    # In compact mode, objects with the same compiler and flags share a canned recipe, which is defined once before the targets.
+    # Likewise, dependency lists shared by several targets, like the headers of a source built in multiple variants, are defined once as variables.
+    def _generate_makefile_chunks(self, human_readable_object_names=False, regenerate=False, compact=False) -> Iterator[str]:
+        self._prepare_targets()
+        # Walk over all the targets. For each one, we add an intermediate target for each source file.
+        build_targets = set()
+        phony_targets = []
+        install_targets = []
+        uninstall_targets = []
+        depfiles = set()
+        recipes: Dict[str, str] = {}
+        with self.profiler.phase("render"):
+            for target in self._variant_targets() + self.install_targets:
+                build_targets |= utils.convert_to_set(target.generate_build_targets(self.library_registry, human_readable_object_names, compact))
+                if compact:
+                    recipes.update(target.generate_compile_recipes())
+                depfiles |= set(target.generate_depfiles(human_readable_object_names))
+                phony_targets.extend(target.generate_phony_target())
+                install_targets.extend(target.generate_install_target())
+                uninstall_targets.extend(target.generate_uninstall_target())
+
+        regenerate_target = self._generate_regenerate_target() if regenerate else None
+        if regenerate_target:
+            build_targets.add(regenerate_target)
 
         # Add a clean target.
         build_targets.add(MakefileTarget(name="clean", commands=f"rm -rf {self.build_dir}", phony=True, help=f"Removes the entire build directory."))
+        build_targets |= set(self._generate_report_targets())
+        if self.graph_analysis:
+            build_targets.add(self._generate_affected_target())
 
         # Add an install/uninstall target.
         install_targets.append(MakefileTarget(name="install", dependencies=[tgt.name for tgt in install_targets], phony=True, help=f"Runs all other install targets."))
         uninstall_targets.append(MakefileTarget(name="uninstall", dependencies=[tgt.name for tgt in uninstall_targets], phony=True, help=f"Runs all other uninstall targets."))
 
-        # Create an all target as the first target, along with release and debug targets.
-        phony_targets.insert(0, MakefileTarget(name="all", dependencies=["release", "debug"], phony=True, help=f"Builds all targets specified in this Makefile."))
-        phony_targets.insert(1, MakefileTarget(name="release", dependencies=[tgt.path for tgt in self.release_targets], phony=True, help=f"Builds release targets specified in this Makefile."))
-        phony_targets.insert(2, MakefileTarget(name="debug", dependencies=[tgt.path for tgt in self.debug_targets], phony=True, help=f"Builds debug targets specified in this Makefile."))
+        # Create an all target as the first target, along with a target for each variant.
+        phony_targets = self._generate_variant_phony_targets("Makefile") + phony_targets
 
-        all_targets = phony_targets + utils.convert_to_list(build_targets) + install_targets + uninstall_targets
+        # Build targets are sorted by name so that the output is deterministic.
+        build_targets = sorted(build_targets, key=lambda tgt: tgt.name)
+        dependency_lists = MGen._intern_dependency_lists(build_targets) if compact else {}
+        all_targets = phony_targets + build_targets + install_targets + uninstall_targets
 
         # Add a help target.
         help_target = MakefileTarget(name="help", phony=True, commands=[f'echo "\t{tgt.name}: {tgt.help}"' for tgt in all_targets if tgt.help])
@@ -243,14 +707,308 @@ class MGen(object):
         target_sep = "\n\n"
         # Add verbosity options
         verbosity = f"ifdef VERBOSE\n\tAT=\nelse\n\tAT=@\nendif"
-        Makefile = f"{MGen._get_makefile_header()}\n{verbosity}{utils.prefix_join(all_targets, target_sep)}"
-        return Makefile
+        if regenerate_target:
+            # The name make knows this Makefile by, so it can be remade.
+            verbosity += "\nMSQUARED_MAKEFILE := $(lastword $(MAKEFILE_LIST))"
+
+        def chunks():
+            yield f"{MGen._get_makefile_header()}\n{verbosity}"
+            for name, body in sorted(recipes.items()):
+                yield f"{target_sep}define {name}\n{body}\nendef"
+            for name, dependencies in sorted(dependency_lists.items()):
+                yield f"{target_sep}{name} :={utils.prefix_join(dependencies)}"
+            for tgt in all_targets:
+                yield f"{target_sep}{tgt}"
+            if depfiles:
+                # Header dependencies written by the compiler. These do not exist until the objects are first built.
+                yield f"{target_sep}-include"
+                for depfile in sorted(depfiles):
+                    yield f" {depfile}"
+
+        output_bytes = 0
+        for chunk in chunks():
+            output_bytes += len(chunk)
+            yield chunk
+        self.profiler.set("targets_emitted", len(all_targets))
+        self.profiler.set("output_bytes", output_bytes)
+
+    # Replaces dependency lists that are shared by multiple targets with a reference to a variable.
+    # Returns the variables, mapped to their sorted dependencies.
+    @staticmethod
+    def _intern_dependency_lists(targets: List[MakefileTarget]) -> Dict[str, List[str]]:
+        users: Dict[frozenset, List[MakefileTarget]] = {}
+        for target in targets:
+            if len(target.dependencies) > 1:
+                users.setdefault(frozenset(target.dependencies), []).append(target)
+        dependency_lists = {}
+        for dependencies, shared_targets in users.items():
+            if len(shared_targets) < 2:
+                continue
+            dependencies = sorted(dependencies)
+            name = f"msquared_deps_{hashlib.blake2b(chr(0).join(dependencies).encode(), digest_size=8).hexdigest()}"
+            dependency_lists[name] = dependencies
+            for target in shared_targets:
+                target.dependencies = set([f"$({name})"])
+        return dependency_lists
+
+    def generate(self, human_readable_object_names=False, regenerate=False, backend="make", compact=False):
+        """
+        Generates a Makefile, or a ninja build file.
+
+        Args:
+            human_readable_object_names (bool): Whether to name object files based on their flags rather than a digest of them.
+            regenerate (bool): Whether to add a rule that re-runs the MGen script when it or any scanned file is newer than the Makefile.
+            backend (str): Either "make" or "ninja".
+            compact (bool): Whether objects with the same compiler and flags should share a recipe, rather than each spelling out its compile command, and targets with the same dependencies should share a variable listing them. This only applies to Makefiles, since ninja rules are always shared.
+
+        Returns:
+            str: The contents of the Makefile or build.ninja file.
+        """
+        if backend == "ninja":
+            return self._generate_ninja(human_readable_object_names, regenerate)
+        elif backend != "make":
+            self.logger.error(f"Unknown backend: {backend}. Expected one of: make, ninja", ValueError)
+        chunks = self._generate_makefile_chunks(human_readable_object_names, regenerate, compact)
+        # Targets are prepared and rendered before the first piece is produced, so they are profiled separately.
+        first_chunk = next(chunks)
+        with self.profiler.phase("format"):
+            return first_chunk + "".join(chunks)
+
+    def graph_manifest(self, human_readable_object_names=False) -> Dict:
+        """
+        Describes the include graph, along with the objects and targets built from it, for analyses like RebuildImpact.
+        If graph_analysis is enabled, this is written to the build directory along with the build file.
+
+        Args:
+            human_readable_object_names (bool): Whether objects are named based on their flags rather than a digest of them.
 
-    def write(self, filename="Makefile", human_readable_object_names=False) -> None:
-        makefile = self.generate(human_readable_object_names)
+        Returns:
+            Dict: The manifest. Files are listed once, and referred to by their index elsewhere.
+        """
+        self._prepare_targets()
+        indices: Dict[str, int] = {}
+        def index(path: str) -> int:
+            return indices.setdefault(path, len(indices))
+        for file in sorted(self._include_graph_files()):
+            index(file)
+        objects = []
+        targets = []
+        for variant in self.variants:
+            for target in self.variant_targets[variant.name]:
+                if not target.source_map or not target.compiler:
+                    continue
+                batches = target.unity_batches()
+                precompiled_headers = [index(header) for header in sorted(target.precompiled_headers)]
+                object_paths = []
+                for unit in sorted(target.compile_units()):
+                    object_path = target.generate_object_path(unit, human_readable_object_names)
+                    object_paths.append(object_path)
+                    obj = {"path": object_path, "variant": variant.name, "sources": [index(source) for source in [unit] + batches.get(unit, [])], "precompiled_headers": precompiled_headers}
+                    if target.depfiles:
+                        obj["depfile"] = Target.depfile_path(object_path)
+                    objects.append(obj)
+                internal_libraries, _ = target.link_libraries(self.library_registry)
+                kind = "library" if self.library_registry.get(target.name) == target.path else "executable"
+                targets.append({"name": target.name, "path": target.path, "kind": kind, "variant": variant.name, "objects": object_paths, "libraries": sorted(internal_libraries)})
+        files = sorted(indices, key=lambda path: indices[path])
+        # Files shared by projects with different include directories have the includes found with each of them.
+        edges = [sorted(set(indices[include] for header_manager in self.header_managers.values() if file in header_manager.graph for include in header_manager.graph.direct(file) if include in indices)) for file in files]
+        return {"version": RebuildImpact.MANIFEST_VERSION, "files": files, "edges": edges, "objects": objects, "targets": targets}
+
+    def rebuild_impact(self, count=20, variant="", human_readable_object_names=False) -> Dict:
+        """
+        Computes how many objects and linked targets rebuild when each header changes, weighted by the cost of compiling them.
+        If build timing is enabled (see instrument), recorded compile and link times are used. Otherwise, costs are estimated from
+        the number of bytes each object compiles.
+
+        Optional Args:
+            count (int): The number of headers to report, starting with the most expensive. Reports every header if this is 0.
+            variant (str): If provided, only objects and targets in this variant are considered.
+            human_readable_object_names (bool): Whether objects are named based on their flags rather than a digest of them.
+
+        Returns:
+            Dict: See RebuildImpact.analyze.
+        """
+        timings = BuildTimer.BuildTimer(self._timing_log_path()).records() if self.instrument else {}
+        return RebuildImpact(self.graph_manifest(human_readable_object_names), timings, variant).analyze(count)
+
+    def affected(self, changed_paths, variant="", human_readable_object_names=False) -> Dict[str, List[str]]:
+        """
+        Finds the minimal set of objects, libraries and executables that must be rebuilt after some files change.
+        Objects are affected if they depend on a changed file, and libraries and executables are affected if they link an affected object or library.
+
+        Args:
+            changed_paths (List[str]): The files that changed, e.g. the output of git diff --name-only. Relative paths are relative to the root directory.
+
+        Optional Args:
+            variant (str): If provided, only objects and targets in this variant are considered.
+            human_readable_object_names (bool): Whether objects are named based on their flags rather than a digest of them.
+
+        Returns:
+            Dict[str, List[str]]: Maps "objects", "libraries" and "executables" to the sorted paths of those that must be rebuilt.
+        """
+        changed_paths = [os.path.abspath(os.path.join(self.root_dir, path)) for path in utils.convert_to_list(changed_paths)]
+        return RebuildImpact(self.graph_manifest(human_readable_object_names), variant=variant).affected(changed_paths)
+
+    # Selectively builds the targets affected by the files in FILES, and only those.
+    # This uses the make that is running it on this Makefile, so it is not part of the report targets shared with ninja.
+    def _generate_affected_target(self) -> MakefileTarget:
+        query = f"python3 -m msquared affected --manifest {self._graph_manifest_path()} $(if $(VARIANT),--variant $(VARIANT)) $(FILES)"
+        command = f'targets="$$({query})" && if [ -n "$$targets" ]; then $(MAKE) -f $(firstword $(MAKEFILE_LIST)) $$targets; else echo "Nothing to rebuild."; fi'
+        return MakefileTarget(name="affected", commands=command, phony=True, help="Builds only the targets affected by the files listed in FILES, e.g. the output of git diff --name-only. Set VARIANT to limit this to one variant.")
+
+    # Writes the graph manifest for analyses run from the build file, like rebuild-impact. Building it prepares every target,
+    # so it is only written when graph_analysis is enabled.
+    def _write_graph_manifest(self, human_readable_object_names=False) -> None:
+        manifest_path = self._graph_manifest_path()
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        utils.write_if_changed(manifest_path, json.dumps(self.graph_manifest(human_readable_object_names), sort_keys=True))
+
+    # Converts the build targets of every target into steps for the executor. These are the same rules the Makefile contains,
+    # except that links do not rely on make's jobserver.
+    def _build_steps(self, human_readable_object_names=False) -> List[BuildStep]:
+        self._prepare_targets()
+        steps = {}
+        with self.profiler.phase("render"):
+            for target in self._variant_targets():
+                for makefile_target in target.generate_build_targets(self.library_registry, human_readable_object_names, jobserver=False):
+                    if makefile_target.phony:
+                        continue
+                    depfile = Target.depfile_path(makefile_target.name) if target.depfiles and makefile_target.kind == "compile" else ""
+                    steps[makefile_target.name] = BuildStep(makefile_target.name, makefile_target.dependencies, makefile_target.commands, makefile_target.kind, depfile)
+        return list(steps.values())
+
+    # Maps names that can be passed to build() to the outputs they build.
+    def _build_outputs(self, names: List[str]) -> List[str]:
+        outputs = []
+        for name in names:
+            if name == "all":
+                outputs.extend(self._build_outputs(self.default_variants))
+            elif name in self.variant_targets:
+                outputs.extend(target.path for target in self.variant_targets[name] if target.source_map)
+            else:
+                paths = [target.path for target in self._variant_targets() if name in [target.name, target.path] and target.source_map]
+                if not paths:
+                    self.logger.error(f"Unknown target: {name}. Expected one of: all, a variant, or the name or path of a target", ValueError)
+                outputs.extend(paths)
+        return outputs
+
+    def build(self, jobs=None, targets=["all"], link_jobs=1, human_readable_object_names=False) -> bool:
+        """
+        Builds targets directly, without generating a Makefile or running make. Steps are the same as in the Makefile,
+        and steps whose outputs are up to date are skipped, as make would.
+        Steps on the longest remaining path through the build are started first. If build timing is enabled (see instrument),
+        or the project was built this way before, recorded durations are used to find that path.
+
+        Optional Args:
+            jobs (int): The maximum number of steps to run in parallel. Defaults to the number of CPUs.
+            targets (List[str]): What to build: "all", variants, or the names or paths of targets.
+            link_jobs (int): The maximum number of link steps to run in parallel. Links are usually memory intensive.
+            human_readable_object_names (bool): Whether to name object files based on their flags rather than a digest of them.
+
+        Returns:
+            bool: Whether every step succeeded.
+        """
+        if self._skip_subproject("building"):
+            return True
+        self._load_subprojects()
+        outputs = self._build_outputs(utils.convert_to_list(targets))
+        steps = self._build_steps(human_readable_object_names)
+        # Scans are persisted so that the next build or generated Makefile can reuse them.
+        self.scan_cache.save()
+        # Instrumented commands already record their own durations.
+        executor = Executor(steps, jobs if jobs else os.cpu_count(), link_jobs, self.logger, self._timing_log_path(), record=not self.instrument)
+        with self.profiler.phase("build"):
+            results = executor.run(outputs)
+        self.profiler.set("steps_built", len(results["built"]))
+        self.profiler.set("steps_up_to_date", len(results["up_to_date"]))
+        if results["failed"]:
+            self.logger.warning(f"Build failed. Failed steps: {results['failed']}. Skipped {len(results['skipped'])} steps.")
+            return False
+        self.logger.info(f"Built {len(results['built'])} steps, {len(results['up_to_date'])} were up to date.")
+        return True
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Reports how long each phase of generation took, along with counters describing the work done.
+        Phases are cumulative over the lifetime of this MGen, while counters like targets_emitted and output_bytes describe the most recently generated file.
+
+        Returns:
+            Dict[str, Dict]: Maps "phases" to the total seconds spent in each phase, "calls" to the number of times each phase was entered, and "counters" to the value of each counter.
+        """
+        stats = self.profiler.stats()
+        counters = stats["counters"]
+        # Files found in the scan cache are not re-read, so these may never have been counted.
+        counters.setdefault("files_scanned", 0)
+        counters.setdefault("bytes_scanned", 0)
+        counters["stat_calls"] = self.path_resolver.stat_calls
+        counters["dirs_indexed"] = len(self.path_resolver.index)
+        counters["files_in_include_graph"] = len(self._include_graph_files())
+        counters["targets"] = len(self._variant_targets())
+        for name, value in self.scan_cache.stats().items():
+            counters[f"scan_cache_{name}"] = value
+        return stats
+
+    def write(self, filename="Makefile", human_readable_object_names=False, regenerate=False, print_stats=False, compact=False) -> bool:
+        """
+        Writes a Makefile. The file is only replaced if its contents changed, and is replaced atomically.
+        The Makefile is written as it is rendered, so its contents are identical to generate(), but never held in memory all at once.
+
+        Args:
+            filename (str): The path of the Makefile. Relative paths are relative to the root directory.
+            human_readable_object_names (bool): Whether to name object files based on their flags rather than a digest of them.
+            regenerate (bool): Whether to add a rule that re-runs the MGen script when it or any scanned file is newer than the Makefile.
+            print_stats (bool): Whether to log generation statistics afterwards. See stats().
+            compact (bool): Whether to share recipes and dependency lists between targets, which makes the Makefile smaller and faster for make to parse. See generate().
+
+        Returns:
+            bool: Whether the Makefile was written.
+        """
+        if self._skip_subproject(f"writing {filename}"):
+            return False
+        chunks = self._generate_makefile_chunks(human_readable_object_names, regenerate, compact)
+        first_chunk = next(chunks)
         # Assume the file is relative to the root directory.
         if not os.path.isabs(filename):
             filename = os.path.join(self.root_dir, filename)
-        # Unlock file.
-        with open(filename, "w") as outf:
-            outf.write(makefile)
+        with self.profiler.phase("write"):
+            written = utils.write_chunks_if_changed(filename, itertools.chain([first_chunk], chunks))
+            if self.graph_analysis:
+                self._write_graph_manifest(human_readable_object_names)
+            # Persist include scans for the next run.
+            self.scan_cache.save()
+        if not written:
+            self.logger.info(f"{filename} is up to date.")
+        if print_stats:
+            self.logger.info(self.profiler.report(self.stats()))
+        return written
+
+    def write_ninja(self, filename="build.ninja", human_readable_object_names=False, regenerate=False, link_jobs=1, print_stats=False) -> bool:
+        """
+        Writes a ninja build file equivalent to the Makefile. The file is only replaced if its contents changed.
+
+        Args:
+            filename (str): The path of the ninja file. Relative paths are relative to the root directory.
+            human_readable_object_names (bool): Whether to name object files based on their flags rather than a digest of them.
+            regenerate (bool): Whether to add a rule that re-runs the MGen script when it or any scanned file is newer than the ninja file.
+            link_jobs (int): The maximum number of link steps to run in parallel.
+            print_stats (bool): Whether to log generation statistics afterwards. See stats().
+
+        Returns:
+            bool: Whether the ninja file was written.
+        """
+        if self._skip_subproject(f"writing {filename}"):
+            return False
+        if not os.path.isabs(filename):
+            filename = os.path.join(self.root_dir, filename)
+        build_ninja = self._generate_ninja(human_readable_object_names, regenerate, os.path.basename(filename), link_jobs)
+        with self.profiler.phase("write"):
+            written = utils.write_if_changed(filename, build_ninja)
+            if self.graph_analysis:
+                self._write_graph_manifest(human_readable_object_names)
+            self.scan_cache.save()
+        if not written:
+            self.logger.info(f"{filename} is up to date.")
+        if print_stats:
+            self.logger.info(self.profiler.report(self.stats()))
+        return written
@@ -0,0 +1,70 @@
+from msquared import utils
+from typing import Dict, List
+
+# Escapes a path for use in a build statement.
+def escape_path(path: str) -> str:
+    return path.replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+# Escapes a variable value so ninja passes it to the shell unmodified.
+def escape(value: str) -> str:
+    return value.replace("$", "$$")
+
+# Builds up the contents of a build.ninja file.
+class NinjaWriter(object):
+    def __init__(self, header: str=""):
+        self.lines: List[str] = [header] if header else []
+
+    def newline(self) -> None:
+        self.lines.append("")
+
+    def comment(self, text: str) -> None:
+        self.lines.append(f"# {text}")
+
+    def variable(self, key: str, value: str, indent=0) -> None:
+        self.lines.append(f"{'  ' * indent}{key} = {value}")
+
+    def pool(self, name: str, depth: int) -> None:
+        self.lines.append(f"pool {name}")
+        self.variable("depth", str(depth), indent=1)
+        self.newline()
+
+    # Variables are passed through as-is, so that rules can refer to $in, $out, etc.
+    def rule(self, name: str, command: str, **variables) -> None:
+        if self.lines and self.lines[-1]:
+            self.newline()
+        self.lines.append(f"rule {name}")
+        self.variable("command", command, indent=1)
+        for key, value in variables.items():
+            if value:
+                self.variable(key, value, indent=1)
+        self.newline()
+
+    def build(self, outputs, rule: str, inputs=[], implicit=[], order_only=[], variables: Dict[str, str]={}) -> None:
+        """
+        Adds a build statement.
+
+        Args:
+            outputs (List[str]): The files produced by this statement.
+            rule (str): The name of the rule to use.
+
+        Optional Args:
+            inputs (List[str]): Explicit inputs, available to the rule as $in.
+            implicit (List[str]): Implicit dependencies, which cause a rebuild when changed but are not part of $in.
+            order_only (List[str]): Dependencies that must be built first, but do not cause a rebuild.
+            variables (Dict[str, str]): Variables scoped to this statement.
+        """
+        line = f"build {' '.join(escape_path(out) for out in utils.convert_to_list(outputs))}: {rule}"
+        line += utils.prefix_join([escape_path(inp) for inp in utils.convert_to_list(inputs)])
+        if implicit:
+            line += f" |{utils.prefix_join([escape_path(dep) for dep in utils.convert_to_list(implicit)])}"
+        if order_only:
+            line += f" ||{utils.prefix_join([escape_path(dep) for dep in utils.convert_to_list(order_only)])}"
+        self.lines.append(line)
+        for key, value in variables.items():
+            self.variable(key, value, indent=1)
+
+    def default(self, targets) -> None:
+        self.lines.append(f"default {' '.join(escape_path(tgt) for tgt in utils.convert_to_list(targets))}")
+
+    def __str__(self):
+        return "\n".join(self.lines) + "\n"
@@ -0,0 +1,200 @@
+from typing import Dict, List
+import subprocess
+import argparse
+import hashlib
+import shutil
+import fcntl
+import json
+import sys
+import os
+
+# NOTE: Build rules run this file directly, so it must only depend on the standard library.
+
+DEFAULT_MAX_SIZE = 5 * 1024 ** 3
+
+# A local cache of object files, keyed by the contents of everything that went into them.
+# Since keys do not depend on absolute paths, objects can be shared between build directories and checkouts.
+# The cache can be shared by concurrent builds. Statistics are updated under a file lock, and entries are added atomically.
+class ObjectCache(object):
+    VERSION = 1
+
+    def __init__(self, directory: str, max_size: int=DEFAULT_MAX_SIZE):
+        """
+        Stores and retrieves object files.
+
+        Args:
+            directory (str): The directory containing the cache. It is created if it does not exist.
+
+        Optional Args:
+            max_size (int): The maximum size of the cache, in bytes. When it is exceeded, the least recently used objects are removed.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.objects_dir = os.path.join(directory, "objects")
+        self.stats_path = os.path.join(directory, "stats.json")
+        self.lock_path = os.path.join(directory, "lock")
+
+    # Identifies the installed version of a compiler by the resolved path, modification time and size of its executable,
+    # so that upgrading the compiler invalidates objects it built before. Returns an empty string if it cannot be found.
+    @staticmethod
+    def compiler_identity(compiler: str) -> str:
+        path = shutil.which(compiler)
+        if not path:
+            return ""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    # Computes the key for an object. The salt identifies the compiler and flags. Inputs are labeled with their paths
+    # relative to root, so that moving code between files changes the key.
+    @staticmethod
+    def key(salt: str, inputs: List[str], root: str="") -> str:
+        digest = hashlib.blake2b(f"{ObjectCache.VERSION}\0{salt}".encode(), digest_size=20)
+        for path in sorted(inputs):
+            label = os.path.relpath(path, root) if root else path
+            digest.update(f"\0{label}\0".encode())
+            with open(path, "rb") as inputf:
+                for block in iter(lambda: inputf.read(65536), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.objects_dir, key[:2], f"{key}.o")
+
+    # Applies changes to the statistics file while holding the cache lock, and returns the new statistics.
+    def _update_stats(self, **deltas) -> Dict[str, int]:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = self._read_stats()
+            for name, delta in deltas.items():
+                stats[name] = stats.get(name, 0) + delta
+            if stats["size"] > self.max_size:
+                self._evict(stats)
+            tmp_path = f"{self.stats_path}.tmp{os.getpid()}"
+            with open(tmp_path, "w") as outf:
+                json.dump(stats, outf, sort_keys=True)
+            os.replace(tmp_path, self.stats_path)
+            return stats
+
+    def _read_stats(self) -> Dict[str, int]:
+        stats = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "size": 0}
+        try:
+            with open(self.stats_path, "r") as inf:
+                stats.update(json.load(inf))
+        except (OSError, ValueError):
+            pass
+        return stats
+
+    # Removes the least recently used entries until the cache is at 90% of its maximum size. Must be called with the lock held.
+    def _evict(self, stats: Dict[str, int]) -> None:
+        entries = []
+        for root, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime_ns, info.st_size, path))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        count = len(entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size * 0.9:
+                break
+            os.remove(path)
+            size -= entry_size
+            count -= 1
+            stats["evictions"] += 1
+        # Recount, since entries may have been added or removed outside of this cache.
+        stats["size"] = size
+        stats["entries"] = count
+
+    def fetch(self, key: str, output: str) -> bool:
+        """
+        Copies a cached object to the output path if there is one.
+
+        Returns:
+            bool: Whether the object was found.
+        """
+        entry = self._entry_path(key)
+        try:
+            shutil.copyfile(entry, output)
+        except OSError:
+            self._update_stats(misses=1)
+            return False
+        # Mark the entry as recently used.
+        os.utime(entry)
+        self._update_stats(hits=1)
+        return True
+
+    def store(self, key: str, output: str) -> None:
+        entry = self._entry_path(key)
+        if os.path.exists(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_entry = f"{entry}.tmp{os.getpid()}"
+        shutil.copyfile(output, tmp_entry)
+        os.replace(tmp_entry, entry)
+        self._update_stats(entries=1, size=os.path.getsize(entry))
+
+    def stats(self) -> Dict[str, int]:
+        return self._read_stats()
+
+    def compile(self, key: str, output: str, command: List[str]) -> int:
+        """
+        Retrieves an object from the cache, or runs the command that produces it and adds the result to the cache.
+
+        Args:
+            key (str): The key of the object.
+            output (str): The path the object should be written to.
+            command (List[str]): The command that compiles the object.
+
+        Returns:
+            int: The exit code of the command, or 0 if the object was found in the cache.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        if self.fetch(key, output):
+            return 0
+        status = subprocess.call(command)
+        if status == 0 and os.path.isfile(output):
+            self.store(key, output)
+        return status
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="A content-addressed cache for object files.")
+    # Subcommands are checked manually, since add_subparsers only accepts required from Python 3.7.
+    subparsers = parser.add_subparsers(dest="action")
+    compile_parser = subparsers.add_parser("compile", help="Runs a compile command, unless its output is already cached.")
+    compile_parser.add_argument("--dir", required=True, help="The cache directory.")
+    compile_parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE, help="The maximum size of the cache, in bytes.")
+    compile_parser.add_argument("--salt", default="", help="Identifies the compiler and flags.")
+    compile_parser.add_argument("--compiler", default="", help="The compiler executable. Its installed version is added to the salt.")
+    compile_parser.add_argument("--root", default="", help="Inputs are identified by their paths relative to this directory.")
+    compile_parser.add_argument("--output", required=True, help="The object file produced by the command.")
+    compile_parser.add_argument("--inputs", nargs="*", default=[], help="The source file and every header it depends on.")
+    compile_parser.add_argument("command", nargs=argparse.REMAINDER, help="The compile command, after a '--'.")
+    stats_parser = subparsers.add_parser("stats", help="Displays cache statistics.")
+    stats_parser.add_argument("--dir", required=True, help="The cache directory.")
+    args = parser.parse_args(argv)
+    if not args.action:
+        parser.error("An action is required: compile or stats.")
+
+    if args.action == "stats":
+        stats = ObjectCache(args.dir).stats()
+        lookups = stats["hits"] + stats["misses"]
+        print(f"Object cache: {args.dir}")
+        print(f"\thits: {stats['hits']}\n\tmisses: {stats['misses']}\n\thit rate: {100.0 * stats['hits'] / lookups if lookups else 0.0:.1f}%")
+        print(f"\tentries: {stats['entries']}\n\tsize: {stats['size']} bytes\n\tevictions: {stats['evictions']}")
+        return 0
+
+    command = args.command[1:] if args.command and args.command[0] == "--" else args.command
+    if not command:
+        parser.error("No compile command provided.")
+    cache = ObjectCache(args.dir, args.max_size)
+    salt = f"{args.salt}\0{ObjectCache.compiler_identity(args.compiler)}" if args.compiler else args.salt
+    return cache.compile(ObjectCache.key(salt, args.inputs, args.root), args.output, command)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+from msquared import utils
+from msquared.Logger import Logger
+from typing import Dict, Iterable, List, Set, Tuple
+import threading
+import os
+
+# Resolves relative paths, like the targets of include directives, against a list of search directories.
+# Each directory is walked once to build an in-memory index of the files and directories inside it, so resolving
+# a path does not require a stat call per directory. Results are memoized, since the same include
+# is usually resolved for many files.
+# NOTE: Files created after a directory has been indexed will not be found. Indexing suits include directories, which are
+# searched many times. Other lookups, like those for sources in project directories that may contain entire build trees,
+# should not be indexed, and are checked directly instead.
+class PathResolver(object):
+    def __init__(self, logger: Logger, excluded_dirs: Set[str]=set()):
+        """
+        Locates files in search directories.
+
+        Args:
+            logger (Logger): The logger to use.
+
+        Optional Args:
+            excluded_dirs (Set[str]): Absolute paths of directories that should never be indexed, like the build directory.
+        """
+        self.logger = logger
+        self.excluded_dirs: Set[str] = set(excluded_dirs)
+        # Maps each indexed directory to the relative paths it contains.
+        self.index: Dict[str, Set[str]] = {}
+        self.memo: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+        self.stat_calls = 0
+        self.lock = threading.Lock()
+
+    # Directories are searched in the order provided. Unordered collections are sorted so that results are deterministic.
+    @staticmethod
+    def _search_order(dirs) -> Tuple[str, ...]:
+        if isinstance(dirs, (list, tuple)):
+            return tuple(dirs)
+        return tuple(sorted(utils.convert_to_set(dirs)))
+
+    def _index_dir(self, dir: str) -> Set[str]:
+        with self.lock:
+            if dir in self.index:
+                return self.index[dir]
+            entries = set()
+            visited = set()
+            for root, dirnames, filenames in os.walk(dir, followlinks=True):
+                # Guard against symlink loops.
+                realpath = os.path.realpath(root)
+                if realpath in visited:
+                    dirnames[:] = []
+                    continue
+                visited.add(realpath)
+                dirnames[:] = [name for name in dirnames if name != ".git" and os.path.join(root, name) not in self.excluded_dirs]
+                relroot = os.path.relpath(root, dir)
+                for name in dirnames + filenames:
+                    entries.add(os.path.normpath(os.path.join(relroot, name)))
+            self.logger.debug("Indexed %d paths in %s", len(entries), dir)
+            self.index[dir] = entries
+            return entries
+
+    def resolve(self, path: str, dirs: Iterable[str], indexed=True) -> str:
+        """
+        Finds the first search directory containing the provided path.
+
+        Args:
+            path (str): The relative path to search for.
+            dirs (Iterable[str]): The directories to search in. These should be absolute paths.
+
+        Optional Args:
+            indexed (bool): Whether to index the directories and memoize the result. Otherwise, each candidate path is checked directly, so files created since an earlier lookup are found.
+
+        Returns:
+            str: The absolute path of the file, or None if it could not be found.
+        """
+        dirs = PathResolver._search_order(dirs)
+        key = (path, dirs)
+        if indexed and key in self.memo:
+            return self.memo[key]
+        abspath = None
+        relpath = os.path.normpath(path)
+        for dir in dirs:
+            if not indexed or os.path.isabs(relpath) or relpath.startswith(os.pardir):
+                # Paths that leave the search directory are not part of the index.
+                self.stat_calls += 1
+                found = os.path.exists(os.path.join(dir, relpath))
+            else:
+                found = relpath in self._index_dir(dir)
+            if found:
+                abspath = os.path.abspath(os.path.join(dir, relpath))
+                self.logger.debug("Found %s in %s. Using absolute path: %s", path, dir, abspath)
+                break
+        if indexed:
+            self.memo[key] = abspath
+        return abspath
+
+    def locate_paths(self, paths: Set[str], dirs: Iterable[str], ErrorType: type = None, indexed=True) -> Set[str]:
+        """
+        Attemps to locate paths in the specified directories. This behaves the same way as utils.locate_paths.
+
+        Args:
+            paths (Set[str]): The paths to search for.
+            dirs (Iterable[str]): The directories to search in. These should be absolute paths.
+            ErrorType (type): If provided, throws this type of error when a file cannot be found.
+            indexed (bool): Whether to use directory indices. See resolve.
+
+        Returns:
+            If ErrorType is set:
+                Set[str]: A set of absolute paths corresponding to the files found.
+            otherwise:
+                Tuple[Set[str], Set[str]]: A tuple whose first element is a set of absolute paths for files that were found, and whose second element is a set of paths for files that could not be found.
+        """
+        abspaths = set()
+        notfound = set()
+        for path in utils.convert_to_set(paths):
+            if os.path.isabs(path):
+                self.stat_calls += 1
+                if os.path.exists(path):
+                    self.logger.debug("%s is already absolute.", path)
+                    abspaths.add(path)
+                    continue
+            abspath = self.resolve(path, dirs, indexed)
+            if abspath:
+                abspaths.add(abspath)
+            else:
+                self.logger.error(f"Could not find {path} in directories: {dirs}.", ErrorType)
+                notfound.add(path)
+        if ErrorType:
+            return abspaths
+        return abspaths, notfound
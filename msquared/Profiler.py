@@ -0,0 +1,56 @@
+from typing import Dict
+import contextlib
+import threading
+import time
+
+# Collects timings for phases of generation, as well as counters. Phases may be timed from multiple threads,
+# in which case their times are summed, so the total for a phase can exceed the wall time.
+# Phases can be nested by naming them with a common prefix, e.g. scan and scan.lex.
+class Profiler(object):
+    def __init__(self):
+        self.times: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.times[name] = self.times.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, value: int=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Sets a counter that describes the latest result rather than a running total, like the size of the last file generated.
+    def set(self, name: str, value: int) -> None:
+        with self.lock:
+            self.counters[name] = value
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Returns:
+            Dict[str, Dict]: Maps "phases" to the total seconds spent in each phase, "calls" to the number of times each phase was entered, and "counters" to the value of each counter.
+        """
+        with self.lock:
+            return {"phases": dict(self.times), "calls": dict(self.calls), "counters": dict(self.counters)}
+
+    # Formats statistics for logging. Defaults to the statistics collected by this profiler.
+    def report(self, stats: Dict[str, Dict]=None) -> str:
+        stats = stats if stats else self.stats()
+        lines = ["Generation statistics:"]
+        for name, seconds in sorted(stats["phases"].items()):
+            # Indent nested phases under their parents.
+            indent = "\t" * (name.count(".") + 1)
+            lines.append(f"{indent}{name}: {seconds * 1000:.2f}ms ({stats['calls'][name]} calls)")
+        for name, value in sorted(stats["counters"].items()):
+            lines.append(f"\t{name}: {value}")
+        return "\n".join(lines)
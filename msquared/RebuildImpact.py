@@ -0,0 +1,270 @@
+from msquared.IncludeGraph import IncludeGraph
+from msquared import utils
+from msquared.BuildTimer import BuildTimer
+from typing import Dict, List, Set, Tuple
+import argparse
+import json
+import sys
+import os
+
+# Estimates how expensive it is to change each header, i.e. how many objects and linked targets an incremental build
+# would rebuild, weighted by how long those objects take to compile.
+# The analysis works on a graph manifest, which MGen writes next to the scan cache whenever it writes a build file.
+# The manifest lists every file in the include graph along with its direct includes, every object with the files it is
+# compiled from (its sources and precompiled headers), and every linked target with its objects and internal libraries.
+class RebuildImpact(object):
+    MANIFEST_VERSION = 1
+
+    def __init__(self, manifest: Dict, timings: Dict[str, Dict]={}, variant: str=""):
+        """
+        Analyzes a graph manifest.
+
+        Args:
+            manifest (Dict): The graph manifest, as returned by MGen.graph_manifest().
+
+        Optional Args:
+            timings (Dict[str, Dict]): Build step records from a BuildTimer log, keyed by output. These are used as the compile and link costs where available.
+            variant (str): If provided, only objects and targets in this variant are considered.
+        """
+        if manifest.get("version") != RebuildImpact.MANIFEST_VERSION:
+            raise ValueError(f"Unsupported graph manifest version: {manifest.get('version')}. Expected: {RebuildImpact.MANIFEST_VERSION}")
+        self.files: List[str] = manifest["files"]
+        self.graph = IncludeGraph()
+        for file, includes in zip(self.files, manifest["edges"]):
+            self.graph.add_file(file, [self.files[include] for include in includes])
+        self.objects = [obj for obj in manifest["objects"] if not variant or obj["variant"] == variant]
+        self.targets = [target for target in manifest["targets"] if not variant or target["variant"] == variant]
+        self.timings = timings
+        self.sizes: Dict[str, int] = {}
+
+    @staticmethod
+    def load(manifest_path: str, timing_log: str="", variant: str="") -> "RebuildImpact":
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        return RebuildImpact(manifest, BuildTimer(timing_log).records() if timing_log else {}, variant)
+
+    def _size(self, path: str) -> int:
+        if path not in self.sizes:
+            self.sizes[path] = os.path.getsize(path) if os.path.isfile(path) else 0
+        return self.sizes[path]
+
+    # The files that cause an object to be rebuilt when they change: its sources, and everything they include.
+    def object_dependencies(self, obj: Dict) -> Set[str]:
+        dependencies = utils.read_depfile(obj.get("depfile"))
+        if dependencies is None:
+            dependencies = set()
+            for file in obj["sources"] + obj["precompiled_headers"]:
+                dependencies.add(self.files[file])
+                dependencies |= self.graph.transitive(self.files[file])
+        return dependencies
+
+    def object_costs(self, dependencies: Dict[str, Set[str]]) -> Tuple[Dict[str, float], str]:
+        """
+        Estimates the cost of compiling each object. If any objects have recorded compile times, costs are in seconds,
+        and objects without a recorded time are estimated from the number of bytes they compile, at the average rate
+        of the recorded objects. Otherwise, costs are the number of bytes each object compiles.
+
+        Args:
+            dependencies (Dict[str, Set[str]]): Maps each object to the files it depends on.
+
+        Returns:
+            Tuple[Dict[str, float], str]: The cost of each object, and the unit of the costs.
+        """
+        sizes = {obj: sum(self._size(path) for path in files) for obj, files in dependencies.items()}
+        timed = [obj for obj in sizes if obj in self.timings]
+        timed_bytes = sum(sizes[obj] for obj in timed)
+        if not timed or not timed_bytes:
+            return {obj: float(size) for obj, size in sizes.items()}, "bytes"
+        seconds_per_byte = sum(self.timings[obj]["duration"] for obj in timed) / timed_bytes
+        return {obj: self.timings[obj]["duration"] if obj in self.timings else size * seconds_per_byte for obj, size in sizes.items()}, "seconds"
+
+    # Maps each file to the files that include it directly.
+    def _includers(self) -> Dict[str, Set[str]]:
+        includers: Dict[str, Set[str]] = {}
+        for file in self.graph.files():
+            for include in self.graph.direct(file):
+                includers.setdefault(include, set()).add(file)
+        return includers
+
+    # Maps each object and library to the targets that link it.
+    def _linkers(self) -> Dict[str, List[str]]:
+        linkers: Dict[str, List[str]] = {}
+        for target in self.targets:
+            for dependency in target["objects"] + target["libraries"]:
+                linkers.setdefault(dependency, []).append(target["path"])
+        return linkers
+
+    # The targets that must be relinked when the provided objects change, including targets that link relinked libraries.
+    @staticmethod
+    def _relinked(objects: List[str], linkers: Dict[str, List[str]]) -> Set[str]:
+        targets = set()
+        pending = list(objects)
+        while pending:
+            for target in linkers.get(pending.pop(), []):
+                if target not in targets:
+                    targets.add(target)
+                    pending.append(target)
+        return targets
+
+    def affected(self, changed_paths: List[str]) -> Dict[str, List[str]]:
+        """
+        Finds everything that must be rebuilt after some files change.
+
+        Args:
+            changed_paths (List[str]): The absolute paths of the files that changed. Files the build does not depend on are ignored.
+
+        Returns:
+            Dict[str, List[str]]: Maps "objects", "libraries" and "executables" to the sorted paths of those that must be rebuilt.
+        """
+        changed = set(changed_paths)
+        # Every file that includes a changed file, directly or indirectly, is effectively changed as well.
+        includers = self._includers()
+        reached = set(changed)
+        pending = list(changed)
+        while pending:
+            for includer in includers.get(pending.pop(), ()):
+                if includer not in reached:
+                    reached.add(includer)
+                    pending.append(includer)
+        objects = []
+        for obj in self.objects:
+            dependencies = utils.read_depfile(obj.get("depfile"))
+            if dependencies is not None:
+                if not dependencies.isdisjoint(changed):
+                    objects.append(obj["path"])
+            elif any(self.files[file] in reached for file in obj["sources"] + obj["precompiled_headers"]):
+                objects.append(obj["path"])
+        targets = RebuildImpact._relinked(objects, self._linkers())
+        kinds = {target["path"]: target["kind"] for target in self.targets}
+        return {"objects": sorted(objects),
+                "libraries": sorted(target for target in targets if kinds[target] == "library"),
+                "executables": sorted(target for target in targets if kinds[target] == "executable")}
+
+    # Finds a shortest include chain from a source of one of the objects to a header, by searching backwards through includers.
+    def _include_chain(self, header: str, includers: Dict[str, Set[str]], sources: Set[str]) -> List[str]:
+        parents = {header: None}
+        frontier = [header]
+        while frontier:
+            next_frontier = []
+            for file in sorted(frontier):
+                if file in sources and file != header:
+                    chain = [file]
+                    while parents[chain[-1]]:
+                        chain.append(parents[chain[-1]])
+                    return chain
+                for includer in sorted(includers.get(file, ())):
+                    if includer not in parents:
+                        parents[includer] = file
+                        next_frontier.append(includer)
+            frontier = next_frontier
+        return [header]
+
+    def analyze(self, count: int=0, includer_count: int=3) -> Dict:
+        """
+        Computes the rebuild impact of every header.
+
+        Optional Args:
+            count (int): The number of headers to report, starting with the most expensive. Reports every header if this is 0.
+            includer_count (int): The number of direct includers to list for each header.
+
+        Returns:
+            Dict: The unit of costs, the cost of a full build, and for each header, sorted by decreasing cost:
+                the objects and targets that rebuild when it changes, the cost of rebuilding them, that cost as a fraction of a full build,
+                the direct includers responsible for the most objects, and a shortest include chain from a source.
+        """
+        dependencies = {obj["path"]: self.object_dependencies(obj) for obj in self.objects}
+        costs, unit = self.object_costs(dependencies)
+        link_costs = {target["path"]: self.timings[target["path"]]["duration"] if unit == "seconds" and target["path"] in self.timings else 0.0 for target in self.targets}
+        total_cost = sum(costs.values()) + sum(link_costs.values())
+
+        sources = set(self.files[file] for obj in self.objects for file in obj["sources"])
+        objects_by_file: Dict[str, List[str]] = {}
+        for obj, files in dependencies.items():
+            for file in files:
+                objects_by_file.setdefault(file, []).append(obj)
+        linkers = self._linkers()
+        includers = self._includers()
+
+        headers = []
+        for header, objects in objects_by_file.items():
+            if header in sources:
+                continue
+            targets = RebuildImpact._relinked(objects, linkers)
+            cost = sum(costs[obj] for obj in objects) + sum(link_costs.get(target, 0.0) for target in targets)
+            headers.append({"header": header, "cost": cost, "share": cost / total_cost if total_cost else 0.0, "objects": len(objects), "targets": len(targets)})
+        headers.sort(key=lambda entry: (-entry["cost"], -entry["objects"], entry["header"]))
+        headers = headers[:count] if count else headers
+
+        for entry in headers:
+            header = entry["header"]
+            affected = objects_by_file[header]
+            # An includer is responsible for every object that depends on both it and the header.
+            responsible = {includer: sum(1 for obj in affected if includer in dependencies[obj]) for includer in includers.get(header, ()) if includer != header}
+            ranked = sorted(responsible.items(), key=lambda item: (-item[1], item[0]))[:includer_count]
+            entry["includers"] = [{"includer": includer, "objects": num} for includer, num in ranked]
+            entry["chain"] = self._include_chain(header, includers, sources)
+        return {"unit": unit, "total_cost": total_cost, "objects": len(self.objects), "targets": len(self.targets), "headers": headers}
+
+    def report(self, count: int=20) -> str:
+        """
+        Summarizes the headers with the highest rebuild cost.
+
+        Optional Args:
+            count (int): The number of headers to list.
+
+        Returns:
+            str: The report.
+        """
+        analysis = self.analyze(count)
+        def format_cost(cost):
+            return f"{cost:.2f}s" if analysis["unit"] == "seconds" else f"{cost / 1024:.1f}KB"
+        lines = [f"Rebuild impact over {analysis['objects']} objects and {analysis['targets']} targets (full build: {format_cost(analysis['total_cost'])}):"]
+        for entry in analysis["headers"]:
+            lines.append(f"\t{format_cost(entry['cost']):>10} {entry['share'] * 100:5.1f}% {entry['objects']:>6} objects {entry['targets']:>4} targets  {entry['header']}")
+            for includer in entry["includers"]:
+                lines.append(f"\t\tvia {includer['includer']} ({includer['objects']} objects)")
+            if len(entry["chain"]) > 1:
+                lines.append(f"\t\tchain: {' -> '.join(entry['chain'])}")
+        return "\n".join(lines)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="msquared impact", description="Reports which headers cause the most expensive incremental rebuilds.")
+    parser.add_argument("--manifest", default=os.path.join("build", ".msquared", "graph.json"), help="The graph manifest written by MGen, in the build directory.")
+    parser.add_argument("--timing-log", default="", help="A build timing log, so that recorded compile and link times are used as costs. Defaults to the log next to the manifest, if there is one.")
+    parser.add_argument("--variant", default="", help="Only consider objects and targets in this variant.")
+    parser.add_argument("--count", type=int, default=20, help="The number of headers to report. Use 0 to report every header.")
+    parser.add_argument("--json", action="store_true", help="Print the analysis as JSON.")
+    args = parser.parse_args(argv)
+
+    timing_log = args.timing_log
+    if not timing_log:
+        default_log = os.path.join(os.path.dirname(args.manifest), "build_times.jsonl")
+        timing_log = default_log if os.path.isfile(default_log) else ""
+    impact = RebuildImpact.load(args.manifest, timing_log, args.variant)
+    if args.json:
+        print(json.dumps(impact.analyze(args.count), indent=4, sort_keys=True))
+    else:
+        print(impact.report(args.count))
+    return 0
+
+def affected_main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="msquared affected", description="Lists the targets that must be rebuilt after some files change, e.g. those from git diff --name-only.")
+    parser.add_argument("files", nargs="*", help="The changed files. If none are provided, they are read from stdin, one per line.")
+    parser.add_argument("--manifest", default=os.path.join("build", ".msquared", "graph.json"), help="The graph manifest written by MGen, in the build directory.")
+    parser.add_argument("--root", default=os.curdir, help="The directory relative paths are relative to.")
+    parser.add_argument("--variant", default="", help="Only consider objects and targets in this variant.")
+    parser.add_argument("--objects", action="store_true", help="List affected objects instead of linked targets, e.g. to only check that changes compile.")
+    parser.add_argument("--json", action="store_true", help="Print affected objects, libraries and executables as JSON.")
+    args = parser.parse_args(argv)
+
+    files = args.files if args.files else [line.strip() for line in sys.stdin if line.strip()]
+    affected = RebuildImpact.load(args.manifest, variant=args.variant).affected([os.path.abspath(os.path.join(args.root, file)) for file in files])
+    if args.json:
+        print(json.dumps(affected, indent=4, sort_keys=True))
+    else:
+        for path in affected["objects"] if args.objects else affected["libraries"] + affected["executables"]:
+            print(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
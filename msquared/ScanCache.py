@@ -0,0 +1,128 @@
+from msquared.Logger import Logger
+from typing import Dict, Set
+import hashlib
+import json
+import os
+import threading
+
+# Persistent, on-disk cache of include scans. Each entry records the direct includes of a file,
+# keyed by the file's path, mtime and size. When the mtime changes but the size does not,
+# a content hash is used to decide whether the entry is still valid.
+# Since scanning may stop before the end of a file, the hash only covers the bytes the scanner read.
+# Only the raw includes are stored. How they resolve depends on the contents of the include directories,
+# which can change without the file changing, so includes are resolved again on every run.
+class ScanCache(object):
+    VERSION = 3
+
+    def __init__(self, path: str, logger: Logger, enabled=True, scanner=""):
+        """
+        Caches the results of include scanning across runs.
+
+        Args:
+            path (str): The path of the cache file. This is normally inside the build directory.
+            logger (Logger): The logger to use.
+
+        Optional Args:
+            enabled (bool): Whether to read from and write to disk at all.
+            scanner (str): Identifies how includes were found. Caches written by a different scanner are ignored.
+        """
+        self.path = path
+        self.logger = logger
+        self.enabled = enabled
+        self.scanner = scanner
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self.loaded = False
+        self.dirty = False
+        # Files may be scanned from multiple threads.
+        self.lock = threading.Lock()
+
+    def set_path(self, path: str) -> None:
+        if path != self.path:
+            self.path = path
+            self.loaded = False
+            self.entries = {}
+
+    def _load(self) -> None:
+        self.loaded = True
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as cache_file:
+                contents = json.load(cache_file)
+        except (OSError, ValueError) as err:
+            self.logger.warning(f"Could not read scan cache {self.path} ({err}). Ignoring it.")
+            return
+        if contents.get("version") != ScanCache.VERSION or contents.get("scanner") != self.scanner:
+            self.logger.debug("Scan cache %s has an incompatible version. Ignoring it.", self.path)
+            return
+        self.entries = contents.get("entries", {})
+        self.logger.debug("Loaded %d entries from scan cache %s", len(self.entries), self.path)
+
+    def _count(self, counter: str) -> None:
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, filename: str) -> Set[str]:
+        """
+        Looks up the scan results for a file.
+
+        Args:
+            filename (str): The absolute path of the file.
+
+        Returns:
+            Set[str]: The raw includes of the file, or None if the entry is missing or stale.
+        """
+        with self.lock:
+            if not self.loaded:
+                self._load()
+        entry = self.entries.get(filename)
+        if entry is None:
+            self._count("misses")
+            return None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            self._count("misses")
+            return None
+        if entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            # Files that are touched but not modified can still be reused if the contents are unchanged.
+            if entry["size"] != stat.st_size:
+                self._count("misses")
+                return None
+            with open(filename, "rb") as source_file:
+                if hashlib.blake2b(source_file.read(entry["hashed_size"]), digest_size=16).hexdigest() != entry["hash"]:
+                    self._count("misses")
+                    return None
+            self._count("hash_hits")
+            entry["mtime"] = stat.st_mtime_ns
+            self.dirty = True
+        self._count("hits")
+        return set(entry["includes"])
+
+    def store(self, filename: str, digest: str, hashed_size: int, includes: Set[str]) -> None:
+        stat = os.stat(filename)
+        self.entries[filename] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": digest,
+            "hashed_size": hashed_size,
+            "includes": sorted(includes),
+        }
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.enabled or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump({"version": ScanCache.VERSION, "scanner": self.scanner, "entries": self.entries}, cache_file)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        self.logger.debug("Wrote %d entries to scan cache %s", len(self.entries), self.path)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "hash_hits": self.hash_hits, "misses": self.misses, "entries": len(self.entries)}
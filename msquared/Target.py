@@ -1,22 +1,30 @@
-from typing import List, Set, Dict
+from typing import List, Set, Dict, Tuple
 from msquared import utils
 from msquared.Logger import Logger
+from msquared import Ninja
+from msquared import ObjectCache
+from msquared import BuildTimer
+import hashlib
+import shlex
 import sys
 import os
 
 # Represents a target in a makefile. This consists of a name, dependencies, and commands.
 class MakefileTarget(object):
-    def __init__(self, name: str, dependencies = set(), commands = [], phony = False, help=""):
+    def __init__(self, name: str, dependencies = set(), commands = [], phony = False, help="", kind=""):
         self.name = name
         self.dependencies = utils.convert_to_set(dependencies)
         self.commands = utils.convert_to_list(commands)
         self.phony = phony
         self.help = help
+        # The kind of build step, e.g. compile or link. This is used to schedule steps when building without make.
+        self.kind = kind
 
     def __str__(self):
         cmd_sep = "\n\t$(AT)"
         phony_line = f".PHONY: {self.name}"
-        target_line = f"{self.name}:{utils.prefix_join(self.dependencies)}{utils.prefix_join(self.commands, cmd_sep)}"
+        # Dependencies are sorted so that the output is deterministic.
+        target_line = f"{self.name}:{utils.prefix_join(sorted(self.dependencies))}{utils.prefix_join(self.commands, cmd_sep)}"
         return f"{phony_line}\n{target_line}" if self.phony else f"{target_line}"
 
     def __repr__(self):
@@ -34,7 +42,7 @@ class MakefileTarget(object):
 # (based on deps), as well as lflags and link_dirs which it uses.
 # TODO: Change shell commands to the same way compilers are done.
 class Target(object):
-    def __init__(self, name: str, path: str, source_map=set(), libraries=set(), cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), compiler="", logger=Logger(), obj_out_dir="", install_dir=""):
+    def __init__(self, name: str, path: str, source_map=set(), libraries=set(), cflags=set(), include_dirs=set(), lflags=set(), link_dirs=set(), compiler="", logger=Logger(), obj_out_dir="", install_dir="", root_dir="", depfiles=False, unity_dir="", unity_batch_size=0, unity_exclude=set(), object_cache="", object_cache_size=ObjectCache.DEFAULT_MAX_SIZE, lto_mode=None, lto_partition="", timing_log=""):
         """
         Represents an executable or library.
 
@@ -53,6 +61,16 @@ class Target(object):
             logger (Logger): The logger to use.
             obj_out_dir (str): The output directory for intermediate build artifacts.
             install_dir (str): The directory to install the final build artifact to.
+            root_dir (str): The project root directory. Object files are named based on source paths relative to this directory.
+            depfiles (bool): Whether header dependencies come from dependency files written by the compiler, rather than from source_map.
+            unity_dir (str): The directory to write unity sources to.
+            unity_batch_size (int): The maximum number of sources to combine into each unity source. Sources are compiled individually if this is less than 2.
+            unity_exclude (Set[str]): Sources that should always be compiled individually.
+            object_cache (str): The directory of an object cache to check before compiling. Requires header dependencies in source_map.
+            object_cache_size (int): The maximum size of the object cache, in bytes.
+            lto_mode (str): How to parallelize link time optimization, e.g. "jobserver" or "auto". Defaults to the compiler's mode. Empty to link with the compiler's lto flag unchanged.
+            lto_partition (str): How to partition link time optimization, e.g. "balanced" or "one". Empty to use the compiler's default.
+            timing_log (str): If provided, the duration of every compile and link is recorded in this file.
         """
         self.path = path
         self.set_name(name)
@@ -65,6 +83,18 @@ class Target(object):
         self.link_dirs = link_dirs
         self.compiler = compiler
         self.logger = logger
+        self.root_dir = root_dir
+        self.depfiles = depfiles
+        self.unity_dir = unity_dir
+        self.unity_batch_size = unity_batch_size
+        self.unity_exclude = unity_exclude
+        self.object_cache = object_cache
+        self.object_cache_size = object_cache_size
+        self.lto_mode = lto_mode
+        self.lto_partition = lto_partition
+        self.timing_log = timing_log
+        # Maps precompiled headers to their header dependencies.
+        self.precompiled_headers: Dict[str, Set[str]] = {}
         self.install_dir = ""
         if install_dir and not os.path.isabs(install_dir):
             self.logger.warning(f"Install dir {install_dir} is not an absolute path. Will not install.")
@@ -81,43 +111,210 @@ class Target(object):
         self.cflags |= utils.convert_to_set(flags)
         self.lflags |= utils.convert_to_set(flags)
 
+    # The compiler, flags and include directories that determine whether two objects are equivalent.
+    def _flag_identity(self) -> List[str]:
+        # Some of the flags need to be sanitized first though.
+        return [self.compiler.name] + sorted(flag.replace("=", "eq") for flag in self.cflags) + sorted(self.include_dirs)
+
+    # Generates an object path for a source file. We name object files based on compiler + cflags + include_dirs,
+    # as well as the path of the source file relative to the project root. The assumption is that if these are the
+    # same between two objects, they are equivalent. Everything is sorted and hashed with a stable digest, so
+    # regenerating the Makefile with the same inputs produces the same object names.
+    def generate_object_path(self, source: str, human_readable_object_names=False) -> str:
+        relpath = os.path.relpath(source, self.root_dir) if self.root_dir else source
+        # Keep object files for sources outside the project root inside the object directory.
+        relpath = os.path.join(*[part if part != os.pardir else "__" for part in relpath.split(os.sep) if part])
+        name = os.path.splitext(os.path.basename(relpath))[0]
+        san_cflags = self._flag_identity()
+        if human_readable_object_names:
+            uid = "".join(san_cflags).replace(os.sep, "_").replace(" ", "")
+            # Mirror the source tree so that sources with the same name in different directories do not collide.
+            filename = os.path.join(os.path.dirname(relpath), f"{name}.{uid}.o")
+        else:
+            uid = hashlib.blake2b("\0".join(san_cflags + [relpath]).encode(), digest_size=8).hexdigest()
+            filename = f"{name}.{uid}.o"
+        self.logger.debug("For %s, using filename: %s and directory: %s", source, filename, self.obj_out_dir)
+        return os.path.join(self.obj_out_dir, filename)
+
+    def add_precompiled_header(self, header: str, dependencies=set()) -> None:
+        """
+        Precompiles a header with this target's flags, and includes it in every source file of this target.
+
+        Args:
+            header (str): The absolute path of the header.
+
+        Optional Args:
+            dependencies (Set[str]): The headers included by the header, directly or indirectly.
+        """
+        if not self.compiler or not self.compiler.precompiled_header:
+            self.logger.warning(f"{self.compiler.name if self.compiler else 'No compiler'} cannot precompile headers. Will not precompile {header} for {self.name}.")
+            return
+        self.precompiled_headers[header] = utils.convert_to_set(dependencies)
+
+    # Precompiled headers are only usable with the exact flags they were built with, so like objects,
+    # they are placed in a directory named after the flags, and the path of the header.
+    def precompiled_header_path(self, header: str) -> str:
+        relpath = os.path.relpath(header, self.root_dir) if self.root_dir else header
+        uid = hashlib.blake2b("\0".join(self._flag_identity() + [relpath]).encode(), digest_size=8).hexdigest()
+        return os.path.join(self.obj_out_dir, "pch", uid, f"{os.path.basename(header)}{self.compiler.precompiled_header_ext}")
+
+    # The path passed to the compiler to include a precompiled header. The compiler finds the precompiled header next to it.
+    def _precompiled_header_include(self, header: str) -> str:
+        return os.path.splitext(self.precompiled_header_path(header))[0]
+
+    # Generates the command that compiles a header into a precompiled header, with the same flags as objects.
+    def precompiled_header_command(self, header: str, output_path: str) -> str:
+        return f"{self.compiler.name} {self.compiler.precompiled_header} {header} -o {output_path}{utils.prefix_join(sorted(self.include_dirs), ' -I')} {' '.join(sorted(self.cflags))}"
+
+    # Generates the command that compiles a source file into an object file. Flags are emitted in canonical order.
+    # If depfile is provided, the compiler also writes the header dependencies of the source to that path.
+    def compile_command(self, source: str, object_path: str, depfile: str="", depfile_phony=False) -> str:
+        launcher = f"{self.compiler.launcher} " if self.compiler.launcher else ""
+        command = f"{launcher}{self.compiler.name} {source} -o {object_path}{utils.prefix_join(sorted(self.include_dirs), ' -I')} {' '.join(sorted(self.cflags))} {self.compiler.compile_only}"
+        for header in sorted(self.precompiled_headers):
+            command += f" {self.compiler.force_include} {self._precompiled_header_include(header)}"
+        if depfile:
+            command += f"{utils.prefix_join([self.compiler.depfile_phony] if depfile_phony and self.compiler.depfile_phony else [])} {self.compiler.depfile} {depfile}"
+        return command
+
+    # Identifies the compiler and flags in object cache keys. Include directories inside the project are relative,
+    # so that equivalent objects from different checkouts share cache entries.
+    def _object_cache_salt(self) -> str:
+        include_dirs = [os.path.relpath(dir, self.root_dir) if self.root_dir and not os.path.relpath(dir, self.root_dir).startswith(os.pardir) else dir for dir in self.include_dirs]
+        identity = [self.compiler.name] + sorted(self.cflags) + sorted(include_dirs) + sorted(os.path.basename(header) for header in self.precompiled_headers)
+        return hashlib.blake2b("\0".join(identity).encode(), digest_size=16).hexdigest()
+
+    # Everything besides the source that an object cache key must include: headers, and precompiled headers along with their headers.
+    def _object_cache_inputs(self, dependencies: Set[str]) -> List[str]:
+        inputs = set(dependencies)
+        for header, header_dependencies in self.precompiled_headers.items():
+            inputs |= set([header]) | header_dependencies
+        return sorted(inputs)
+
+    # Wraps a compile command so that the object cache is checked first, and populated afterwards.
+    def cached_compile_command(self, command: str, object_path: str, inputs: List[str]) -> str:
+        if not self.object_cache:
+            return command
+        return f"{sys.executable} {os.path.abspath(ObjectCache.__file__)} compile --dir {self.object_cache} --max-size {self.object_cache_size} --salt {self._object_cache_salt()} --compiler {self.compiler.name}{utils.prefix_join([f'--root {self.root_dir}'] if self.root_dir else [])} --output {object_path} --inputs{utils.prefix_join(inputs)} -- {command}"
+
+    # Wraps a build command so that its duration is recorded in the timing log.
+    # Inputs are the outputs of other build steps this one waited for, which are used to find the critical path.
+    def timed_command(self, command: str, output: str, kind: str, inputs: List[str]=[]) -> str:
+        if not self.timing_log:
+            return command
+        return f"{sys.executable} {os.path.abspath(BuildTimer.__file__)} run --log {self.timing_log} --output {output} --kind {kind}{utils.prefix_join(['--inputs'] + inputs if inputs else [])} -- {command}"
+
+    # The dependency file the compiler writes for an object file.
+    @staticmethod
+    def depfile_path(object_path: str) -> str:
+        return f"{os.path.splitext(object_path)[0]}.d"
+
+    # Groups sources into unity sources, each of which includes up to unity_batch_size sources. Sources are sorted and
+    # grouped by directory, so the batches only change when sources are added to or removed from the same directory.
+    # Batches with a single source are not worth combining, so those sources are compiled individually.
+    def unity_batches(self) -> Dict[str, List[str]]:
+        if self.unity_batch_size < 2 or not self.source_map or not self.compiler:
+            return {}
+        directories: Dict[str, List[str]] = {}
+        for source in sorted(self.source_map.keys()):
+            if source not in self.unity_exclude:
+                directories.setdefault(os.path.dirname(source), []).append(source)
+        batches = {}
+        for directory, sources in sorted(directories.items()):
+            reldir = os.path.relpath(directory, self.root_dir) if self.root_dir else directory
+            prefix = "_".join([part if part != os.pardir else "__" for part in reldir.split(os.sep) if part and part != os.curdir]) or "root"
+            for index in range(0, len(sources), self.unity_batch_size):
+                batch = sources[index:index + self.unity_batch_size]
+                if len(batch) > 1:
+                    batches[os.path.join(self.unity_dir, f"{prefix}.unity{index // self.unity_batch_size}.cpp")] = batch
+        return batches
+
+    # The contents of a unity source.
+    @staticmethod
+    def unity_source_lines(batch: List[str]) -> List[str]:
+        return ["// Automatically generated by msquared.MGen."] + [f'#include "{source}"' for source in batch]
+
+    # Maps the files that are actually compiled, i.e. unity sources and sources that are not part of one, to their dependencies.
+    # A unity source depends on the sources it includes, and all of their headers.
+    def compile_units(self) -> Dict[str, Set[str]]:
+        batches = self.unity_batches()
+        batched = set([source for batch in batches.values() for source in batch])
+        units = {source: headers for source, headers in self.source_map.items() if source not in batched}
+        for unity_source, batch in batches.items():
+            dependencies = set(batch)
+            for source in batch:
+                dependencies |= self.source_map[source]
+            units[unity_source] = dependencies
+        return units
+
+    # Generate MakefileTargets that recreate unity sources if they are removed, e.g. by a clean.
+    def generate_unity_targets(self) -> List[MakefileTarget]:
+        makefile_targets = []
+        for unity_source, batch in sorted(self.unity_batches().items()):
+            commands = []
+            commands.append(f"mkdir -p {os.path.dirname(unity_source)}")
+            commands.append(f"printf '%s\\n'{utils.prefix_join([shlex.quote(line) for line in Target.unity_source_lines(batch)])} > {unity_source}")
+            makefile_targets.append(MakefileTarget(name=unity_source, commands=commands, kind="generate"))
+        return makefile_targets
+
+    # The recipe shared by every object with this target's compiler and flags, as the name and body of a canned recipe.
+    # The source is passed as the first argument, and, with an object cache, the other cache inputs as the second.
+    # Recipes are named after a digest of their body, so targets with the same flags share a recipe.
+    def compile_recipe(self) -> Tuple[str, str]:
+        commands = []
+        commands.append("mkdir -p $(@D)")
+        commands.append('echo -e "\\e[32mCompiling $@\\e[0m"')
+        command = self.compile_command("$(1)", "$@", "$(basename $@).d" if self.depfiles else "", depfile_phony=True)
+        command = self.cached_compile_command(command, "$@", ["$(1)", "$(2)"])
+        commands.append(self.timed_command(command, "$@", "compile", [self.precompiled_header_path(header) for header in sorted(self.precompiled_headers)]))
+        # Each line needs its own prefix, since the prefix of the line that calls the recipe only applies to the first line.
+        body = "\n".join(f"$(AT){command}" for command in commands)
+        return f"msquared_compile_{hashlib.blake2b(body.encode(), digest_size=8).hexdigest()}", body
+
+    # The canned recipes used by this target's objects in compact Makefiles. See compile_recipe.
+    def generate_compile_recipes(self) -> Dict[str, str]:
+        if not self.source_map or not self.compiler:
+            return {}
+        name, body = self.compile_recipe()
+        return {name: body}
+
     # Generate a MakefileTarget for a source file.
-    def generate_object_target(self, source: str, human_readable_object_names=False) -> MakefileTarget:
-        # Generates an object name for this source file.
-        def generate_object_path(source):
-            # Prepare the target. We name object files based on compiler + cflags.
-            # The assumption is that if these are the same between two objects, they are equivalent.
-            # Some of the flags need to be sanitized first though.
-            san_cflags = [self.compiler.name] + [flag.replace("=", "eq") for flag in self.cflags] + utils.convert_to_list(self.include_dirs)
-            uid = f"{hash(tuple(san_cflags)) % ((sys.maxsize + 1) * 2)}"
-            if human_readable_object_names:
-                uid = f"{''.join(san_cflags)}"
-            filename = f"{os.path.basename(os.path.splitext(source)[0])}.{uid}.o"
-            self.logger.debug(f"For {source}, using filename: {filename} and directory: {self.obj_out_dir}")
-            return os.path.join(self.obj_out_dir, filename)
-
-        object_path = generate_object_path(source)
+    # If dependencies is not provided, the headers for the source are taken from source_map.
+    # If compact is True, the object uses the canned recipe from compile_recipe rather than spelling out its compile command.
+    def generate_object_target(self, source: str, human_readable_object_names=False, dependencies=None, compact=False) -> MakefileTarget:
+        object_path = self.generate_object_path(source, human_readable_object_names)
+        dependencies = self.source_map[source] if dependencies is None else dependencies
+        precompiled_headers = set([self.precompiled_header_path(header) for header in self.precompiled_headers])
+        arguments = [source] + ([" ".join(self._object_cache_inputs(dependencies - set([source])))] if self.object_cache else [])
+        # Arguments to call cannot contain commas or parentheses.
+        if compact and not any(char in argument for argument in arguments for char in ",()"):
+            name, _ = self.compile_recipe()
+            return MakefileTarget(name=object_path, dependencies=set([source]) | dependencies | precompiled_headers, commands=f"$(call {name},{','.join(arguments)})", kind="compile")
         commands = []
         # Make sure the directory exists when building the target.
         commands.append(f"mkdir -p {os.path.dirname(object_path)}")
         # Add compilation command.
         commands.append(f'echo -e "\\e[32mCompiling {object_path}\\e[0m"')
-        commands.append(f"{self.compiler.name} {source} -o {object_path}{utils.prefix_join(self.include_dirs, ' -I')} {' '.join(self.cflags)} {self.compiler.compile_only}")
-        return MakefileTarget(name=object_path, dependencies=set([source]) | self.source_map[source], commands=commands)
+        command = self.compile_command(source, object_path, Target.depfile_path(object_path) if self.depfiles else "", depfile_phony=True)
+        command = self.cached_compile_command(command, object_path, [source] + self._object_cache_inputs(dependencies - set([source])))
+        commands.append(self.timed_command(command, object_path, "compile", sorted(precompiled_headers)))
+        return MakefileTarget(name=object_path, dependencies=set([source]) | dependencies | precompiled_headers, commands=commands, kind="compile")
 
-    # TODO: Docstrings.
-    def generate_build_targets(self, library_registry: Dict[str, str], human_readable_object_names=False) -> List[MakefileTarget]:
-        if not self.source_map or not self.compiler:
-            return []
-        # First, generate all object targets.
+    # Generate a MakefileTarget for each precompiled header.
+    def generate_precompiled_header_targets(self) -> List[MakefileTarget]:
         makefile_targets = []
-        for source in self.source_map.keys():
-            self.logger.debug(f"Generating object target for {source}")
-            obj_target = self.generate_object_target(source, human_readable_object_names)
-            makefile_targets.append(obj_target)
+        for header, dependencies in sorted(self.precompiled_headers.items()):
+            output_path = self.precompiled_header_path(header)
+            commands = []
+            commands.append(f"mkdir -p {os.path.dirname(output_path)}")
+            commands.append(f'echo -e "\\e[32mPrecompiling {header}\\e[0m"')
+            commands.append(self.timed_command(self.precompiled_header_command(header, output_path), output_path, "pch"))
+            makefile_targets.append(MakefileTarget(name=output_path, dependencies=set([header]) | dependencies, commands=commands, kind="pch"))
+        return makefile_targets
 
-        objects = set([obj.name for obj in makefile_targets])
-        # Distinguish between libraries created internal to the project vs external dependencies.
+    # Distinguish between libraries created internal to the project vs external dependencies.
+    # Returns the paths of internal libraries, and the linker arguments for external libraries.
+    def link_libraries(self, library_registry: Dict[str, str]) -> Tuple[Set[str], Set[str]]:
         internal_libraries = set()
         external_libraries = set()
         for lib in self.libraries:
@@ -125,16 +322,150 @@ class Target(object):
                 internal_libraries.add(library_registry[lib])
             else:
                 external_libraries.add(utils.prefix("-l", lib) if not utils.hasext(lib) else lib)
+        return internal_libraries, external_libraries
 
+    # The dependency files the compiler writes while building this target, if any.
+    def generate_depfiles(self, human_readable_object_names=False) -> List[str]:
+        if not self.depfiles or not self.source_map or not self.compiler:
+            return []
+        return [Target.depfile_path(self.generate_object_path(source, human_readable_object_names)) for source in self.compile_units().keys()]
+
+    # The link time optimization mode to use, or an empty string if link time optimization is not parallelized.
+    # Without a jobserver, e.g. with ninja, the jobserver mode falls back to auto.
+    def _lto_mode(self, jobserver=True) -> str:
+        if not self.compiler or not self.compiler.lto or self.compiler.lto not in self.lflags:
+            return ""
+        mode = self.compiler.lto_mode if self.lto_mode is None else self.lto_mode
+        if mode == "jobserver" and not jobserver:
+            mode = "auto"
+        if mode and mode not in self.compiler.lto_modes:
+            self.logger.debug("%s does not support LTO mode: %s. Linking %s with %s.", self.compiler.name, mode, self.name, self.compiler.lto)
+            return ""
+        return mode
+
+    # Whether the link command should have access to make's jobserver, so that link time optimization runs in parallel within make's job limit.
+    # Only the jobserver mode needs this. Other modes do not, so their links are not run by make -n, -q or -t.
+    def uses_jobserver(self) -> bool:
+        return self._lto_mode() == "jobserver"
+
+    # The linker flags, with the compiler's lto flag replaced based on the LTO mode and partitioning, and the linker selected by the compiler's profile.
+    def link_flags(self, jobserver=True) -> Set[str]:
+        lflags = set(self.lflags) | (self.compiler.linker_flags() if self.compiler else set())
+        if not self.compiler or not self.compiler.lto or self.compiler.lto not in lflags:
+            return lflags
+        mode = self._lto_mode(jobserver)
+        if mode:
+            lflags.discard(self.compiler.lto)
+            lflags.add(self.compiler.lto_modes[mode])
+        if self.lto_partition and self.compiler.lto_partition:
+            lflags.add(f"{self.compiler.lto_partition}{self.lto_partition}")
+        return lflags
+
+    # Generates everything that follows the output path in the link command, in canonical order.
+    def link_arguments(self, library_registry: Dict[str, str], jobserver=True) -> str:
+        internal_libraries, external_libraries = self.link_libraries(library_registry)
+        return f"{utils.prefix_join(sorted(self.link_dirs), ' -L')} {' '.join(sorted(internal_libraries | external_libraries))} {' '.join(sorted(self.link_flags(jobserver)))}"
+
+    # TODO: Docstrings.
+    # If jobserver is False, the link command does not rely on make's jobserver, so that it can be run without make.
+    def generate_build_targets(self, library_registry: Dict[str, str], human_readable_object_names=False, compact=False, jobserver=True) -> List[MakefileTarget]:
+        if not self.source_map or not self.compiler:
+            return []
+        # First, generate all precompiled header and object targets.
+        makefile_targets = self.generate_precompiled_header_targets()
+        objects = set()
+        for source, dependencies in self.compile_units().items():
+            self.logger.debug("Generating object target for %s", source)
+            obj_target = self.generate_object_target(source, human_readable_object_names, dependencies, compact)
+            makefile_targets.append(obj_target)
+            objects.add(obj_target.name)
+        makefile_targets.extend(self.generate_unity_targets())
+
+        precompiled_headers = [self.precompiled_header_path(header) for header in sorted(self.precompiled_headers)]
+        internal_libraries, _ = self.link_libraries(library_registry)
         commands = []
         commands.append(f'echo -e "\\e[92m\\e[1mLinking {self.path}\\e[0m"')
-        commands.append(f"{self.compiler.name} {' '.join(objects)} -o {self.path}{utils.prefix_join(self.link_dirs, ' -L')} {' '.join(internal_libraries | external_libraries)} {' '.join(self.lflags)}")
+        # Recipes prefixed with + have access to make's jobserver. Note that make also runs them with -n, -q or -t.
+        prefix = "+" if jobserver and self.uses_jobserver() else ""
+        command = f"{self.compiler.name} {' '.join(sorted(objects))} -o {self.path}{self.link_arguments(library_registry, jobserver)}"
+        commands.append(f"{prefix}{self.timed_command(command, self.path, 'link', sorted(objects | internal_libraries))}")
         # Finally, generate a target for the final linked executable/library.
-        makefile_targets.append(MakefileTarget(name=self.path, dependencies=(objects | internal_libraries), commands=commands))
+        makefile_targets.append(MakefileTarget(name=self.path, dependencies=(objects | internal_libraries), commands=commands, kind="link"))
         # Add a clean target.
-        makefile_targets.append(MakefileTarget(name=self.clean_name, commands=f"rm -rf {self.path} {' '.join(objects)}", phony=True, help=f"Removes {self.name} and its constituent object files."))
+        intermediates = sorted(objects) + ([Target.depfile_path(obj) for obj in sorted(objects)] if self.depfiles else []) + precompiled_headers
+        # Split debug information is written next to each object.
+        if self.compiler.split_debug_flag and self.compiler.split_debug_flag in self.cflags:
+            intermediates += [f"{os.path.splitext(obj)[0]}.dwo" for obj in sorted(objects)]
+        makefile_targets.append(MakefileTarget(name=self.clean_name, commands=f"rm -rf {self.path} {' '.join(intermediates)}", phony=True, help=f"Removes {self.name} and its constituent object files."))
         return makefile_targets
 
+    def generate_ninja_builds(self, writer: Ninja.NinjaWriter, library_registry: Dict[str, str], emitted: Set[str], human_readable_object_names=False) -> None:
+        """
+        Adds rules and build statements for this target's objects and final build artifact to a ninja file.
+
+        Args:
+            writer (Ninja.NinjaWriter): The ninja file to add to.
+            library_registry (Dict[str, str]): Maps internal library names to their paths.
+            emitted (Set[str]): The rules and outputs already in the ninja file. Targets with the same compiler and flags share rules and objects.
+            human_readable_object_names (bool): Whether to name object files based on their flags rather than a digest of them.
+        """
+        if not self.source_map or not self.compiler:
+            return
+        # Each distinct compiler + flags combination gets its own rule.
+        command = self.cached_compile_command(self.compile_command("$in", "$out", "$out.d" if self.compiler.depfile else ""), "$out", ["$in", "$cache_inputs"])
+        command = self.timed_command(command, "$out", "compile", [self.precompiled_header_path(header) for header in sorted(self.precompiled_headers)])
+        compile_rule = f"compile_{hashlib.blake2b(command.encode(), digest_size=8).hexdigest()}"
+        if compile_rule not in emitted:
+            emitted.add(compile_rule)
+            depfile, deps = ("$out.d", "gcc") if self.compiler.depfile else ("", "")
+            writer.rule(compile_rule, Ninja.escape(command).replace("$$in", "$in").replace("$$out", "$out").replace("$$cache_inputs", "$cache_inputs"), description="Compiling $out", depfile=depfile, deps=deps)
+        link_command = self.timed_command(f"{self.compiler.name} $in -o $out $link_args", "$out", "link", ["$in"])
+        link_rule = f"link_{hashlib.blake2b(link_command.encode(), digest_size=8).hexdigest()}"
+        if link_rule not in emitted:
+            emitted.add(link_rule)
+            writer.rule(link_rule, Ninja.escape(link_command).replace("$$in", "$in").replace("$$out", "$out").replace("$$link_args", "$link_args"), description="Linking $out", pool="link_pool")
+
+        precompiled_headers = []
+        for header, dependencies in sorted(self.precompiled_headers.items()):
+            output_path = self.precompiled_header_path(header)
+            precompiled_headers.append(output_path)
+            if output_path in emitted:
+                continue
+            emitted.add(output_path)
+            command = self.timed_command(self.precompiled_header_command("$in", "$out"), "$out", "pch")
+            pch_rule = f"pch_{hashlib.blake2b(command.encode(), digest_size=8).hexdigest()}"
+            if pch_rule not in emitted:
+                emitted.add(pch_rule)
+                writer.rule(pch_rule, Ninja.escape(command).replace("$$in", "$in").replace("$$out", "$out"), description="Precompiling $in")
+            writer.build(output_path, pch_rule, inputs=header, implicit=sorted(dependencies))
+
+        for unity_source, batch in sorted(self.unity_batches().items()):
+            if unity_source in emitted:
+                continue
+            emitted.add(unity_source)
+            if "unity" not in emitted:
+                emitted.add("unity")
+                writer.rule("unity", "$cmd", description="Generating $out")
+            command = f"mkdir -p {os.path.dirname(unity_source)} && printf '%s\\n'{utils.prefix_join([shlex.quote(line) for line in Target.unity_source_lines(batch)])} > {unity_source}"
+            writer.build(unity_source, "unity", variables={"cmd": Ninja.escape(command)})
+
+        objects = []
+        for source, dependencies in sorted(self.compile_units().items()):
+            object_path = self.generate_object_path(source, human_readable_object_names)
+            objects.append(object_path)
+            if object_path in emitted:
+                continue
+            emitted.add(object_path)
+            # When the compiler reports header dependencies, ninja records them after the first build.
+            # Sources included by unity sources are always listed, since they are not headers.
+            headers = sorted(dependencies - set(self.source_map.keys())) if not self.compiler.depfile else []
+            headers = sorted(dependencies & set(self.source_map.keys())) + headers
+            variables = {"cache_inputs": Ninja.escape(" ".join(self._object_cache_inputs(dependencies - set([source]))))} if self.object_cache else {}
+            writer.build(object_path, compile_rule, inputs=source, implicit=headers + precompiled_headers, variables=variables)
+        internal_libraries, _ = self.link_libraries(library_registry)
+        writer.build(self.path, link_rule, inputs=objects, implicit=sorted(internal_libraries), variables={"link_args": Ninja.escape(" ".join(self.link_arguments(library_registry, jobserver=False).split()))})
+        writer.build(self.clean_name, "run", variables={"cmd": Ninja.escape(f"rm -rf {self.path} {' '.join(objects + precompiled_headers)}"), "desc": self.clean_name})
+
     def generate_phony_target(self) -> List[MakefileTarget]:
         if self.name == self.path or not self.source_map or not self.compiler:
             return []
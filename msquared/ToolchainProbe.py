@@ -0,0 +1,129 @@
+from msquared.Logger import Logger
+from msquared.Compilers import BaseCompiler
+from typing import Dict, List
+import subprocess
+import tempfile
+import shutil
+import json
+import os
+
+# Finds out which of a compiler's alternative linkers work, by linking a trivial program with each of them.
+# Probing runs the compiler several times, so results are persisted, keyed by the compiler and linker executables.
+# When any of them is installed, removed or updated, the compiler is probed again.
+class ToolchainProbe(object):
+    VERSION = 1
+    PROGRAM = "int main() { return 0; }\n"
+
+    def __init__(self, path: str, logger: Logger, enabled=True):
+        """
+        Probes toolchains and caches the results across runs.
+
+        Args:
+            path (str): The path of the cache file. This is normally inside the build directory.
+            logger (Logger): The logger to use.
+
+        Optional Args:
+            enabled (bool): Whether to read from and write to disk at all.
+        """
+        self.path = path
+        self.logger = logger
+        self.enabled = enabled
+        self.entries: Dict[str, Dict] = {}
+        self.loaded = False
+        self.probes = 0
+
+    def set_path(self, path: str) -> None:
+        if path != self.path:
+            self.path = path
+            self.loaded = False
+            self.entries = {}
+
+    def _load(self) -> None:
+        self.loaded = True
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as cache_file:
+                contents = json.load(cache_file)
+        except (OSError, ValueError) as err:
+            self.logger.warning(f"Could not read toolchain cache {self.path} ({err}). Ignoring it.")
+            return
+        if contents.get("version") != ToolchainProbe.VERSION:
+            self.logger.debug("Toolchain cache %s has an incompatible version. Ignoring it.", self.path)
+            return
+        self.entries = contents.get("entries", {})
+
+    def _save(self) -> None:
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump({"version": ToolchainProbe.VERSION, "entries": self.entries}, cache_file, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    # Identifies an executable by its location, modification time and size, or None if it is not installed.
+    @staticmethod
+    def _identify(executables: List[str]) -> List:
+        for executable in executables:
+            path = shutil.which(executable)
+            if path:
+                stat = os.stat(path)
+                return [path, stat.st_mtime_ns, stat.st_size]
+        return None
+
+    # Everything that can change the results of probing a compiler.
+    @staticmethod
+    def _key(compiler: BaseCompiler) -> List:
+        linkers = {linker: ToolchainProbe._identify([f"ld.{linker}", linker]) for linker in sorted(compiler.linkers)}
+        return [ToolchainProbe._identify([compiler.name]), compiler.linker_flag, linkers]
+
+    def _links(self, compiler: BaseCompiler, linker: str) -> bool:
+        self.probes += 1
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            command = [compiler.name, "-x", "c++", "-", "-o", os.path.join(tmp_dir, "probe"), f"{compiler.linker_flag}{linker}"]
+            try:
+                result = subprocess.run(command, input=ToolchainProbe.PROGRAM.encode(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError:
+                return False
+        return result.returncode == 0
+
+    def working_linkers(self, compiler: BaseCompiler) -> List[str]:
+        """
+        Finds the alternative linkers of a compiler that work.
+
+        Args:
+            compiler (BaseCompiler): The compiler to probe.
+
+        Returns:
+            List[str]: The linkers from compiler.linkers that can link a program with this compiler, in order of preference.
+        """
+        if not self.loaded:
+            self._load()
+        key = ToolchainProbe._key(compiler)
+        entry = self.entries.get(compiler.name)
+        if entry is None or entry["key"] != json.loads(json.dumps(key)):
+            # Linkers that are not installed cannot work, so they are not probed.
+            working = [linker for linker in compiler.linkers if key[2][linker] and self._links(compiler, linker)]
+            entry = {"key": key, "linkers": working}
+            self.entries[compiler.name] = entry
+            self._save()
+            self.logger.debug("Probed linkers for %s: %s work", compiler.name, working)
+        return [linker for linker in compiler.linkers if linker in entry["linkers"]]
+
+    def configure(self, compiler: BaseCompiler) -> BaseCompiler:
+        """
+        Selects the linker of a compiler profile whose linker is "auto".
+
+        Args:
+            compiler (BaseCompiler): The compiler profile.
+
+        Returns:
+            BaseCompiler: The compiler, if it does not need to be probed, and otherwise a copy using the first working linker, or the default linker if none of them work.
+        """
+        if compiler.linker != "auto":
+            return compiler
+        working = self.working_linkers(compiler) if compiler.linker_flag else []
+        linker = working[0] if working else ""
+        self.logger.debug("Using %s linker for %s", linker if linker else "the default", compiler.name)
+        return compiler.configure(linker=linker)
@@ -0,0 +1,52 @@
+from msquared import utils
+from typing import Set
+import os
+
+# A build variant, like release or debug. Every target is built once for each variant selected in MGen,
+# with the variant's flags overlaid on the target's flags. Each variant has its own object directory,
+# and adds a suffix to the names of targets, so variants can be built side by side.
+class Variant(object):
+    def __init__(self, name: str, suffix: str="", cflags=set(), lflags=set(), remove_flags=set(), debug=False, obj_dir=""):
+        """
+        Describes a build variant.
+
+        Args:
+            name (str): The name of the variant. This is also the name of the target that builds every target in this variant.
+
+        Optional Args:
+            suffix (str): Added to target names, before the extension, e.g. libfoo_debug.so.
+            cflags (Set[str]): Compiler flags to add to every target.
+            lflags (Set[str]): Linker flags to add to every target.
+            remove_flags (Set[str]): Flags to remove from every target before adding cflags and lflags, e.g. conflicting optimization levels.
+            debug (bool): Whether to add the compiler's debug flags. See BaseCompiler.split_debug.
+            obj_dir (str): The name of the directory in the build directory for intermediate build artifacts. Defaults to objs_<name>.
+        """
+        self.name = name
+        self.suffix = suffix
+        self.cflags = utils.convert_to_set(cflags)
+        self.lflags = utils.convert_to_set(lflags)
+        self.remove_flags = utils.convert_to_set(remove_flags)
+        self.debug = debug
+        self.obj_dir = obj_dir if obj_dir else f"objs_{name}"
+
+    def target_name(self, name: str) -> str:
+        if not self.suffix:
+            return name
+        name, ext = os.path.splitext(name)
+        return f"{name}{self.suffix}{ext}"
+
+    def apply_cflags(self, cflags: Set[str], compiler) -> Set[str]:
+        return (cflags - self.remove_flags) | self.cflags | (compiler.debug_cflags() if self.debug else set())
+
+    def apply_lflags(self, lflags: Set[str], compiler) -> Set[str]:
+        return (lflags - self.remove_flags) | self.lflags | (compiler.debug_lflags() if self.debug else set())
+
+    def __repr__(self):
+        return f"Variant({self.name})"
+
+OPTIMIZATION_FLAGS = set(["-O0", "-O1", "-O2", "-O3", "-Os", "-Ofast", "-Og"])
+
+RELEASE = Variant("release", obj_dir="objs")
+DEBUG = Variant("debug", suffix="_debug", debug=True, obj_dir="dobjs")
+RELWITHDEBINFO = Variant("relwithdebinfo", suffix="_relwithdebinfo", cflags=set(["-O2"]), remove_flags=OPTIMIZATION_FLAGS, debug=True)
+ASAN = Variant("asan", suffix="_asan", cflags=set(["-fsanitize=address", "-fno-omit-frame-pointer"]), lflags=set(["-fsanitize=address"]), debug=True)
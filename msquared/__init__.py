@@ -1,5 +1,15 @@
 from msquared.MGen import add_prefix, add_suffix, wrap, MGen
+from msquared.Target import Target, MakefileTarget
 from msquared.Logger import Logger
+from msquared.IncludeLexer import IncludeLexer
+from msquared.IncludeGraph import IncludeGraph
+from msquared.PathResolver import PathResolver
+from msquared.ObjectCache import ObjectCache
+from msquared.BuildTimer import BuildTimer
+from msquared.Profiler import Profiler
+from msquared.RebuildImpact import RebuildImpact
+from msquared.Executor import Executor, BuildStep
+from msquared.Variant import Variant, RELEASE, DEBUG, RELWITHDEBINFO, ASAN
 from msquared.Compilers import *
 
 __version__ = "0.1.1"
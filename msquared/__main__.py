@@ -0,0 +1,27 @@
+"""
+Command line tools for projects built with msquared.
+
+Usage:
+    python3 -m msquared <command> [options]
+
+Commands:
+    impact: Reports which headers cause the most expensive incremental rebuilds. See RebuildImpact.
+    affected: Lists the targets that must be rebuilt after some files change.
+"""
+from msquared.RebuildImpact import main as impact_main, affected_main
+import sys
+
+COMMANDS = {
+    "impact": impact_main,
+    "affected": affected_main,
+}
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(__doc__.strip())
+        return 0 if argv and argv[0] in ["-h", "--help"] else 2
+    return COMMANDS[argv[0]](argv[1:])
+
+if __name__ == "__main__":
+    sys.exit(main())
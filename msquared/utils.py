@@ -1,7 +1,7 @@
 """
 Utility functions.
 """
-from typing import Set
+from typing import Iterable, Set
 import os
 
 # Prepends a string with a prefix only if the string does not already have that prefix.
@@ -34,6 +34,58 @@ def requires_root(dirname: str) -> bool:
         dirname = os.path.abspath(os.path.join(dirname, os.pardir))
     return not os.access(dirname, os.W_OK)
 
+# Writes a file only if its contents would change. The file is written to a temporary file first, and then
+# renamed, so readers never see a partially written file. Returns whether the file was written.
+def write_if_changed(filename: str, contents: str) -> bool:
+    if os.path.isfile(filename):
+        with open(filename, "r") as existing:
+            if existing.read() == contents:
+                return False
+    tmp_filename = f"{filename}.tmp{os.getpid()}"
+    with open(tmp_filename, "w") as outf:
+        outf.write(contents)
+    os.replace(tmp_filename, filename)
+    return True
+
+# Compares two files in blocks, so that neither needs to be read into memory.
+def files_equal(filename: str, other_filename: str, block_size: int = 1 << 20) -> bool:
+    if os.path.getsize(filename) != os.path.getsize(other_filename):
+        return False
+    with open(filename, "rb") as file, open(other_filename, "rb") as other_file:
+        while True:
+            block = file.read(block_size)
+            if block != other_file.read(block_size):
+                return False
+            if not block:
+                return True
+
+# Like write_if_changed, but writes strings as they are produced, so the full contents are never held in memory.
+# The temporary file is always written, and is then compared against the existing file.
+def write_chunks_if_changed(filename: str, chunks: Iterable[str]) -> bool:
+    tmp_filename = f"{filename}.tmp{os.getpid()}"
+    try:
+        with open(tmp_filename, "w", buffering=1 << 20) as outf:
+            outf.writelines(chunks)
+        if os.path.isfile(filename) and files_equal(tmp_filename, filename):
+            os.remove(tmp_filename)
+            return False
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    os.replace(tmp_filename, filename)
+    return True
+
+# Reads the dependencies of a target from a dependency file written by a compiler, i.e. everything after the first colon
+# up to the end of the first rule. Returns None if the file does not exist yet.
+def read_depfile(depfile: str) -> Set[str]:
+    if not depfile or not os.path.isfile(depfile):
+        return None
+    with open(depfile, "r") as file:
+        contents = file.read().replace("\\\n", " ")
+    rule = contents.split("\n", 1)[0]
+    return set(rule.split(":", 1)[1].split()) if ":" in rule else set()
+
 # Joins elements of an iterable with a prefix.
 def prefix_join(iterable, prefix = ' ') -> str:
     if len(iterable) > 0:
@@ -83,7 +135,7 @@ def locate_paths(paths: Set[str], dirs: Set[str], logger, ErrorType: type = None
             # Project directories are guaranteed to be absolute paths.
             abspath = os.path.abspath(os.path.join(dir, path))
             if os.path.exists(abspath):
-                logger.debug(f"Found {path} in {dir}. Using absolute path: {abspath}")
+                logger.debug("Found %s in %s. Using absolute path: %s", path, dir, abspath)
                 return abspath
         err_msg = f"Could not find {path} in directories: {dirs}."
         logger.error(err_msg, ErrorType)
@@ -94,7 +146,7 @@ def locate_paths(paths: Set[str], dirs: Set[str], logger, ErrorType: type = None
     notfound = set()
     for path in paths:
         if os.path.exists(path) and os.path.isabs(path):
-            logger.debug(f"{path} is already absolute.")
+            logger.debug("%s is already absolute.", path)
             abspaths.add(path)
         else:
             abspath = check_dirs(path)
@@ -0,0 +1,3 @@
+#pragma once
+#include "a.hpp"
+#include "c.hpp"
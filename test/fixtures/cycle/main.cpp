@@ -0,0 +1,5 @@
+#include "a.hpp"
+
+int main() {
+    return 0;
+}
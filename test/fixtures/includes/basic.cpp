@@ -0,0 +1,10 @@
+#include <vector>
+#include "basic.hpp"
+#  include "spaced.hpp"
+# include <spaced_system.hpp>
+	#	include	"tabbed.hpp"
+#include"nospace.hpp"
+
+int main() {
+    return 0;
+}
@@ -0,0 +1,15 @@
+#include "real.hpp"
+// #include "line_comment.hpp"
+//#include "line_comment_nospace.hpp"
+/* #include "block_comment.hpp" */
+/*
+#include "multiline_comment.hpp"
+*/
+/* leading comment */ #include "after_comment.hpp"
+#include "trailing_comment.hpp" // #include "in_trailing_comment.hpp"
+// A line comment continued onto the next line \
+#include "continued_comment.hpp"
+
+int value = 1; /* a comment that
+#include "code_comment.hpp"
+ends here */
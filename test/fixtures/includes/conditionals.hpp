@@ -0,0 +1,30 @@
+#pragma once
+#if 0
+#include "dead.hpp"
+#if defined(NESTED)
+#include "dead_nested.hpp"
+#endif
+#else
+#include "live_else.hpp"
+#endif
+
+#if 1
+#include "live_if.hpp"
+#elif defined(OTHER)
+#include "dead_elif.hpp"
+#else
+#include "dead_else.hpp"
+#endif
+
+#ifdef FEATURE
+#include "maybe.hpp"
+#elif 0
+#include "dead_elif_zero.hpp"
+#else
+#include "maybe_else.hpp"
+#endif
+
+#if 0
+#elif 1
+#include "live_elif.hpp"
+#endif
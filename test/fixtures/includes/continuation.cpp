@@ -0,0 +1,5 @@
+#include \
+    "continued.hpp"
+#define MACRO(x) \
+    x
+#include "after_macro.hpp"
@@ -0,0 +1,16 @@
+#ifndef PREAMBLE_HPP
+#define PREAMBLE_HPP
+// Comments and blank lines are part of the preamble.
+
+#include "first.hpp"
+#if 0
+int dead_code;
+#endif
+#include "second.hpp"
+
+namespace preamble {
+    int value();
+}
+
+#include "late.hpp"
+#endif
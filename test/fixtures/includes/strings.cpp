@@ -0,0 +1,9 @@
+#include "strings.hpp"
+
+const char* fake = "#include <fake.hpp>";
+const char* escaped = "\"#include \"escaped.hpp\"";
+const char* raw = R"delim(
+#include "raw.hpp"
+)delim";
+const char quote = '"';
+#include "after_strings.hpp"
@@ -0,0 +1,8 @@
+import msquared as m2
+
+mgen = m2.MGen(project_include_dirs="../greet/include")
+mgen.include_subproject("../greet/build.py")
+mgen.add_executable("app", sources="src/main.cpp", libraries="libgreet.so")
+
+if __name__ == "__main__":
+    mgen.write()
@@ -0,0 +1,7 @@
+#include "greet.hpp"
+#include <iostream>
+
+int main() {
+    std::cout << greet("app") << std::endl;
+    return 0;
+}
@@ -0,0 +1,5 @@
+import msquared as m2
+
+mgen = m2.MGen(project_include_dirs="include")
+mgen.add_library("libgreet.so", sources="src/greet.cpp")
+mgen.write()
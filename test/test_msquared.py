@@ -1,8 +1,14 @@
 #!/usr/bin/python3
 import msquared as m2
+from msquared.HeaderManager import HeaderManager
+from msquared.ScanCache import ScanCache
 import unittest
 import subprocess
+import tempfile
 import shutil
+import glob
+import json
+import sys
 import os
 
 class MSquaredTest(unittest.TestCase):
@@ -52,14 +58,569 @@ class MSquaredTest(unittest.TestCase):
         self.assertTrue(status == 0)
         self.assertFalse(os.path.exists(os.path.join(self.install_directory, filename)))
 
+    def test_scan_cache_reused(self):
+        self.mgen.write(self.makefile_path)
+        mgen = m2.MGen("./", project_include_dirs="./include")
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        stats = mgen.scan_cache.stats()
+        self.assertEqual(stats["misses"], 0)
+        self.assertGreater(stats["hits"], 0)
+
+    def test_parallel_scan_matches_serial(self):
+        self.mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        mgen = m2.MGen("./", project_include_dirs="./include", jobs=4)
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"), libraries="pthread", install_directory=self.install_directory)
+        mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        self.assertEqual(self.mgen.generate(), mgen.generate())
+
+    def test_ninja_backend(self):
+        self.mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        build_ninja = self.mgen.generate(backend="ninja")
+        self.assertEqual(build_ninja, self.mgen.generate(backend="ninja"))
+        for phony in ["all", "release", "debug", "install", "uninstall", "clean", "help"]:
+            self.assertIn(f"build {phony}: ", build_ninja)
+        self.assertIn("deps = gcc", build_ninja)
+        self.assertIn("pool = link_pool", build_ninja)
+        self.assertRaises(ValueError, self.mgen.generate, backend="scons")
+
+    @unittest.skipIf(not shutil.which("ninja"), "ninja is not installed")
+    def test_ninja_builds(self):
+        self.mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        ninja_path = os.path.join(self.mgen.root_dir, "build.ninja")
+        self.mgen.write_ninja(ninja_path)
+        status = subprocess.call(["ninja", "-f", ninja_path, "release"], cwd=self.mgen.root_dir)
+        self.assertTrue(status == 0)
+        self.assertTrue(os.path.exists(os.path.join(self.mgen.build_dir, "test")))
+
+    def test_compiler_dependencies(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_depfiles", compiler_dependencies=True)
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        # Nothing should have been scanned.
+        self.assertEqual(len(mgen.header_manager.graph), 0)
+        makefile = mgen.generate()
+        self.assertIn("-MP -MMD -MF", makefile)
+        self.assertIn("-include ", makefile)
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.depfiles")
+        mgen.write(makefile_path)
+        self.assertEqual(subprocess.call(["make", "-j8", "-f", makefile_path, "release"]), 0)
+        target = mgen.release_targets[0]
+        object_path = target.generate_object_path(os.path.join(mgen.root_dir, "src", "factorial.cpp"))
+        depfile = m2.Target.depfile_path(object_path)
+        self.assertTrue(os.path.exists(depfile))
+        self.assertEqual(subprocess.call(["make", "-q", "-f", makefile_path, object_path]), 0)
+        # Headers found by the compiler should now cause rebuilds.
+        os.utime(os.path.join(mgen.root_dir, "include", "utils.hpp"))
+        self.assertNotEqual(subprocess.call(["make", "-q", "-f", makefile_path, object_path]), 0)
+
+    def test_write_if_changed(self):
+        self.mgen.write(self.makefile_path)
+        mtime = os.stat(self.makefile_path).st_mtime_ns
+        self.assertFalse(self.mgen.write(self.makefile_path))
+        self.assertEqual(os.stat(self.makefile_path).st_mtime_ns, mtime)
+        self.mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        self.assertTrue(self.mgen.write(self.makefile_path))
+
+    def test_write_matches_generate(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_depfiles", compiler_dependencies=True)
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.depfiles")
+        mgen.write(makefile_path, regenerate=True)
+        with open(makefile_path) as makefile:
+            self.assertEqual(makefile.read(), mgen.generate(regenerate=True))
+        self.assertFalse(mgen.write(makefile_path, regenerate=True))
+
+    def test_compact_makefile(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_compact")
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        makefile = mgen.generate(compact=True)
+        self.assertLess(len(makefile), len(mgen.generate()))
+        # Release and debug share a recipe per variant, and a dependency list per source.
+        self.assertEqual(makefile.count("define msquared_compile_"), 2)
+        self.assertEqual(makefile.count(" := "), 3)
+        shutil.rmtree(mgen.build_dir, ignore_errors=True)
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.compact")
+        mgen.write(makefile_path, compact=True)
+        self.assertEqual(subprocess.call(["make", "-j4", "-f", makefile_path]), 0)
+        self.assertEqual(subprocess.call(["make", "-q", "-f", makefile_path]), 0)
+        os.utime(os.path.join(mgen.root_dir, "include", "utils.hpp"))
+        self.assertNotEqual(subprocess.call(["make", "-q", "-f", makefile_path]), 0)
+
+    def test_rebuild_impact(self):
+        self.mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        utils_hpp = os.path.join(self.mgen.root_dir, "include", "utils.hpp")
+        analysis = self.mgen.rebuild_impact(count=0, variant="release")
+        self.assertEqual(analysis["unit"], "bytes")
+        self.assertEqual(analysis["headers"][0]["header"], utils_hpp)
+        self.assertEqual((analysis["headers"][0]["objects"], analysis["headers"][0]["targets"]), (3, 2))
+        self.assertEqual(analysis["headers"][0]["chain"][-1], utils_hpp)
+        costs = [entry["cost"] for entry in analysis["headers"]]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+        # The manifest and the rebuild-impact target are only generated when requested.
+        self.mgen.write(self.makefile_path)
+        manifest_path = os.path.join(self.mgen.build_dir, ".msquared", "graph.json")
+        self.assertFalse(os.path.exists(manifest_path))
+        makefile = self.mgen.generate()
+        self.assertNotIn("rebuild-impact", makefile)
+        self.assertNotIn("affected", makefile)
+        # The same analysis should be available from the manifest written along with the Makefile.
+        self.mgen.graph_analysis = True
+        self.mgen.write(self.makefile_path)
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(m2.__file__))))
+        output = subprocess.check_output([sys.executable, "-m", "msquared", "impact", "--manifest", manifest_path, "--variant", "release", "--count", "0", "--json"], env=env)
+        self.assertEqual(json.loads(output), json.loads(json.dumps(analysis)))
+        report = subprocess.check_output(["make", "-s", "-f", self.makefile_path, "rebuild-impact"], env=env).decode()
+        self.assertIn(utils_hpp, report)
+
+    def test_affected(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_affected", graph_analysis=True)
+        lib, lib_debug = mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        exe, exe_debug = mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        affected = mgen.affected(["src/factorial.cpp"])
+        self.assertEqual(len(affected["objects"]), 2)
+        self.assertEqual(affected["libraries"], sorted([lib.path, lib_debug.path]))
+        # Executables are relinked when a library they link is.
+        self.assertEqual(affected["executables"], sorted([exe.path, exe_debug.path]))
+        affected = mgen.affected([os.path.join(mgen.root_dir, "include", "fibonacci.hpp")], variant="release")
+        self.assertEqual(len(affected["objects"]), 2)
+        self.assertEqual((affected["libraries"], affected["executables"]), ([lib.path], [exe.path]))
+        self.assertEqual(mgen.affected(["README.md"]), {"objects": [], "libraries": [], "executables": []})
+        shutil.rmtree(mgen.build_dir, ignore_errors=True)
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.affected")
+        mgen.write(makefile_path)
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(m2.__file__))))
+        self.assertEqual(subprocess.call(["make", "-f", makefile_path, "affected", "FILES=test/test.cpp", "VARIANT=release"], cwd=mgen.root_dir, env=env), 0)
+        self.assertTrue(os.path.exists(exe.path))
+        self.assertFalse(os.path.exists(exe_debug.path))
+
+    def test_build(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_executor", variants=[m2.RELEASE])
+        shutil.rmtree(mgen.build_dir, ignore_errors=True)
+        lib, = mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        exe, = mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        self.assertRaises(ValueError, mgen.build, targets="fake")
+        self.assertTrue(mgen.build(jobs=4))
+        self.assertEqual(subprocess.call([exe.path]), 0)
+        self.assertEqual(mgen.stats()["counters"]["steps_built"], 5)
+        # Nothing is rebuilt until an input changes, and then only the steps that depend on it.
+        self.assertTrue(mgen.build(jobs=4))
+        self.assertEqual(mgen.stats()["counters"]["steps_built"], 0)
+        os.utime(os.path.join(mgen.root_dir, "test", "test.cpp"))
+        self.assertTrue(mgen.build(jobs=4, targets="test"))
+        self.assertEqual(mgen.stats()["counters"]["steps_built"], 2)
+        # Compiles are started before the links that wait for them.
+        executor = m2.Executor(mgen._build_steps(), logger=mgen.logger, timing_log=mgen._timing_log_path())
+        priorities = executor.priorities([exe.path])
+        self.assertGreater(min(priorities[output] for output in executor.steps[lib.path].inputs), priorities[lib.path])
+        self.assertGreater(priorities[lib.path], priorities[exe.path])
+
+    def test_toolchain_profile(self):
+        compiler = m2.GCC.configure(linker="auto", split_debug=True)
+        self.assertRaises(ValueError, m2.GCC.configure, fake=True)
+        build_dir = os.path.join(self.mgen.root_dir, "build_toolchain")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_toolchain", compiler=compiler)
+        exe, exe_debug = mgen.add_executable("test", sources=["test/test.cpp", "src/factorial.cpp", "src/fibonacci.cpp"], libraries="pthread")
+        working = mgen.toolchain_probe.working_linkers(compiler)
+        linker = working[0] if working else ""
+        self.assertEqual(exe.compiler.linker, linker)
+        self.assertIn("-gsplit-dwarf", exe_debug.cflags)
+        self.assertNotIn("-gsplit-dwarf", exe.cflags)
+        if linker:
+            self.assertIn(f"-fuse-ld={linker}", exe.link_flags())
+            self.assertIn("-Wl,--gdb-index", exe_debug.link_flags())
+        # Probe results are reused by later runs.
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_toolchain", compiler=compiler)
+        mgen.add_executable("test", sources=["test/test.cpp", "src/factorial.cpp", "src/fibonacci.cpp"], libraries="pthread")
+        self.assertEqual(mgen.toolchain_probe.probes, 0)
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.toolchain")
+        mgen.write(makefile_path)
+        self.assertEqual(subprocess.call(["make", "-j4", "-f", makefile_path], cwd=mgen.root_dir), 0)
+        self.assertEqual(subprocess.call([exe_debug.path]), 0)
+
+    def test_subprojects(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_subprojects", variants=[m2.RELEASE])
+        shutil.rmtree(mgen.build_dir, ignore_errors=True)
+        exe, = mgen.add_executable("test", sources=["test/test.cpp", "src/factorial.cpp", "src/fibonacci.cpp"], libraries=["libgreet.so"])
+        mgen.include_subproject("fixtures/subprojects/app/build.py")
+        mgen.include_subproject("fixtures/subprojects/greet/build.py")
+        # Subprojects are only loaded when their targets are needed.
+        self.assertEqual(len(mgen.release_targets), 1)
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.subprojects")
+        mgen.write(makefile_path)
+        self.assertEqual(sorted(target.name for target in mgen.release_targets), ["app", "libgreet.so", "test"])
+        subproject_dir = os.path.join(mgen.root_dir, "fixtures", "subprojects")
+        self.assertFalse(any(os.path.exists(os.path.join(subproject_dir, name, "Makefile")) for name in ["app", "greet"]))
+        # Projects with the same include directories share a header manager, and all of them share the root project's caches.
+        self.assertEqual(len(mgen.header_managers), 2)
+        self.assertIn(os.path.join(subproject_dir, "greet", "include", "greet.hpp"), mgen.graph_manifest()["files"])
+        self.assertTrue(os.path.exists(os.path.join(mgen.build_dir, ".msquared", "scan_cache.json")))
+        self.assertEqual(subprocess.call(["make", "-j4", "-f", makefile_path], cwd=mgen.root_dir), 0)
+        app = [target for target in mgen.release_targets if target.name == "app"][0]
+        self.assertTrue(app.path.startswith(mgen.build_dir))
+        self.assertEqual(subprocess.check_output([app.path]).decode().strip(), "Hello, app!")
+        self.assertEqual(subprocess.call([exe.path]), 0)
+        # Headers of subproject targets are resolved with the subproject's include directories, not the root project's.
+        greet_header = os.path.join(subproject_dir, "greet", "include", "greet.hpp")
+        self.assertEqual(mgen.add_precompiled_header("greet.hpp", targets=[app]), greet_header)
+        self.assertIn(greet_header, app.precompiled_headers)
+        self.assertNotIn(greet_header, mgen.header_manager.graph)
+
+    def test_regenerate_rule(self):
+        makefile = self.mgen.generate(regenerate=True)
+        self.assertIn("MSQUARED_MAKEFILE := $(lastword $(MAKEFILE_LIST))", makefile)
+        rule = makefile[makefile.index("$(MSQUARED_MAKEFILE):"):].split("\n")[0]
+        self.assertIn(os.path.abspath(__file__), rule)
+        self.assertIn(os.path.join(self.mgen.root_dir, "src", "factorial.cpp"), rule)
+        self.assertIn(os.path.join(self.mgen.root_dir, "include", "utils.hpp"), rule)
+        self.assertNotIn("MSQUARED_MAKEFILE", self.mgen.generate())
+
+    def test_generation_deterministic(self):
+        script = ";".join([
+            "import msquared as m2",
+            "mgen = m2.MGen('./', project_include_dirs=['./include', './fixtures/cycle'], cflags=['-O2', '-Wall', '-DA=1', '-DB'])",
+            "mgen.add_library('libtest.so', sources=m2.wrap('src/', ['factorial', 'fibonacci'], '.cpp'))",
+            "mgen.add_executable('test', sources='test/test.cpp', libraries=['libtest.so', 'pthread', 'm'])",
+            "print(mgen.generate())",
+        ])
+        outputs = []
+        for seed in ["1", "2"]:
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=os.path.dirname(os.path.dirname(m2.__file__)))
+            output = subprocess.check_output([sys.executable, "-c", script], cwd=self.mgen.root_dir, env=env).decode()
+            # Skip the log output.
+            outputs.append(output[output.index("# Automatically generated"):])
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_object_names_unique(self):
+        target = self.mgen.release_targets[0]
+        paths = [target.generate_object_path(os.path.join(self.mgen.root_dir, source)) for source in ["src/utils.cpp", "test/utils.cpp"]]
+        self.assertNotEqual(paths[0], paths[1])
+        readable_paths = [target.generate_object_path(os.path.join(self.mgen.root_dir, source), True) for source in ["src/utils.cpp", "test/utils.cpp"]]
+        self.assertNotEqual(readable_paths[0], readable_paths[1])
+
+    def test_precompiled_header(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_pch")
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        utils_header = os.path.join(mgen.root_dir, "include", "utils.hpp")
+        # utils.hpp is the only header included by both sources.
+        self.assertEqual([candidate[0] for candidate in mgen.suggest_precompiled_headers()], [utils_header])
+        self.assertEqual(mgen.add_precompiled_header(), utils_header)
+        release, debug = mgen.release_targets[0], mgen.debug_targets[0]
+        self.assertNotEqual(release.precompiled_header_path(utils_header), debug.precompiled_header_path(utils_header))
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.pch")
+        mgen.write(makefile_path)
+        self.assertIn(f"-include {os.path.splitext(release.precompiled_header_path(utils_header))[0]}", mgen.generate())
+        self.assertEqual(subprocess.call(["make", "-j8", "-f", makefile_path]), 0)
+        for target in [release, debug]:
+            self.assertTrue(os.path.exists(target.precompiled_header_path(utils_header)))
+        # Objects should be rebuilt when the precompiled header changes.
+        object_path = release.generate_object_path(os.path.join(mgen.root_dir, "src", "factorial.cpp"))
+        os.utime(release.precompiled_header_path(utils_header))
+        self.assertNotEqual(subprocess.call(["make", "-q", "-f", makefile_path, object_path]), 0)
+
+    def test_unity_build(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_unity", unity=True, unity_batch_size=2)
+        sources = m2.wrap("src/", ["factorial", "fibonacci"], ".cpp")
+        target, _ = mgen.add_library(self.libname, sources=sources)
+        excluded, _ = mgen.add_library("libexcluded.so", sources=sources, unity_exclude="src/fibonacci.cpp")
+        batches = target.unity_batches()
+        self.assertEqual(list(batches.values()), [sorted(os.path.join(mgen.root_dir, source) for source in sources)])
+        self.assertEqual(excluded.unity_batches(), {})
+        unity_source = list(batches.keys())[0]
+        # The unity source depends on its members and all of their headers.
+        self.assertEqual(target.compile_units()[unity_source], set(batches[unity_source]) | set(os.path.join(mgen.root_dir, "include", header) for header in ["factorial.hpp", "fibonacci.hpp", "utils.hpp"]))
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.unity")
+        mgen.write(makefile_path)
+        mtime = os.stat(unity_source).st_mtime_ns
+        mgen.write(makefile_path)
+        self.assertEqual(os.stat(unity_source).st_mtime_ns, mtime)
+        self.assertEqual(subprocess.call(["make", "-j8", "-f", makefile_path, "release"]), 0)
+        self.assertTrue(os.path.exists(target.generate_object_path(unity_source)))
+
+    def test_object_cache_shared(self):
+        cache_dir = os.path.join(self.mgen.root_dir, "build_cache", "objects")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        builds = []
+        for build_dir in ["build_cache/first", "build_cache/second"]:
+            mgen = m2.MGen("./", project_include_dirs="./include", build_dir=build_dir, object_cache=cache_dir)
+            mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+            makefile_path = os.path.join(mgen.root_dir, f"Makefile.{os.path.basename(build_dir)}")
+            mgen.write(makefile_path)
+            shutil.rmtree(os.path.join(mgen.build_dir, "objs"), ignore_errors=True)
+            self.assertEqual(subprocess.call(["make", "-j8", "-f", makefile_path, "release"]), 0)
+            builds.append(m2.ObjectCache(cache_dir).stats())
+        # The second build directory should reuse every object from the first.
+        self.assertEqual(builds[0]["hits"], 0)
+        self.assertEqual(builds[0]["entries"], 2)
+        self.assertEqual(builds[1]["hits"], 2)
+        self.assertEqual(subprocess.call(["make", "-f", makefile_path, "cache-stats"]), 0)
+
+    def test_object_cache_eviction(self):
+        cache_dir = os.path.join(self.mgen.root_dir, "build_cache", "eviction")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        cache = m2.ObjectCache(cache_dir, max_size=200)
+        obj = os.path.join(cache_dir, "obj.o")
+        os.makedirs(cache_dir)
+        for index, key in enumerate(["a" * 40, "b" * 40, "c" * 40]):
+            with open(obj, "w") as f:
+                f.write(key * 2)
+            cache.store(key, obj)
+            if index == 1:
+                # Make "b" the least recently used entry.
+                os.utime(cache._entry_path(key), ns=(0, 0))
+        self.assertTrue(cache.fetch("a" * 40, obj))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["evictions"], stats["entries"]), (1, 1, 2))
+        self.assertFalse(os.path.exists(cache._entry_path("b" * 40)))
+
+    def test_object_cache_compiler_identity(self):
+        compiler_dir = os.path.join(self.mgen.root_dir, "build_cache", "compiler")
+        shutil.rmtree(compiler_dir, ignore_errors=True)
+        os.makedirs(compiler_dir)
+        compiler = os.path.join(compiler_dir, "fake-g++")
+        with open(compiler, "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(compiler, 0o755)
+        identity = m2.ObjectCache.compiler_identity(compiler)
+        self.assertTrue(identity.startswith(compiler))
+        # Upgrading the compiler changes its identity, and so the keys of objects it builds.
+        os.utime(compiler, ns=(0, 0))
+        self.assertNotEqual(m2.ObjectCache.compiler_identity(compiler), identity)
+        self.assertEqual(m2.ObjectCache.compiler_identity(os.path.join(compiler_dir, "missing")), "")
+        mgen = m2.MGen("./", project_include_dirs="./include", object_cache="build_cache/objects")
+        target = mgen.add_library(self.libname, sources="src/factorial.cpp")[0]
+        self.assertIn(" --compiler g++ ", target.cached_compile_command("g++ -c", "a.o", []))
+
+    def test_variants(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_variants", variants=[m2.RELEASE, m2.RELWITHDEBINFO, m2.ASAN], default_variants="release")
+        lib, relwithdebinfo_lib, asan_lib = mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        exe, relwithdebinfo_exe, asan_exe = mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        self.assertEqual(mgen.debug_targets, [])
+        self.assertEqual(relwithdebinfo_lib.name, "libtest_relwithdebinfo.so")
+        self.assertIn("-O2", relwithdebinfo_lib.cflags)
+        self.assertNotIn("-O3", relwithdebinfo_lib.cflags)
+        self.assertIn("-fsanitize=address", asan_exe.lflags)
+        makefile = mgen.generate()
+        self.assertNotIn("_debug", makefile)
+        self.assertIn(".PHONY: all\nall: release\n", makefile)
+        # Internal libraries are remapped to the same variant.
+        self.assertEqual(asan_exe.libraries, set(["libtest_asan.so", "pthread"]))
+        self.assertEqual(exe.libraries, set(["libtest.so", "pthread"]))
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.variants")
+        mgen.write(makefile_path)
+        self.assertEqual(subprocess.call(["make", "-j8", "-f", makefile_path]), 0)
+        self.assertTrue(os.path.exists(exe.path))
+        self.assertFalse(os.path.exists(asan_exe.path))
+        self.assertRaises(ValueError, m2.MGen, "./", variants=[m2.RELEASE], default_variants="debug")
+
+    def test_lto_modes(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_lto", variants=[m2.RELEASE], lto_mode="jobserver", lto_partition="balanced")
+        target, = mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        makefile = mgen.generate()
+        self.assertIn(f"$(AT)+g++ ", makefile)
+        self.assertIn("-flto-partition=balanced -flto=jobserver", makefile)
+        # Ninja does not provide a jobserver.
+        self.assertIn("-flto=auto", mgen.generate(backend="ninja"))
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.lto")
+        mgen.write(makefile_path)
+        self.assertEqual(subprocess.call(["make", "-j4", "-f", makefile_path]), 0)
+        # Compilers without LTO support, or targets without LTO, should link normally.
+        no_lto = m2.BaseCompiler("g++", "-c", "-shared -fPIC", "-g")
+        mgen = m2.MGen("./", project_include_dirs="./include", compiler=no_lto, lflags=["-flto"], variants=[m2.RELEASE], lto_mode="jobserver")
+        target, = mgen.add_executable("test", sources="test/test.cpp")
+        self.assertFalse(target.uses_jobserver())
+        self.assertEqual(target.link_flags(), set(["-flto"]))
+        # Parallel link time optimization is opt-in, and only the jobserver mode needs make's jobserver.
+        mgen = m2.MGen("./", project_include_dirs="./include", variants=[m2.RELEASE])
+        target, = mgen.add_executable("test", sources="test/test.cpp")
+        self.assertIn("-flto", target.link_flags())
+        self.assertNotIn("$(AT)+", mgen.generate())
+        target.lto_mode = "auto"
+        self.assertIn("-flto=auto", target.link_flags())
+        self.assertFalse(target.uses_jobserver())
+
+    def test_build_report(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", build_dir="build_report", variants=[m2.RELEASE], instrument=True)
+        lib, = mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        exe, = mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        shutil.rmtree(mgen.build_dir, ignore_errors=True)
+        makefile_path = os.path.join(mgen.root_dir, "Makefile.report")
+        mgen.write(makefile_path)
+        self.assertEqual(subprocess.call(["make", "-j4", "-f", makefile_path]), 0)
+        timer = m2.BuildTimer(lib.timing_log)
+        records = timer.records()
+        self.assertEqual(sorted(record["kind"] for record in records.values()), ["compile", "compile", "compile", "link", "link"])
+        # The executable cannot be linked before the library.
+        self.assertIn(lib.path, records[exe.path]["inputs"])
+        total, path = m2.BuildTimer.critical_path(records)
+        self.assertEqual((path[0]["kind"], path[-1]["output"]), ("compile", exe.path))
+        self.assertAlmostEqual(total, sum(record["duration"] for record in path))
+        report = subprocess.check_output(["make", "-s", "-f", makefile_path, "build-report"]).decode()
+        self.assertIn("Critical path", report)
+        with open(os.path.join(mgen.build_dir, ".msquared", "build_trace.json")) as trace:
+            self.assertEqual(len(json.load(trace)["traceEvents"]), 5)
+
+    def test_generation_stats(self):
+        mgen = m2.MGen("./", project_include_dirs="./include", variants=[m2.RELEASE])
+        mgen.add_library(self.libname, sources=m2.wrap("src/", ["factorial", "fibonacci"], ".cpp"))
+        mgen.add_executable("test", sources="test/test.cpp", libraries=["libtest.so", "pthread"])
+        makefile = mgen.generate()
+        stats = mgen.stats()
+        for phase in ["resolve_sources", "scan", "prepare", "render", "format"]:
+            self.assertIn(phase, stats["phases"])
+        counters = stats["counters"]
+        # Every file is either read or found in the scan cache from an earlier run.
+        self.assertEqual(counters["files_scanned"] + counters["scan_cache_hits"], counters["files_in_include_graph"])
+        self.assertEqual(counters["output_bytes"], len(makefile))
+        self.assertEqual(counters["targets"], 2)
+        self.assertIn("Generation statistics", mgen.profiler.report(stats))
+
+    # Tests generate Makefiles, build.ninja and build directories, like build_lto, in the test directory.
     def tearDown(self):
-        pass
-        # if os.path.exists(self.mgen.build_dir):
-        #     shutil.rmtree(f"{self.mgen.build_dir}")
-        # if os.path.exists(self.install_directory):
-        #     shutil.rmtree(f"{self.install_directory}")
-        # if os.path.exists(self.makefile_path):
-        #     os.remove(self.makefile_path)
+        for path in glob.glob(os.path.join(self.mgen.root_dir, "build*")) + glob.glob(os.path.join(self.mgen.root_dir, "Makefile*")):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        if os.path.exists(self.install_directory):
+            shutil.rmtree(self.install_directory)
+
+class IncludeLexerTest(unittest.TestCase):
+    def setUp(self):
+        self.corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "includes")
+        with open(os.path.join(self.corpus_dir, "expected.json")) as expected_file:
+            self.expected = json.load(expected_file)
+
+    def check_corpus(self, lexer, mode):
+        for name, includes in self.expected.items():
+            with self.subTest(name=name):
+                found, _, _ = lexer.scan_file(os.path.join(self.corpus_dir, name))
+                self.assertEqual(found, set(includes[mode]))
+
+    def test_corpus(self):
+        self.check_corpus(m2.IncludeLexer(), "full")
+
+    def test_corpus_preamble(self):
+        self.check_corpus(m2.IncludeLexer(stop_after_preamble=True), "preamble")
+
+    def test_preamble_stops_early(self):
+        lines = ['#include "a.hpp"', "int x;", '#include "b.hpp"']
+        consumed = []
+        def read_lines():
+            for line in lines:
+                consumed.append(line)
+                yield line
+        self.assertEqual(m2.IncludeLexer(stop_after_preamble=True).scan(read_lines()), set(["a.hpp"]))
+        self.assertEqual(len(consumed), 2)
+
+class IncludeGraphTest(unittest.TestCase):
+    def test_include_cycle(self):
+        cycle_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cycle")
+        header_manager = HeaderManager(set([cycle_dir]), m2.Logger())
+        paths = {name: os.path.join(cycle_dir, name) for name in ["a.hpp", "b.hpp", "c.hpp", "main.cpp"]}
+        headers = header_manager.locate_headers(paths["main.cpp"])
+        self.assertEqual(headers, set([paths["a.hpp"], paths["b.hpp"], paths["c.hpp"]]))
+        # Headers in the same cycle share a single closure.
+        graph = header_manager.graph
+        self.assertIs(graph.transitive(paths["a.hpp"]), graph.transitive(paths["b.hpp"]))
+        self.assertEqual(graph.direct(paths["b.hpp"]), set([paths["a.hpp"], paths["c.hpp"]]))
+        self.assertEqual(graph.transitive(paths["c.hpp"]), set())
+
+    def test_deep_chain(self):
+        graph = m2.IncludeGraph()
+        depth = 2 * sys.getrecursionlimit()
+        for index in range(depth):
+            graph.add_file(f"{index}.hpp", [f"{index + 1}.hpp"] if index + 1 < depth else [])
+        self.assertEqual(len(graph.transitive("0.hpp")), depth - 1)
+
+class ScanCacheTest(unittest.TestCase):
+    # Each run uses a new HeaderManager, as a new MGen would, sharing only the on-disk cache.
+    def locate_headers(self, source, header_dirs):
+        logger = m2.Logger()
+        scan_cache = ScanCache(os.path.join(os.path.dirname(source), "scan_cache.json"), logger)
+        headers = HeaderManager(set(header_dirs), logger, scan_cache=scan_cache).locate_headers(source)
+        scan_cache.save()
+        return headers, scan_cache.stats()
+
+    def test_includes_resolved_each_run(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            header_dirs = [os.path.join(tmp_dir, "inc1"), os.path.join(tmp_dir, "inc2")]
+            for header_dir in header_dirs:
+                os.makedirs(header_dir)
+            source = os.path.join(tmp_dir, "main.cpp")
+            with open(source, "w") as source_file:
+                source_file.write('#include "foo.hpp"\n')
+            self.assertEqual(self.locate_headers(source, header_dirs)[0], set())
+            # Headers that are added or moved must be found even though the source is unchanged.
+            open(os.path.join(header_dirs[1], "foo.hpp"), "w").close()
+            headers, stats = self.locate_headers(source, header_dirs)
+            self.assertEqual(headers, set([os.path.join(header_dirs[1], "foo.hpp")]))
+            self.assertEqual(stats["misses"], 1)
+            os.rename(os.path.join(header_dirs[1], "foo.hpp"), os.path.join(header_dirs[0], "foo.hpp"))
+            self.assertEqual(self.locate_headers(source, header_dirs)[0], set([os.path.join(header_dirs[0], "foo.hpp")]))
+            os.remove(os.path.join(header_dirs[0], "foo.hpp"))
+            self.assertEqual(self.locate_headers(source, header_dirs)[0], set())
+
+class LoggerTest(unittest.TestCase):
+    def test_disabled_messages_not_formatted(self):
+        logger = m2.Logger(m2.Logger.Severity.INFO)
+        calls = []
+        logger.debug(lambda: calls.append("debug"))
+        self.assertEqual(calls, [])
+        logger = m2.Logger(m2.Logger.Severity.DEBUG, use_logging=True, name="msquared.test")
+        with self.assertLogs("msquared.test", level="DEBUG") as logs:
+            logger.debug("Found %s in %s", "utils.hpp", "include")
+            line = sys._getframe().f_lineno - 1
+        self.assertEqual(logs.records[0].getMessage(), "Found utils.hpp in include")
+        # The location should be that of the caller, not the logger.
+        self.assertEqual(logs.records[0].pathname, os.path.abspath(__file__))
+        self.assertEqual((logs.records[0].lineno, logs.records[0].funcName), (line, "test_disabled_messages_not_formatted"))
+
+    def test_error_prefix(self):
+        logger = m2.Logger()
+        with self.assertRaises(ValueError) as context:
+            logger.error("Bad value", ValueError)
+        self.assertTrue(str(context.exception).startswith(f"[{os.path.abspath(__file__)}:"))
+
+    def test_warning_error_type(self):
+        logger = m2.Logger()
+        self.assertRaises(ValueError, logger.warning, "Bad value", ValueError)
+        with self.assertRaises(ValueError) as context:
+            logger.warning("Bad value: %s", ValueError, 42)
+        self.assertTrue(str(context.exception).endswith("Bad value: 42"))
+        logger = m2.Logger(m2.Logger.Severity.DEBUG, use_logging=True, name="msquared.test")
+        with self.assertLogs("msquared.test", level="WARNING") as logs:
+            logger.warning("Missing %s", None, "utils.hpp")
+        self.assertEqual(logs.records[0].getMessage(), "Missing utils.hpp")
+
+class PathResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.dirname(os.path.abspath(__file__))
+        self.resolver = m2.PathResolver(m2.Logger())
+
+    def test_search_order(self):
+        dirs = [os.path.join(self.test_dir, "fixtures", "cycle"), os.path.join(self.test_dir, "fixtures")]
+        self.assertEqual(self.resolver.resolve("a.hpp", dirs), os.path.join(dirs[0], "a.hpp"))
+        self.assertEqual(self.resolver.resolve("cycle/a.hpp", dirs), os.path.join(dirs[1], "cycle", "a.hpp"))
+        self.assertEqual(self.resolver.resolve("./cycle/../cycle/b.hpp", list(reversed(dirs))), os.path.join(dirs[0], "b.hpp"))
+        self.assertIsNone(self.resolver.resolve("vector", dirs))
+
+    def test_no_stat_calls(self):
+        include_dir = os.path.join(self.test_dir, "include")
+        for _ in range(3):
+            found, notfound = self.resolver.locate_paths(["utils.hpp", "iostream"], set([include_dir]))
+            self.assertEqual(found, set([os.path.join(include_dir, "utils.hpp")]))
+            self.assertEqual(notfound, set(["iostream"]))
+        self.assertEqual(self.resolver.stat_calls, 0)
+        self.assertEqual(len(self.resolver.memo), 2)
+
+    def test_unindexed_lookup(self):
+        with tempfile.TemporaryDirectory() as generated_dir:
+            self.assertIsNone(self.resolver.resolve("generated.cpp", [generated_dir], indexed=False))
+            # Files created after an earlier lookup are still found, and nothing is indexed.
+            open(os.path.join(generated_dir, "generated.cpp"), "w").close()
+            self.assertEqual(self.resolver.resolve("generated.cpp", [generated_dir], indexed=False), os.path.join(generated_dir, "generated.cpp"))
+        self.assertEqual((self.resolver.index, self.resolver.memo), ({}, {}))
 
 if __name__ == '__main__':
     unittest.main()